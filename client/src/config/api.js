@@ -22,6 +22,7 @@ export const API_ENDPOINTS = {
     getQuestion: `${API_HOST}/api/get-question`,
     skipQuestion: `${API_HOST}/api/skip-question`,
     findRandomGame: `${API_HOST}/api/find-random-game`,
+    matchmakingStatus: `${API_HOST}/api/matchmaking/status`,
     getLeaderboard: `${API_HOST}/api/leaderboard`,
     getGameHistory: `${API_HOST}/api/game-history`,
 };
\ No newline at end of file
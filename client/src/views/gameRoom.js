@@ -42,6 +42,11 @@ function GameRoom() {
     const isSpectatorRef = useRef(false);
     const playersRef = useRef([]);
     const showImageOverlayRef = useRef(false);
+
+    // Versioned code sync: my last sent version and text, and each player's known code
+    const myCodeVersionRef = useRef(0);
+    const myCodeRef = useRef('');
+    const remoteCodeRef = useRef({});
     
     // Timer refs for auto-dismiss alerts
     const errorTimerRef = useRef(null);
@@ -100,7 +105,8 @@ function GameRoom() {
     useEffect(() => {
         // Initialize socket connection
         console.log('Connecting to:', SOCKET_HOST);
-        const newSocket = io(SOCKET_HOST);
+        // WebSocket only: polling needs sticky sessions behind a load balancer
+        const newSocket = io(SOCKET_HOST, { transports: ['websocket'] });
         setSocket(newSocket);
 
         // Create room if creator and no room code provided
@@ -202,6 +208,12 @@ function GameRoom() {
             
             // Set initial code states for spectators
             if (data.code) {
+                Object.entries(data.code).forEach(([uid, code]) => {
+                    remoteCodeRef.current[uid] = {
+                        code: code || '',
+                        version: (data.code_versions || {})[uid] || 0
+                    };
+                });
                 Object.entries(data.code).forEach(([uid, code]) => {
                     if (uid === data.players[0]) {
                         setMyCode(code || '# Player 1 code\n');
@@ -223,6 +235,35 @@ function GameRoom() {
             }
         });
 
+        // Coalesced game state changes, sent to spectators once per tick
+        newSocket.on('spectator_update', (data) => {
+            if (data.players) {
+                setPlayers(data.players);
+                playersRef.current = data.players;
+            }
+            if (data.health) {
+                setHealth(prevHealth => ({ ...prevHealth, ...data.health }));
+            }
+            if (data.code) {
+                Object.entries(data.code).forEach(([uid, code]) => {
+                    if (uid === playersRef.current[0]) {
+                        setMyCode(code || '');
+                    } else if (uid === playersRef.current[1]) {
+                        setOpponentCode(code || '');
+                    }
+                });
+            }
+            if (data.active_questions) {
+                Object.entries(data.active_questions).forEach(([uid, question]) => {
+                    if (uid === playersRef.current[0]) {
+                        setMyActiveQuestion(question);
+                    } else if (uid === playersRef.current[1]) {
+                        setOpponentActiveQuestion(question);
+                    }
+                });
+            }
+        });
+
         // Game event listeners
         newSocket.on('waiting_for_player', (data) => {
             setWaitingForPlayer(true);
@@ -240,6 +281,29 @@ function GameRoom() {
         });
 
         newSocket.on('opponent_code_update', (data) => {
+            // Apply the delta or snapshot on top of what we know of this player's code
+            const known = remoteCodeRef.current[data.user_id] || { code: '', version: 0 };
+            if (data.version <= known.version) {
+                return; // Already have it
+            }
+            let newCode;
+            if (data.code !== undefined) {
+                newCode = data.code;
+            } else if (data.base_version === known.version) {
+                newCode = data.patches.reduce(
+                    (code, p) => code.slice(0, p.offset) + p.text + code.slice(p.offset + p.length),
+                    known.code
+                );
+            } else {
+                // Missed an update - ask for a full snapshot
+                newSocket.emit('request_code_sync', {
+                    room_code: passedRoomCode || roomCode,
+                    user_id: data.user_id
+                });
+                return;
+            }
+            remoteCodeRef.current[data.user_id] = { code: newCode, version: data.version };
+
             console.log('Code update received:', {
                 from_user: data.user_id,
                 is_spectator_ref: isSpectatorRef.current,
@@ -254,21 +318,31 @@ function GameRoom() {
                 // For spectators, determine which editor to update based on player
                 if (data.user_id === playersRef.current[0]) {
                     console.log('Updating Player 1 code (left editor)');
-                    setMyCode(data.code);
+                    setMyCode(newCode);
                 } else if (data.user_id === playersRef.current[1]) {
                     console.log('Updating Player 2 code (right editor)');
-                    setOpponentCode(data.code);
+                    setOpponentCode(newCode);
                 }
             } else if (!isSpectatorRef.current) {
                 // For players, update opponent's code if it's not their own
                 if (data.user_id !== user_id) {
-                    setOpponentCode(data.code);
+                    setOpponentCode(newCode);
                 }
             } else {
                 console.log('Ignoring code update - spectator but players not ready:', playersRef.current);
             }
         });
 
+        newSocket.on('code_resync', (data) => {
+            // The server lost track of my edits - resend the whole buffer
+            myCodeVersionRef.current = data.version + 1;
+            newSocket.emit('code_update', {
+                room_code: passedRoomCode || roomCode,
+                user_id: user_id,
+                code: myCodeRef.current
+            });
+        });
+
         newSocket.on("update_player_health", (data) => {
             console.info("updating player health...", data);
             console.log('Health update details:', {
@@ -328,6 +402,9 @@ function GameRoom() {
         newSocket.on("solution-verified", (data) => {
             console.info("Solution verified:", data);
             console.info("Current roomCode:", data.room_code);
+            if (data.user_id === user_id && data.status === 'finished') {
+                showVerdict(data.verdict);
+            }
             if (data.user_id === user_id && data.correct) {
                 // Use room_code from the event data instead of closure
                 newSocket.emit('answered-question', {
@@ -380,14 +457,25 @@ function GameRoom() {
     }
 }, [gameStartTime]);
 
-    const handleCodeChange = (value) => {
+    const handleCodeChange = (value, event) => {
         setMyCode(value);
+        myCodeRef.current = value;
         if (socket && roomCode) {
-            socket.emit('code_update', {
-                room_code: roomCode,
-                user_id: user_id,
-                code: value
-            });
+            const update = { room_code: roomCode, user_id: user_id };
+            if (event && event.changes) {
+                // Editor edits: send only the changed ranges
+                update.base_version = myCodeVersionRef.current;
+                update.patches = event.changes.map(change => ({
+                    offset: change.rangeOffset,
+                    length: change.rangeLength,
+                    text: change.text
+                }));
+            } else {
+                // Programmatic changes (templates) replace the whole buffer
+                update.code = value;
+            }
+            myCodeVersionRef.current += 1;
+            socket.emit('code_update', update);
         }
     };
 
@@ -407,6 +495,35 @@ function GameRoom() {
         }, 100);
     }
 
+    const showVerdict = (data) => {
+        if (data.error) {
+            alert(data.error);
+        } else if (data.passed) {
+            let answerMsg = `Solution correct! All ${data.passed_tests} test cases passed.`;
+            setAnswerMessage(answerMsg);
+            // Clear the current question since it's been solved
+            setCurrentQuestion(null);
+            setMyActiveQuestion(null);
+        } else {
+            // Show which test cases failed
+            const failedTests = data.test_results.filter(t => !t.passed);
+            let errorMsg = `Solution incorrect. ${data.passed_tests}/${data.total_tests} test cases passed.\n\n`;
+            
+            failedTests.forEach(test => {
+                if (test.hidden) {
+                    // Hidden tests only report how they failed
+                    errorMsg += `Hidden test ${test.test_case} failed (${test.status})\n\n`;
+                    return;
+                }
+                errorMsg += `Test ${test.test_case} failed:\n`;
+                errorMsg += `Expected: ${test.expected}\n`;
+                errorMsg += `Got: ${test.actual}\n\n`;
+            });
+            
+            setErrorMessage(errorMsg);
+        }
+    };
+
     const handleSubmitSolution = async () => {
         console.log("Submit solution clicked");
         console.log("myActiveQuestion:", myActiveQuestion);
@@ -442,25 +559,8 @@ function GameRoom() {
             const data = await response.json();
             
             if (response.ok) {
-                if (data.passed) {
-                    let answerMsg = `Solution correct! All ${data.passed_tests} test cases passed.`;
-                    setAnswerMessage(answerMsg);
-                    // Clear the current question since it's been solved
-                    setCurrentQuestion(null);
-                    setMyActiveQuestion(null);
-                } else {
-                    // Show which test cases failed
-                    const failedTests = data.test_results.filter(t => !t.passed);
-                    let errorMsg = `Solution incorrect. ${data.passed_tests}/${data.total_tests} test cases passed.\n\n`;
-                    
-                    failedTests.forEach(test => {
-                        errorMsg += `Test ${test.test_case} failed:\n`;
-                        errorMsg += `Expected: ${test.expected}\n`;
-                        errorMsg += `Got: ${test.actual}\n\n`;
-                    });
-                    
-                    setErrorMessage(errorMsg);
-                }
+                // The verdict arrives through the solution-verified event
+                setAnswerMessage('Judging your solution...');
             } else {
                 alert(data.error || 'Failed to submit solution');
             }
@@ -25,7 +25,8 @@ function Home() {
     
     // Initialize socket connection
     console.log('Connecting to:', SOCKET_HOST);
-    const newSocket = io(SOCKET_HOST);
+    // WebSocket only: polling needs sticky sessions behind a load balancer
+    const newSocket = io(SOCKET_HOST, { transports: ['websocket'] });
 
     // Connection event listeners
     newSocket.on('player_count_update', (data) => {
@@ -67,7 +68,17 @@ function Home() {
                 body: JSON.stringify({ user_id })
             });
 
-            const data = await response.json();
+            let data = await response.json();
+            // Queued until an opponent of similar rating turns up
+            while (data.queued) {
+              await new Promise((resolve) => setTimeout(resolve, 1000));
+              const status = await fetch(`${API_ENDPOINTS.matchmakingStatus}?user_id=${user_id}`);
+              data = await status.json();
+            }
+            if (!data.room_code) {
+              console.error('Matchmaking failed:', data.error);
+              return;
+            }
             const room_code = data.room_code;
 
             if (data.created_game) {
@@ -10,31 +10,37 @@ const Profile = () => {
     const location = useLocation();
     const { user_id } = location.state || {};
     const [history, setHistory] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
 
-    useEffect(() => {
-        const fetchHistory = async () => {
-            console.log('Fetching game history for user:', user_id);
-            try {
-                const url = `${API_ENDPOINTS.getGameHistory}?user_id=${encodeURIComponent(user_id)}`;
-                console.log('Fetching from URL:', url);
-                const response = await fetch(url, {
-                    method: 'GET',
-                    headers: { 'Content-Type': 'application/json' }
-                });
-                const data = await response.json();
-                console.log('Game history data:', data);
-                setHistory(data);
-                console.info(history);
-            } catch (err) {
-                console.error('Failed to fetch game history', err);
-                setError('Failed to load game history.');
-            } finally {
-                setLoading(false);
+    // Fetch one page of history; cursor continues after the last page
+    const fetchHistory = async (cursor) => {
+        console.log('Fetching game history for user:', user_id);
+        try {
+            let url = `${API_ENDPOINTS.getGameHistory}?user_id=${encodeURIComponent(user_id)}`;
+            if (cursor) {
+                url += `&cursor=${encodeURIComponent(cursor)}`;
             }
-        };
-        fetchHistory();
+            console.log('Fetching from URL:', url);
+            const response = await fetch(url, {
+                method: 'GET',
+                headers: { 'Content-Type': 'application/json' }
+            });
+            const data = await response.json();
+            console.log('Game history data:', data);
+            setHistory(prev => cursor ? [...prev, ...(data.games || [])] : (data.games || []));
+            setNextCursor(data.next_cursor || null);
+        } catch (err) {
+            console.error('Failed to fetch game history', err);
+            setError('Failed to load game history.');
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    useEffect(() => {
+        fetchHistory(null);
     }, []);
 
 
@@ -142,6 +148,9 @@ const Profile = () => {
                     </tbody>
                 </table>
             )}
+            {!loading && nextCursor && (
+                <button style={{ ...styles.button, marginTop: '20px' }} onClick={() => fetchHistory(nextCursor)}>Load More</button>
+            )}
         </div>
     );
 };
@@ -1,3 +1,4 @@
+-- Existing databases are upgraded with migrate.sql; keep it in step with this file
 CREATE TABLE users (
     user_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     username VARCHAR(20) UNIQUE NOT NULL,
@@ -14,7 +15,13 @@ CREATE TABLE coding_problems (
     difficulty VARCHAR(20) NOT NULL,
     test_cases JSONB NOT NULL,
     solution_template TEXT,
-    created_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    -- How answers are compared, e.g. {"type": "float", "tolerance": 1e-6}; see server/comparators.py
+    comparator JSONB,
+    -- JSON lines file of hidden test cases under the server's PROBLEM_TESTS_DIR
+    hidden_tests VARCHAR(255),
+    created_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Lets servers reload only the problems that changed
+    updated_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE TABLE game_history (
@@ -32,6 +39,33 @@ CREATE TABLE game_history (
     played_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Game history pages per player, newest first (game_id breaks ties for the cursor)
+CREATE INDEX game_history_player1_played_on_idx ON game_history (player1_id, played_on DESC, game_id DESC);
+CREATE INDEX game_history_player2_played_on_idx ON game_history (player2_id, played_on DESC, game_id DESC);
+
+-- Tell servers to reload their in-memory problem catalog
+CREATE OR REPLACE FUNCTION notify_coding_problems_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('coding_problems_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER coding_problems_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON coding_problems
+FOR EACH STATEMENT EXECUTE FUNCTION notify_coding_problems_changed();
+
+CREATE OR REPLACE FUNCTION touch_coding_problem() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_on = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER coding_problems_touch
+BEFORE UPDATE ON coding_problems
+FOR EACH ROW EXECUTE FUNCTION touch_coding_problem();
+
 -- Coding Problems
 INSERT INTO coding_problems (title, description, difficulty, test_cases, solution_template) VALUES
 
@@ -0,0 +1,42 @@
+-- Bring a database created from an older init.sql up to date with it.
+-- Every statement is idempotent, so this is safe to run on any database,
+-- any number of times (PostgreSQL 14 or later, for CREATE OR REPLACE TRIGGER):
+--
+--     docker exec -i postgres-db psql -U postgres -d postgres -v ON_ERROR_STOP=1 < db/migrate.sql
+--
+-- Schema changes to init.sql go here as well.
+BEGIN;
+
+-- Per-problem comparators, hidden test files and incremental catalog reloads
+ALTER TABLE coding_problems ADD COLUMN IF NOT EXISTS comparator JSONB;
+ALTER TABLE coding_problems ADD COLUMN IF NOT EXISTS hidden_tests VARCHAR(255);
+ALTER TABLE coding_problems ADD COLUMN IF NOT EXISTS updated_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Game history pages per player, newest first (game_id breaks ties for the cursor)
+CREATE INDEX IF NOT EXISTS game_history_player1_played_on_idx ON game_history (player1_id, played_on DESC, game_id DESC);
+CREATE INDEX IF NOT EXISTS game_history_player2_played_on_idx ON game_history (player2_id, played_on DESC, game_id DESC);
+
+-- Tell servers to reload their in-memory problem catalog
+CREATE OR REPLACE FUNCTION notify_coding_problems_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('coding_problems_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER coding_problems_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON coding_problems
+FOR EACH STATEMENT EXECUTE FUNCTION notify_coding_problems_changed();
+
+CREATE OR REPLACE FUNCTION touch_coding_problem() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_on = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER coding_problems_touch
+BEFORE UPDATE ON coding_problems
+FOR EACH ROW EXECUTE FUNCTION touch_coding_problem();
+
+COMMIT;
@@ -1,36 +1,210 @@
-from flask import Flask, request, jsonify
-from flask_socketio import SocketIO
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
-import psycopg2, binascii, os, hashlib, uuid, random, string, tempfile, subprocess, docker, shutil
-import tarfile, io, re, time, math
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import psycopg2, binascii, os, hashlib, uuid, docker
+import time, math, atexit, functools, inspect
+from datetime import datetime
+from sandbox import SandboxPool, missing_case
+from local_sandbox import LocalSandbox
+from judge import JudgeQueue, JudgeQueueFull
+from db import Database, green_psycopg
+from catalog import ProblemCatalog, entry_point as entry_point_of
+from verdict_cache import VerdictCache
+from test_packages import TestSet, compile_tests
+import comparators
+from code_sync import CodeSync
+from rooms import RoomRegistry
+from room_store import SharedRoomStore
+from match_results import MatchResultWriter, match_result
+from leaderboard import Leaderboard
+from username_cache import UsernameCache
+from spectators import SpectatorFeed, spectator_room
+from replays import ReplayRecorder
+from matchmaking import EloRatings, Matchmaker, SharedMatchmaker
+from metrics import MetricsRegistry
+from logs import get_logger
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'MaSz55vnLfTAN5cG'
 CORS(app, supports_credentials=True, origins="*")
-socketio = SocketIO(app, cors_allowed_origins="*")
-connected_users = set()
-
-conn = psycopg2.connect(
-    host = 'db',
-    port = 5432,
-    database = 'postgres',
-    user = 'postgres',
-    password = 'password'
+# With a message queue, emits from any worker reach sockets held by the others
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE"),
+                    async_mode=os.environ.get("SOCKETIO_ASYNC_MODE"))
+
+# Structured event log: LOG_LEVEL=debug traces game events, LOG_SAMPLE_RATE
+# keeps a fraction of debug/info lines on busy servers
+log = get_logger()
+log.configure(
+    level=os.environ.get("LOG_LEVEL", "WARNING"),
+    sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
 )
-cur = conn.cursor()
+
+# Prometheus metrics served at /metrics
+metrics = MetricsRegistry(prefix="code_duels_")
+request_latency = metrics.histogram("http_request_duration_seconds", "Flask request latency by route", ("route", "method"))
+request_count = metrics.counter("http_requests_total", "Flask requests by route, method and status", ("route", "method", "status"))
+event_latency = metrics.histogram("socketio_event_duration_seconds", "Socket.IO handler latency by event", ("event",))
+event_count = metrics.counter("socketio_events_total", "Socket.IO events handled by event and outcome", ("event", "outcome"))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # The URL rule, not the path, keeps one series per route
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        request_latency(route, request.method).observe(time.perf_counter() - started)
+        request_count(route, request.method, str(response.status_code))
+    return response
+
+def socket_event(event):
+    """
+    Register a Socket.IO handler, timing it and counting its outcomes
+
+    Parameters: event name
+    Dependencies: socketio, metrics
+    Returns: decorator used in place of socketio.on
+    """
+    def decorator(handler):
+        # Flask-SocketIO passes optional extras (auth, reason) some handlers do not take
+        accepted = len(inspect.signature(handler).parameters)
+
+        @functools.wraps(handler)
+        def timed(*args):
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return handler(*args[:accepted])
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                event_latency(event).observe(time.perf_counter() - started)
+                event_count(event, outcome)
+        return socketio.on(event)(timed)
+    return decorator
+
+DB_CONFIG = {
+    "host": 'db',
+    "port": 5432,
+    "database": 'postgres',
+    "user": 'postgres',
+    "password": 'password'
+}
+
+# Pooled database connections, checked out per unit of work; under eventlet
+# or gevent psycopg2 must yield to the hub for queries to overlap
+green_psycopg(socketio.async_mode)
+db = Database(
+    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+    maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+    statement_timeout=int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 5000)),
+    **DB_CONFIG
+)
+atexit.register(db.close)
+
+# Problems are served from memory; the listener reloads them on change
+catalog = ProblemCatalog(db, tests_dir=os.environ.get("PROBLEM_TESTS_DIR", "problem_tests"))
+catalog.listen(**DB_CONFIG)
+
+# Verdicts of previously judged identical solutions
+verdict_cache = VerdictCache(
+    max_entries=int(os.environ.get("VERDICT_CACHE_SIZE", 10000)),
+    path=os.environ.get("VERDICT_CACHE_PATH")
+)
+verdict_cache.load()
+atexit.register(verdict_cache.save)
+catalog.on_change(lambda problem_ids: [verdict_cache.invalidate_problem(pid) for pid in problem_ids])
+
+# Finished games are written to game_history in batches
+match_writer = MatchResultWriter(
+    db,
+    batch_size=int(os.environ.get("MATCH_WRITER_BATCH_SIZE", 50)),
+    flush_interval=int(os.environ.get("MATCH_WRITER_FLUSH_MS", 1000)) / 1000,
+    spill_path=os.environ.get("MATCH_WRITER_SPILL_PATH", "match_results.spill"),
+    dead_letter_path=os.environ.get("MATCH_WRITER_DEAD_LETTER_PATH", "match_results.rejected")
+)
+match_writer.start()
+atexit.register(match_writer.close)
+
+# Ranked users kept in memory, updated as games end and reconciled periodically
+leaderboard_board = Leaderboard(db, reconcile_interval=int(os.environ.get("LEADERBOARD_RECONCILE_S", 300)))
+leaderboard_board.start()
 
 client = docker.from_env()
 
+# Warm sandbox containers shared by every submission
+SANDBOX_POOL_SIZE = int(os.environ.get("SANDBOX_POOL_SIZE", 4))
+sandbox_pool = SandboxPool(
+    client,
+    size=SANDBOX_POOL_SIZE,
+    max_uses=int(os.environ.get("SANDBOX_POOL_MAX_USES", 25)),
+    low_water=int(os.environ.get("SANDBOX_POOL_LOW_WATER", SANDBOX_POOL_SIZE)),
+    warm=os.environ.get("SANDBOX_WARM_RUNNER", "1") != "0"
+)
+sandbox_pool.start()
+atexit.register(sandbox_pool.shutdown)
+
+# Forked-worker sandbox without Docker, used for the difficulties mapped to
+# it in SANDBOX_BACKENDS, e.g. "easy=local,medium=local"; the rest use Docker
+_local_uid = os.environ.get("SANDBOX_LOCAL_UID")
+local_sandbox = LocalSandbox(
+    memory_limit_mb=int(os.environ.get("SANDBOX_LOCAL_MEMORY_MB", 256)),
+    uid=int(_local_uid) if _local_uid else None
+)
+sandbox_backends = {backend.name: backend for backend in (sandbox_pool, local_sandbox)}
+SANDBOX_BACKENDS = dict(
+    entry.strip().split("=", 1) for entry in os.environ.get("SANDBOX_BACKENDS", "").split(",") if "=" in entry
+)
+for _difficulty, _backend in SANDBOX_BACKENDS.items():
+    if _backend not in sandbox_backends:
+        raise ValueError(f"Unknown sandbox backend {_backend!r} for {_difficulty} problems")
+if "local" in SANDBOX_BACKENDS.values():
+    local_sandbox.start()
+
+def sandbox_for(difficulty):
+    """
+    Returns: the sandbox backend configured for a problem difficulty
+    """
+    return sandbox_backends[SANDBOX_BACKENDS.get(difficulty, "docker")]
+
+# Editor updates are applied as versioned deltas and fanned out in batches
+code_sync = CodeSync(
+    emit=lambda room_code, payload, sid: socketio.emit('opponent_code_update', payload, room=room_code, skip_sid=sid),
+    send=lambda sid, event, payload: socketio.emit(event, payload, to=sid),
+    window=int(os.environ.get("CODE_SYNC_WINDOW_MS", 50)) / 1000,
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+# Spectators get a snapshot on join and coalesced updates once per tick
+spectator_feed = SpectatorFeed(
+    emit=lambda room_code, event, payload: socketio.emit(event, payload, room=spectator_room(room_code)),
+    tick=int(os.environ.get("SPECTATOR_TICK_MS", 250)) / 1000,
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+# Every match's events are appended to a compact log that can be replayed
+replay_recorder = ReplayRecorder(
+    directory=os.environ.get("REPLAY_DIR", "replays"),
+    flush_interval=int(os.environ.get("REPLAY_FLUSH_MS", 1000)) / 1000
+)
+replay_recorder.start()
+atexit.register(replay_recorder.close)
+
 def gen_salt(size: int) -> bytes:
     return binascii.hexlify(os.urandom(size))
 
-def get_usernames_for_ids(user_ids: list) -> dict:
+def fetch_usernames(user_ids: list) -> dict:
     """
-    Get usernames for a list of user IDs
+    Look up usernames for a list of user IDs in one query
     
     Parameters: user_ids - list of user UUIDs
-    Dependencies: database connection (cur)
+    Dependencies: db
     Returns: dict mapping user_id to username
     """
     if not user_ids:
@@ -40,8 +214,9 @@ def get_usernames_for_ids(user_ids: list) -> dict:
         # Create placeholder string for IN clause
         placeholders = ','.join(['%s'] * len(user_ids))
         query = f"SELECT user_id, username FROM users WHERE user_id IN ({placeholders})"
-        cur.execute(query, user_ids)
-        results = cur.fetchall()
+        with db.cursor() as cur:
+            cur.execute(query, user_ids)
+            results = cur.fetchall()
         
         # Create mapping dict
         username_mapping = {}
@@ -50,9 +225,26 @@ def get_usernames_for_ids(user_ids: list) -> dict:
             
         return username_mapping
     except psycopg2.Error as e:
-        print(f"Error fetching usernames: {e}")
+        log.error("fetch_usernames_failed", error=str(e))
         return {}
 
+# Usernames by user ID; filled on signup/login and on lookup misses
+username_cache = UsernameCache(
+    fetch_usernames,
+    max_entries=int(os.environ.get("USERNAME_CACHE_SIZE", 50000)),
+    ttl=int(os.environ.get("USERNAME_CACHE_TTL_S", 3600))
+)
+
+def get_usernames_for_ids(user_ids: list) -> dict:
+    """
+    Get usernames for a list of user IDs
+    
+    Parameters: user_ids - list of user UUIDs
+    Dependencies: username_cache
+    Returns: dict mapping user_id to username
+    """
+    return username_cache.get_many(user_ids)
+
 def hash(password: str, b_salt: bytes) -> bytes:
     sha256 = hashlib.sha256()
     b_password = password.encode()
@@ -66,81 +258,128 @@ def main():
 
 @app.route("/api/leaderboard", methods=["GET"])
 def leaderboard() -> None:
+    """
+    Page of the leaderboard, served from memory
+    
+    Parameters: optional limit (default 10, max 100) and offset query args
+    Dependencies: leaderboard_board
+    Returns: JSON list of {rank, username, num_wins}
+    """
     try:
-        cur.execute("""
-            SELECT username, num_wins FROM users
-            ORDER BY num_wins DESC
-            LIMIT 10
-        """)
-        leaderboard_data = cur.fetchall()
-        
-        # Convert to list of dicts
-        leaderboard = [
-            {"username": username, "num_wins": num_wins}
-            for username, num_wins in leaderboard_data
-        ]
-        
-        return jsonify(leaderboard)
+        limit = min(max(int(request.args.get("limit", 10)), 1), 100)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
     
+    try:
+        return jsonify(leaderboard_board.top(limit, offset))
+    except psycopg2.Error as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/leaderboard/rank", methods=["GET"])
+def leaderboard_rank() -> None:
+    """
+    A user's own leaderboard position
+    
+    Parameters: user_id query arg
+    Dependencies: leaderboard_board
+    Returns: JSON {rank, username, num_wins, total}
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    
+    try:
+        rank = leaderboard_board.rank_of(user_id)
     except psycopg2.Error as e:
         return jsonify({"error": str(e)}), 500
+    if rank is None:
+        return jsonify({"error": "Unknown user"}), 404
+    return jsonify(rank)
     
 @app.route("/api/game-history", methods=["GET"])
 def game_history() -> None:
+    """
+    A user's games, newest first, one page at a time
+    
+    Usernames are joined in the same query, and pages continue from a
+    (played_on, game_id) cursor so later pages cost the same as the first.
+    
+    Parameters: user_id, optional limit (default 10, max 50) and cursor
+                (next_cursor of the previous page) query args
+    Dependencies: db
+    Returns: JSON {"games": [...], "next_cursor": cursor or null}
+    """
+    user_id = request.args.get('user_id')
+    
+    # Validate user_id
+    if not user_id or user_id == 'undefined' or user_id == 'null':
+        return jsonify({"games": [], "next_cursor": None})  # Return empty history for invalid user_id
+    
     try:
-        user_id = request.args.get('user_id')
-        
-        # Validate user_id
-        if not user_id or user_id == 'undefined' or user_id == 'null':
-            return jsonify([])  # Return empty history for invalid user_id
-        
-        cur.execute("""
-            SELECT player1_id,player2_id,winner_id,player1_questions_answered,
-                    player2_questions_answered,duration_seconds,played_on
-            FROM game_history
-            WHERE player1_id = %s OR player2_id = %s
-            ORDER BY played_on DESC
-            LIMIT 10
-        """, (user_id, user_id))
-        history_data = cur.fetchall()
-
-        history = []
-        for game in history_data:
-            history.append({
-                "opponent": None,
-                "winner": None,
-                "player1_questions_answered": game[3],
-                "player2_questions_answered": game[4],
-                "duration_seconds": game[5],
-                "played_on": game[6].isoformat()
-            })
-        
-        i = 0
-        for game in history:
-            player1_id = history_data[i][0]
-            player2_id = history_data[i][1]
-            winner_id = history_data[i][2]
-
-            usernames = get_usernames_for_ids([player1_id, player2_id, winner_id])
-            player1 = usernames.get(str(player1_id), "Unknown")
-            player2 = usernames.get(str(player2_id), "Unknown")
-
-            if player1_id == user_id:
-                game["opponent"] = player2
-                game["your_questions_answered"] = game.pop("player1_questions_answered")
-                game["opponent_questions_answered"] = game.pop("player2_questions_answered")
-            elif player2_id == user_id:
-                game["opponent"] = player1
-                game["your_questions_answered"] = game.pop("player2_questions_answered")
-                game["opponent_questions_answered"] = game.pop("player1_questions_answered")
-
-            game["winner"] = usernames.get(str(winner_id), "Unknown")
-            i += 1
-
-        return jsonify(history)
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
     
+    params = {"user_id": user_id, "limit": limit + 1}
+    after = ""
+    cursor_arg = request.args.get('cursor')
+    if cursor_arg:
+        try:
+            played_on, game_id = cursor_arg.split("_", 1)
+            params["played_on"] = datetime.fromisoformat(played_on)
+            params["game_id"] = str(uuid.UUID(game_id))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        after = "AND (played_on, game_id) < (%(played_on)s, %(game_id)s)"
+    
+    try:
+        # One index range scan per player column, merged, then usernames joined
+        with db.cursor() as cur:
+            cur.execute(f"""
+                WITH games AS (
+                    (SELECT * FROM game_history
+                     WHERE player1_id = %(user_id)s {after}
+                     ORDER BY played_on DESC, game_id DESC
+                     LIMIT %(limit)s)
+                    UNION ALL
+                    (SELECT * FROM game_history
+                     WHERE player2_id = %(user_id)s {after}
+                     ORDER BY played_on DESC, game_id DESC
+                     LIMIT %(limit)s)
+                )
+                SELECT g.game_id, g.player1_id, g.player1_questions_answered,
+                       g.player2_questions_answered, g.duration_seconds, g.played_on,
+                       p1.username, p2.username, w.username
+                FROM games g
+                LEFT JOIN users p1 ON p1.user_id = g.player1_id
+                LEFT JOIN users p2 ON p2.user_id = g.player2_id
+                LEFT JOIN users w ON w.user_id = g.winner_id
+                ORDER BY g.played_on DESC, g.game_id DESC
+                LIMIT %(limit)s
+            """, params)
+            history_data = cur.fetchall()
     except psycopg2.Error as e:
         return jsonify({"error": str(e)}), 500
+    
+    games = []
+    for (game_id, player1_id, player1_answered, player2_answered, duration_seconds, played_on,
+         player1, player2, winner) in history_data[:limit]:
+        is_player1 = str(player1_id) == user_id
+        games.append({
+            "opponent": (player2 if is_player1 else player1) or "Unknown",
+            "winner": winner or "Unknown",
+            "your_questions_answered": player1_answered if is_player1 else player2_answered,
+            "opponent_questions_answered": player2_answered if is_player1 else player1_answered,
+            "duration_seconds": duration_seconds,
+            "played_on": played_on.isoformat()
+        })
+    
+    next_cursor = None
+    if len(history_data) > limit:
+        last = history_data[limit - 1]
+        next_cursor = f"{last[5].isoformat()}_{last[0]}"
+    return jsonify({"games": games, "next_cursor": next_cursor})
 
 @app.route("/api/signup", methods=["POST"])
 def signup() -> None:
@@ -152,31 +391,33 @@ def signup() -> None:
         if not username or not password:
             return jsonify({"error": "Username and password are required"}), 400
         
-        # Check if username already exists
-        cur.execute("SELECT EXISTS(SELECT 1 FROM users WHERE username = %s)", (username,))
-        exists = cur.fetchone()[0]
-        if exists:
-            return jsonify({"error": "Username already exists"}), 400
+        try:
+            # Check if username already exists
+            with db.cursor() as cur:
+                cur.execute("SELECT EXISTS(SELECT 1 FROM users WHERE username = %s)", (username,))
+                exists = cur.fetchone()[0]
+            if exists:
+                return jsonify({"error": "Username already exists"}), 400
 
-        salt = gen_salt(16)
-        hashed_password = hash(password, salt)
+            salt = gen_salt(16)
+            hashed_password = hash(password, salt)
 
-        try:
-            cur.execute(
-                "INSERT INTO users (username, password, salt) VALUES (%s, %s, %s)",
-                (username, hashed_password, salt)
-            )
-            conn.commit()
+            with db.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO users (username, password, salt) VALUES (%s, %s, %s)",
+                    (username, hashed_password, salt)
+                )
 
-            # Get user ID
-            cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
-            user_id = cur.fetchone()[0]
+                # Get user ID
+                cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+                user_id = cur.fetchone()[0]
+            leaderboard_board.add_user(user_id, username)
+            username_cache.put(user_id, username)
 
             return jsonify({"message": "User registered successfully",
                             "user_id": user_id}), 201
         
         except psycopg2.Error as e:
-            conn.rollback()
             return jsonify({"error": str(e)}), 500
         
 @app.route("/api/login", methods=["POST"])
@@ -190,21 +431,22 @@ def login() -> None:
             return jsonify({"error": "Username and password are required"}), 400
 
         try:
-            cur.execute(
-                "SELECT password, salt FROM users WHERE username = %s",
-                (username,)
-            )
-            user = cur.fetchone()
+            with db.cursor() as cur:
+                cur.execute(
+                    "SELECT password, salt, user_id FROM users WHERE username = %s",
+                    (username,)
+                )
+                user = cur.fetchone()
 
             if user is None:
                 return jsonify({"error": "Invalid username or password"}), 401
             
-            stored_password, salt = tuple([item.tobytes() for item in user])
+            stored_password, salt = tuple([item.tobytes() for item in user[:2]])
             hashed_password = hash(password, salt)
 
             if hashed_password == stored_password:
-                cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
-                user_id = cur.fetchone()[0]
+                user_id = user[2]
+                username_cache.put(user_id, username)
 
                 return jsonify({"message": "User logged in successfully",
                                 "user_id": user_id}), 200
@@ -216,7 +458,19 @@ def login() -> None:
 
 @app.route("/api/get-player-count", methods=["GET"])
 def get_player_count():
-    return jsonify({"count": len(connected_users)})
+    return jsonify({"count": room_registry.connection_count()})
+
+@app.route("/api/sandbox-pool-stats", methods=["GET"])
+def sandbox_pool_stats():
+    return jsonify(sandbox_pool.stats())
+
+@app.route("/api/health/sandbox", methods=["GET"])
+def sandbox_health():
+    health = sandbox_pool.health()
+    health["backends"] = SANDBOX_BACKENDS
+    if "local" in SANDBOX_BACKENDS.values():
+        health["local"] = local_sandbox.health()
+    return jsonify(health), 200 if health["ready"] else 503
 
 @app.route("/api/get-question", methods=["POST"])
 def get_question():
@@ -224,7 +478,7 @@ def get_question():
     Get a random question of specified difficulty that hasn't been asked yet
     
     Parameters: room_code, difficulty, user_id from request JSON
-    Dependencies: game_rooms dict, database connection
+    Dependencies: room_registry, catalog
     Returns: JSON response with question data
     """
     data = request.get_json()
@@ -235,68 +489,30 @@ def get_question():
     if not room_code or not difficulty or not user_id:
         return jsonify({"error": "Room code, difficulty, and user_id are required"}), 400
     
-    if room_code not in game_rooms:
+    if room_registry.get(room_code) is None:
         return jsonify({"error": "Invalid room code"}), 404
-    
-    room = game_rooms[room_code]
+    player = room_registry.get_player(room_code, user_id)
+    if player is None:
+        return jsonify({"error": "You are not a player in this room"}), 403
     
     # Check if player already has an active question
-    if user_id in room['active_questions']:
+    if player.active_question is not None:
         return jsonify({"error": "You already have an active question"}), 400
     
     try:
-        # Get all questions of specified difficulty not yet asked
-        cur.execute("""
-            SELECT problem_id, title, description, test_cases, solution_template
-            FROM coding_problems
-            WHERE difficulty = %s
-            AND problem_id NOT IN (
-                SELECT unnest(%s::uuid[])
-            )
-            ORDER BY RANDOM()
-            LIMIT 1
-        """, (difficulty, room['questions_asked']))
-        
-        question = cur.fetchone()
-        
+        # Draws, records it as asked and stores it as the player's active question
+        question = room_registry.assign_question(
+            room_code, user_id,
+            lambda questions_asked, decks: catalog.draw(difficulty, questions_asked, decks),
+            started_at=request.args.get('timestamp', None)
+        )
         if question is None:
-            # All questions of this difficulty have been asked
-            # Reset by removing questions of this difficulty from asked list
-            cur.execute("""
-                SELECT problem_id
-                FROM coding_problems
-                WHERE difficulty = %s
-            """, (difficulty,))
-            
-            difficulty_question_ids = [row[0] for row in cur.fetchall()]
-            
-            # Remove questions of this difficulty from the asked list
-            room['questions_asked'] = [q_id for q_id in room['questions_asked'] 
-                                     if q_id not in difficulty_question_ids]
-            
-            # Try again to get a random question
-            cur.execute("""
-                SELECT problem_id, title, description, test_cases, solution_template
-                FROM coding_problems
-                WHERE difficulty = %s
-                ORDER BY RANDOM()
-                LIMIT 1
-            """, (difficulty,))
-            
-            question = cur.fetchone()
-        
-        problem_id, title, description, test_cases, solution_template = question
-        
-        # Add to questions asked
-        room['questions_asked'].append(problem_id)
-        
-        # Store active question for this player
-        room['active_questions'][user_id] = {
-            "problem_id": str(problem_id),
-            "title": title,
-            "difficulty": difficulty,
-            "started_at": request.args.get('timestamp', None)
-        }
+            return jsonify({"error": "No questions of that difficulty"}), 404
+
+        problem_id = question['problem_id']
+        title = question['title']
+        description = question['description']
+        solution_template = question['solution_template']
         
         # Notify other players in room about question selection
         socketio.emit("player_selected_question", {
@@ -306,6 +522,8 @@ def get_question():
                 "difficulty": difficulty
             }
         }, room=room_code)
+        spectator_feed.update(room_code, 'active_questions', user_id, {"title": title, "difficulty": difficulty})
+        replay_recorder.record(room_code, "question", {"user_id": user_id, "problem_id": str(problem_id), "difficulty": difficulty})
         
         return jsonify({
             "problem_id": str(problem_id),
@@ -324,7 +542,7 @@ def skip_question():
     Skip the current active question and lose health based on difficulty
     
     Parameters: room_code, user_id from request JSON
-    Dependencies: game_rooms dict, socketio
+    Dependencies: room_registry, socketio
     Returns: JSON response with success message
     """
     data = request.get_json()
@@ -334,17 +552,15 @@ def skip_question():
     if not room_code or not user_id:
         return jsonify({"error": "Room code and user_id are required"}), 400
     
-    if room_code not in game_rooms:
+    if room_registry.get(room_code) is None:
         return jsonify({"error": "Invalid room code"}), 404
     
-    room = game_rooms[room_code]
-    
-    # Check if player has an active question
-    if user_id not in room['active_questions']:
+    # Clear active question, checking the player has one
+    active_question = room_registry.clear_question(room_code, user_id)
+    if active_question is None:
         return jsonify({"error": "No active question to skip"}), 400
     
     # Get difficulty to calculate health penalty
-    active_question = room['active_questions'][user_id]
     difficulty = active_question['difficulty']
     
     # Calculate health penalty
@@ -358,18 +574,15 @@ def skip_question():
             health_penalty = 20
     
     # Apply health penalty to current player
-    room['health'][user_id] -= health_penalty
-    if room['health'][user_id] < 0:
-        room['health'][user_id] = 0
-    
-    # Clear active question
-    del room['active_questions'][user_id]
+    new_health = room_registry.apply_damage(room_code, user_id, health_penalty)
+    if new_health is None:
+        return jsonify({"error": "You are not a player in this room"}), 403
     
     # Emit health update to all players
     socketio.emit("update_player_health", {
         "user_id": user_id,
         "damage": health_penalty,
-        "new_health": room['health'][user_id]
+        "new_health": new_health
     }, room=room_code)
     
     # Emit question skipped event
@@ -378,69 +591,147 @@ def skip_question():
         "correct": False,
         "skipped": True
     }, room=room_code)
+    spectator_feed.update(room_code, 'health', user_id, new_health)
+    spectator_feed.update(room_code, 'active_questions', user_id, None)
+    replay_recorder.record(room_code, "skip", {"user_id": user_id, "damage": health_penalty, "health": new_health})
     
     # Check if game is over
-    if room['health'][user_id] <= 0:
+    if new_health <= 0:
         # Find opponent
-        opponent_id = None
-        for player_id in room['players']:
-            if player_id != user_id:
-                opponent_id = player_id
-                break
+        room = room_registry.get(room_code)
+        opponent_id = room.opponent_of(user_id) if room else None
         
-        if opponent_id:
-            # Save game to database
-            try:
-                # Calculate game duration
-                duration = int(time.time() - room['start_time']) if room['start_time'] else 0
-                
-                cur.execute("""
-                    INSERT INTO game_history 
-                    (room_code, player1_id, player2_id, winner_id,
-                     player1_questions_answered, player2_questions_answered,
-                     player1_final_health, player2_final_health, duration_seconds)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    room_code, 
-                    room['players'][0], 
-                    room['players'][1], 
-                    opponent_id,
-                    room['questions_answered'][room['players'][0]],
-                    room['questions_answered'][room['players'][1]],
-                    room['health'][room['players'][0]],
-                    room['health'][room['players'][1]],
-                    duration
-                ))
-                cur.execute(""" 
-                UPDATE users  
-                SET num_wins = num_wins + 1
-                WHERE user_id = %s """, (opponent_id,))
-                conn.commit()
-                print(f"Game saved to database: {room_code}, winner: {opponent_id}")
-            except psycopg2.Error as e:
-                conn.rollback()
-                print(f"Error saving game to database: {e}")
+        # Only the request that ends the game records it
+        if opponent_id and room_registry.finish(room_code):
+            record_match(room_code, room, opponent_id)
             
             # Game over - emit results
-            socketio.emit("game_over", {
+            results = {
                 "winner_id": opponent_id,
                 "loser_id": user_id,
-                "questions_answered": room['questions_answered'],
-                "final_health": room['health']
-            }, room=room_code)
-            room['status'] = 'finished'
+                "questions_answered": room.questions_answered(),
+                "final_health": room.health(),
+                "replay_id": end_replay(room_code, "game_over", {"winner_id": opponent_id})
+            }
+            socketio.emit("game_over", results, room=room_code)
+            spectator_feed.finish(room_code, "game_over", results)
     
     return jsonify({"message": "Question skipped successfully"}), 200
         
-def make_tarfile(file_path, arcname):
-    tar_stream = io.BytesIO()
-    with tarfile.open(fileobj=tar_stream, mode='w') as tar:
-        tar.add(file_path, arcname=arcname)
-    tar_stream.seek(0)
-    return tar_stream
+def record_match(room_code, room, winner_id):
+    """
+    Record a finished game without waiting on the database
+    
+    Parameters: room_code, room - Room snapshot, winner_id
+    Dependencies: match_writer, leaderboard_board, elo_ratings
+    Returns: None
+    """
+    match_writer.record(match_result(room_code, room, winner_id))
+    leaderboard_board.record_win(winner_id)
+    elo_ratings.record(winner_id, room.opponent_of(winner_id))
+
+def end_replay(room_code, event, data):
+    """
+    Record the event that ended a room's match and close its replay
+
+    Parameters: room_code, event name, data dict
+    Dependencies: replay_recorder
+    Returns: match id of the replay, or None if none was recording
+    """
+    match_id = replay_recorder.match_id(room_code)
+    replay_recorder.record(room_code, event, data)
+    replay_recorder.end(room_code)
+    return match_id
+
+def judge_submission(job):
+    """
+    Judge a queued submission
+
+    Parameters: job dict from judge_queue
+    Dependencies: verify_solution, verdict_cache
+    Returns: verification result dict
+    """
+    # The test version covers the compiled calls; only the entry point comes from the code
+    entry = job.get('entry_point') or entry_point_of(job['code'])
+    key = VerdictCache.key(job['question_id'], job['test_version'], job['code'], [entry or ""])
+    verdict = verdict_cache.get(key)
+    if verdict is not None:
+        return verdict
+
+    timings = {}
+    verdict = verify_solution(job['code'], job['tests'], timings, sandbox_for(job.get('difficulty')), entry)
+    # Sandbox failures and timeouts say nothing reliable about the code
+    if not any(result.get('error') for result in verdict['test_results']):
+        verdict_cache.put(key, verdict)
+    # Timings describe this run only, so they stay out of the cache
+    return {**verdict, 'timings': timings}
+
+def notify_submission(job):
+    """
+    Push judge progress and the final verdict to the submitter, and the
+    outcome alone to the rest of the room
+
+    Parameters: job dict from judge_queue
+    Dependencies: room_registry, socketio
+    Returns: None (emits events)
+    """
+    room_code = job['room_code']
+    user_id = job['user_id']
+    player = room_registry.get_player(room_code, user_id)
+    active_question = player.active_question if player else None
+
+    payload = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'user_id': user_id,
+        'room_code': room_code,
+        'question': {
+            'problem_id': job['question_id'],
+            'difficulty': active_question['difficulty'] if active_question else None
+        },
+        'correct': False
+    }
+    if job['status'] == 'queued':
+        payload['position'] = job['position']
+    elif job['status'] == 'finished':
+        verdict = job['verdict']
+        payload['verdict'] = verdict
+        # Only a solved active question counts towards damage
+        payload['correct'] = bool(verdict.get('passed')) and active_question is not None
+        replay_recorder.record(room_code, "verdict", {
+            "user_id": user_id,
+            "job_id": job['job_id'],
+            "passed": bool(verdict.get('passed')),
+            "correct": payload['correct']
+        })
+
+    # Test results and outputs are the submitter's alone
+    socket_id = room_registry.socket_of(user_id)
+    if socket_id is not None:
+        socketio.emit('solution-verified', payload, room=socket_id)
+    if job['status'] == 'finished':
+        outcome = {key: payload[key] for key in ('status', 'user_id', 'room_code', 'question', 'correct')}
+        socketio.emit('solution-verified', outcome, room=room_code, skip_sid=socket_id)
+
+# Judge workers run submissions off the request path
+judge_queue = JudgeQueue(
+    judge_submission,
+    notify_submission,
+    workers=int(os.environ.get("JUDGE_WORKERS", SANDBOX_POOL_SIZE)),
+    max_queued=int(os.environ.get("JUDGE_QUEUE_SIZE", 100)),
+    max_per_user=int(os.environ.get("JUDGE_MAX_PER_USER", 2))
+)
+judge_queue.start()
 
 @app.route("/api/submit-solution", methods=["POST"])
 def submit_solution():
+    """
+    Queue a solution for judging
+
+    Parameters: code, question_id, room_code, user_id from request JSON
+    Dependencies: judge_queue
+    Returns: JSON response with job_id; the verdict arrives via solution-verified
+    """
     data = request.get_json()
     code = data.get("code")
     question_id = data.get("question_id")
@@ -450,179 +741,286 @@ def submit_solution():
     if not all([code, question_id, room_code, user_id]):
         return jsonify({"error": "Missing required fields"}), 400
     
-    # Get test cases from database
-    test_cases = get_test_cases(question_id)
-    if not test_cases:
+    # Get test cases from the problem catalog
+    problem = get_problem(question_id)
+    if not problem or not problem['tests'].cases:
         return jsonify({"error": "Question not found"}), 404
-    
-    tmpdir = os.path.join("/code", f"{uuid.uuid4().hex}")
-    os.makedirs(tmpdir, exist_ok=True)
 
     try:
-        # Run code and verify against test cases
-        verification_result = verify_solution(code, test_cases, tmpdir)
-        
-        # Emit socket event based on verification result
-        if verification_result["passed"]:
-            room = game_rooms.get(room_code)
-            if room and user_id in room['active_questions']:
-                active_question = room['active_questions'][user_id]
-                socketio.emit('solution-verified', {
-                    'user_id': user_id,
-                    'room_code': room_code,
-                    'question': {
-                        'problem_id': question_id,
-                        'difficulty': active_question['difficulty']
-                    },
-                    'correct': True
-                }, room=room_code)
-        
-        return jsonify(verification_result), 200
-    
-    except Exception as e:
-        return jsonify({"error": str(e), "passed": False}), 500
-    finally:
-        if os.path.exists(tmpdir):
-            shutil.rmtree(tmpdir)
+        job = judge_queue.submit(
+            user_id,
+            code=code,
+            question_id=question_id,
+            room_code=room_code,
+            tests=problem['tests'],
+            test_version=problem['version'],
+            difficulty=problem['difficulty'],
+            entry_point=problem.get('entry_point')
+        )
+    except JudgeQueueFull as e:
+        response = jsonify({"error": str(e), "passed": False})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429 if e.per_user else 503
+
+    replay_recorder.record(room_code, "submit", {"user_id": user_id, "job_id": job['job_id'], "problem_id": question_id, "code": code})
+    return jsonify({"job_id": job['job_id'], "status": job['status'], "position": job['position']}), 202
+
+@app.route("/api/submission/<job_id>", methods=["GET"])
+def get_submission(job_id):
+    """
+    Poll a queued submission
 
-def get_test_cases(question_id):
+    Parameters: job_id from URL
+    Dependencies: judge_queue
+    Returns: JSON response with status, and verdict once finished
     """
-    Get test cases for a specific question
+    job = judge_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown submission"}), 404
+    return jsonify({"job_id": job_id, "status": job['status'], "verdict": job['verdict']}), 200
+
+@app.route("/api/judge-stats", methods=["GET"])
+def judge_stats():
+    return jsonify(judge_queue.stats())
+
+@app.route("/api/judge-latency", methods=["GET"])
+def judge_latency():
+    """
+    Where submit time goes: queue wait and total judge time per job, and
+    sandbox setup, execution and teardown per run, local_ for the local
+    sandbox backend
+
+    Dependencies: judge_queue, sandbox_pool, local_sandbox
+    Returns: JSON dict of latency histograms in seconds
+    """
+    local = {f"local_{phase}": histogram for phase, histogram in local_sandbox.latency.items()}
+    histograms = {**judge_queue.latency, **sandbox_pool.latency, **local}
+    return jsonify({name: histogram.snapshot() for name, histogram in histograms.items()})
+
+@app.route("/api/match-writer-stats", methods=["GET"])
+def match_writer_stats():
+    return jsonify(match_writer.stats())
+
+@app.route("/api/username-cache-stats", methods=["GET"])
+def username_cache_stats():
+    return jsonify(username_cache.stats())
+
+@app.route("/api/spectator-stats", methods=["GET"])
+def spectator_stats():
+    return jsonify(spectator_feed.stats())
+
+@app.route("/api/replay-stats", methods=["GET"])
+def replay_stats():
+    return jsonify(replay_recorder.stats())
+
+@app.route("/api/replays", methods=["GET"])
+def list_replays():
+    """
+    List recorded matches, newest first
+
+    Parameters: room_code (optional), limit from query string
+    Dependencies: replay_recorder
+    Returns: JSON response with match ids
+    """
+    room_code = request.args.get("room_code")
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    return jsonify({"replays": replay_recorder.matches(room_code)[:limit]}), 200
+
+@app.route("/api/replays/<match_id>", methods=["GET"])
+def get_replay(match_id):
+    """
+    Stream a finished match's event log
+
+    Parameters: match_id from URL
+    Dependencies: replay_recorder
+    Returns: newline-delimited JSON, one [ms since start, event, data] per line
+    """
+    if replay_recorder.path(match_id) is None:
+        return jsonify({"error": "Replay not found"}), 404
+    return Response(replay_recorder.stream(match_id), mimetype="application/x-ndjson")
+
+@app.route("/api/verdict-cache-stats", methods=["GET"])
+def verdict_cache_stats():
+    return jsonify(verdict_cache.stats())
+
+def get_problem(question_id):
+    """
+    Get a problem with its test cases
     
     Parameters: question_id - UUID of the problem
-    Dependencies: database connection
-    Returns: list of test cases or None if not found
+    Dependencies: catalog
+    Returns: problem dict (tests, version, ...) or None if not found
     """
     try:
-        cur.execute("""
-            SELECT test_cases FROM coding_problems WHERE problem_id = %s
-        """, (question_id,))
-        result = cur.fetchone()
-        if result:
-            return result[0]  # test_cases is stored as JSONB
-        return None
+        return catalog.get(question_id)
     except psycopg2.Error as e:
-        print(f"Error fetching test cases: {e}")
+        log.error("catalog_load_failed", error=str(e))
         return None
 
-def verify_solution(code, test_cases, tmpdir):
+def verify_solution(code, tests, timings=None, sandbox=None, entry_point=None):
     """
     Verify solution against test cases
     
-    Parameters: code, test_cases (list), tmpdir for temporary files
-    Dependencies: docker client
+    Parameters: code, tests - compiled TestSet or list of test case dicts,
+                timings - optional dict filled with sandbox setup, execution
+                and teardown seconds, sandbox - backend to run in, the Docker
+                pool by default, entry_point - function the problem declares,
+                see create_test_calls
+    Dependencies: sandbox_pool, test_packages
     Returns: dict with passed status and details
+
+    All test cases run in one sandbox; each case reports its own result,
+    resource usage and status (passed, wrong_answer, error, timeout, memory).
+    Answers are checked with the problem's comparator. Hidden cases report
+    only their status and resource usage.
     """
+    if not isinstance(tests, TestSet):
+        tests = compile_tests(tests)
     results = []
     all_passed = True
+
+    calls = create_test_calls(code, tests, entry_point)
+
+    try:
+        # Run tests in a pooled container unless the difficulty maps elsewhere
+        records = (sandbox or sandbox_pool).run_batch(code, calls, timings=timings)
+    except Exception as e:
+        records = [missing_case(i, str(e)) for i in range(len(tests.cases))]
     
-    for i, test_case in enumerate(test_cases):
-        test_input = test_case.get('input', {})
-        expected_output = str(test_case.get('expected_output', '')).strip()
-        
-        # Create test wrapper code
-        test_code = create_test_wrapper(code, test_input)
-        
-        code_path = os.path.join(tmpdir, f"test_{i}.py")
-        with open(code_path, "w") as f:
-            f.write(test_code)
+    for i, (case, record) in enumerate(zip(tests.cases, records)):
+        usage = {
+            "wall_time": record["elapsed"],
+            "cpu_time": record.get("cpu_time", 0.0),
+            "peak_memory_kb": record.get("peak_memory_kb", 0),
+            "exit_code": record["exit_code"]
+        }
+
+        if record.get("missing") or record["timed_out"] or record.get("status") == "not_run":
+            all_passed = False
+            results.append(test_result(i, case, record["exception"], False, record.get("status", "error"),
+                                       usage, error=True))
+            continue
         
-        try:
-            # Run test in container
-            if 'python:3.11-slim' not in client.images.list():
-                client.images.pull("python:3.11-slim")
-            
-            container = client.containers.create(
-                image="python:3.11-slim",
-                command=["python", "/app/solution.py"],
-                working_dir="/app",
-                mem_limit='128m',
-                nano_cpus=500_000_000,
-                network_disabled=True,
-                user=1000
-            )
-            
-            tar_stream = make_tarfile(code_path, "solution.py")
-            container.put_archive("/app", tar_stream)
-            
-            container.start()
-            exit_code = container.wait(timeout=5)
-            output = container.logs(stdout=True, stderr=True).decode().strip()
-            container.remove(force=True)
-            
-            # Check if output matches expected
-            passed = output == expected_output
-            if not passed:
-                all_passed = False
-            
-            results.append({
-                "test_case": i + 1,
-                "input": test_input,
-                "expected": expected_output,
-                "actual": output,
-                "passed": passed
-            })
-            
-        except Exception as e:
+        # Check if the answer matches expected
+        output = record["output"]
+        status = record.get("status", "ok")
+        passed = False
+        if status == "ok":
+            try:
+                passed = tests.compare(record.get("result"), output, case)
+            except Exception as e:
+                # A broken checker is the problem's fault, not the solution's
+                log.error("checker_failed", comparator=tests.comparator.get("type"), error=str(e))
+                status = "error"
+                output = f"Checker error: {e}"
+        if not passed:
             all_passed = False
-            results.append({
-                "test_case": i + 1,
-                "input": test_input,
-                "expected": expected_output,
-                "actual": str(e),
-                "passed": False,
-                "error": True
-            })
+        
+        if status == "ok":
+            status = "passed" if passed else "wrong_answer"
+        actual = comparators.display(record.get("result"), output) if status != "error" else output
+        results.append(test_result(i, case, actual, passed, status, usage))
     
     return {
         "passed": all_passed,
         "test_results": results,
-        "total_tests": len(test_cases),
+        "total_tests": len(tests.cases),
         "passed_tests": sum(1 for r in results if r["passed"])
     }
 
-def create_test_wrapper(user_code, test_input):
-    """
-    Create wrapper code to inject test inputs
-    
-    Parameters: user_code, test_input dict
-    Dependencies: None
-    Returns: wrapped code string
-    """
-    # Check if code uses functions or direct print
-    if "def " in user_code:
-        # Extract function name
-        import re
-        func_match = re.search(r'def\s+(\w+)\s*\(', user_code)
-        if func_match:
-            func_name = func_match.group(1)
-            # Build function call with inputs
-            if test_input:
-                # Convert input dict to function arguments
-                args = []
-                for key, value in test_input.items():
-                    if isinstance(value, str):
-                        args.append(f'"{value}"')
-                    else:
-                        args.append(str(value))
-                call_str = f"print({func_name}({', '.join(args)}))"
-            else:
-                call_str = f"print({func_name}())"
-            
-            return f"{user_code}\n\n{call_str}"
+def test_result(i, case, actual, passed, status, usage, error=False):
+    """
+    Result entry for one test case; hidden cases keep their input,
+    expected and actual output to themselves
+    """
+    result = {
+        "test_case": i + 1,
+        "input": None if case.hidden else case.input,
+        "expected": None if case.hidden else comparators.display_expected(case.expected, case.expected_value),
+        "actual": None if case.hidden else actual,
+        "passed": passed,
+        "status": status,
+        **usage
+    }
+    if case.hidden:
+        result["hidden"] = True
+    if error:
+        result["error"] = True
+    return result
+
+def create_test_calls(user_code, tests, entry_point=None):
+    """
+    Create the calls that pass each test case's inputs to the solution
     
-    # For print-based solutions, just return the code
-    return user_code
+    Parameters: user_code, tests - compiled TestSet, entry_point - function
+                the problem declares; without one the first function
+                defined in user_code is called
+    Dependencies: entry_point_of
+    Returns: list of {"entry", "args", "kwargs"} dicts for the sandbox
+             runner, or of "" for print-based solutions, which run on their
+             own
+    """
+    entry = entry_point or entry_point_of(user_code)
+    if entry is None:
+        return ["" for _ in tests.cases]
+    return tests.calls(entry)
+
+# Game room storage, indexed by player and socket. Set
+# ROOM_STORE_URL to a Redis URL to share rooms between workers and nodes.
+ROOM_STORE_URL = os.environ.get("ROOM_STORE_URL")
+room_registry = SharedRoomStore.from_url(ROOM_STORE_URL) if ROOM_STORE_URL else RoomRegistry()
+
+# Random games pair users of similar rating through a queue, kept with the
+# rooms in Redis when they are shared so users on any worker can be paired
+elo_ratings = EloRatings(db, k_factor=int(os.environ.get("ELO_K_FACTOR", 32)))
+matchmaker = (functools.partial(SharedMatchmaker, room_registry.r) if ROOM_STORE_URL else Matchmaker)(
+    rating=elo_ratings.rating,
+    on_match=lambda creator_id, opponent_id: room_registry.create(creator_id, is_random=True),
+    base_window=int(os.environ.get("MATCHMAKING_BASE_WINDOW", 50)),
+    widen_rate=int(os.environ.get("MATCHMAKING_WIDEN_RATE", 25)),
+    max_window=int(os.environ.get("MATCHMAKING_MAX_WINDOW", 1000)),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+def room_gauges():
+    """
+    Count rooms by status, and the players and spectators in them
+
+    Dependencies: room_registry
+    Returns: dict of gauge name -> value, rooms labelled by status
+    """
+    rooms = list(room_registry.all_rooms().values())
+    by_status = {}
+    for room in rooms:
+        by_status[(room.status,)] = by_status.get((room.status,), 0) + 1
+    return {
+        "active_rooms": by_status,
+        "active_players": sum(len(room.players) for room in rooms),
+        "active_spectators": sum(len(room.spectators) for room in rooms)
+    }
 
-# Game room storage
-game_rooms = {}
-# Socket ID to User ID mapping
-socket_to_user = {}
-# User ID to Socket ID mapping
-user_to_socket = {}
+# Gauges are read at scrape time; one room scan feeds all three room gauges
+metrics.gauges([
+    ("active_rooms", "Game rooms by status", ("status",)),
+    ("active_players", "Players in game rooms", ()),
+    ("active_spectators", "Spectators in game rooms", ())
+], room_gauges)
+metrics.gauge("connected_clients", "Open Socket.IO connections", lambda: room_registry.connection_count())
+metrics.gauge("matchmaking_queued", "Users waiting for a random game", lambda: matchmaker.stats()["queued"])
+metrics.gauge("judge_queue_depth", "Submissions waiting for a judge worker", lambda: judge_queue.stats()["queued"])
+metrics.gauge("judge_running", "Submissions being judged", lambda: judge_queue.stats()["running"])
+metrics.gauge("sandbox_idle_containers", "Warm sandbox containers ready for a run", lambda: sandbox_pool.stats()["idle"])
+metrics.gauge("db_pool_in_use", "Database connections checked out", lambda: db.stats()["in_use"])
+metrics.gauge("db_pool_utilization", "Fraction of the database pool checked out", lambda: db.stats()["utilization"])
+metrics.attach("judge_phase_duration_seconds", "Judge latency by phase",
+               {**judge_queue.latency, **sandbox_pool.latency}, "phase")
+metrics.attach("local_sandbox_phase_duration_seconds", "Local sandbox latency by phase",
+               local_sandbox.latency, "phase")
 
-def generate_room_code():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/api/create-room", methods=["POST"])
 def create_room():
@@ -630,7 +1028,7 @@ def create_room():
     Create a new game room
     
     Parameters: user_id from request JSON
-    Dependencies: generate_room_code function, game_rooms dict
+    Dependencies: room_registry
     Returns: JSON response with room_code
     """
     data = request.get_json()
@@ -640,37 +1038,16 @@ def create_room():
         return jsonify({"error": "User ID is required"}), 400
     
     # Check if user is already in a room
-    for room_code, room in game_rooms.items():
-        if user_id in room['players']:
-            return jsonify({"error": "You are already in a game room"}), 400
-    
-    room_code = generate_room_code()
-    
-    # Ensure unique room code
-    while room_code in game_rooms:
-        room_code = generate_room_code()
-    
-    game_rooms[room_code] = {
-        "creator": user_id,
-        "players": [user_id],
-        "sockets": {},  # Will be populated when user joins via socket
-        "spectators": [],
-        "spectator_sockets": {},
-        "health": {user_id: 100},
-        "code": {user_id: ""},
-        "questions_answered": {user_id: 0},
-        "questions_asked": [],  # Track question IDs already asked
-        "active_questions": {},  # Track active question per player
-        "status": "waiting",
-        "is_random": False,
-        "start_time": None
-    }
+    if room_registry.room_of(user_id):
+        return jsonify({"error": "You are already in a game room"}), 400
+    
+    room_code = room_registry.create(user_id)
     
     return jsonify({"room_code": room_code}), 201
 
 @app.route("/api/get_all_games", methods=["GET"])
 def get_all_games():
-    return jsonify(game_rooms)
+    return jsonify({room_code: room.to_dict() for room_code, room in room_registry.all_rooms().items()})
 
 @app.route("/api/find-random-game", methods=["POST"])
 def find_random_game():
@@ -678,10 +1055,11 @@ def find_random_game():
     Find random game
     
     Parameters: user_id from request JSON
-    Dependencies: generate_room_code function, game_rooms dict
-    Returns: JSON response with room_code
+    Dependencies: room_registry, matchmaker
+    Returns: JSON response with room_code once matched, otherwise queued
 
-    Will first look for open, random room. If no random room, make a new random room. If there is, join it.
+    Queues the user for an opponent of similar rating. If one is waiting the
+    pair gets a new room straight away; otherwise poll /api/matchmaking/status.
     """
     data = request.get_json()
     user_id = data.get("user_id")
@@ -690,41 +1068,54 @@ def find_random_game():
         return jsonify({"error": "User ID is required"}), 400
 
     # Check if user is already in a room
-    for room_code, room in game_rooms.items():
-        if user_id in room['players']:
-            return jsonify({"error": "You are already in a game room"}), 400
-
-    room_available = None
-
-    for game_room in game_rooms:
-        if game_rooms[game_room]["is_random"] and game_rooms[game_room]["status"] == "waiting":
-            room_available = game_room
-    
-    if room_available:
-        return jsonify({"created_game": False, "room_code": room_available})
-    else:
-        room_code = generate_room_code()
-        while room_code in game_rooms:
-            room_code = generate_room_code()
-        game_rooms[room_code] = {
-            "creator": user_id,
-            "players": [user_id],
-            "sockets": {},  # Will be populated when user joins via socket
-            "spectators": [],
-            "spectator_sockets": {},
-            "health": {user_id: 100},
-            "code": {user_id: ""},
-            "questions_answered": {user_id: 0},
-            "questions_asked": [],  # Track question IDs already asked
-            "active_questions": {},  # Track active question per player
-            "status": "waiting",
-            "is_random": True
-        }
-        return jsonify({"created_game": True, "room_code": room_code}), 201        
+    if room_registry.room_of(user_id):
+        return jsonify({"error": "You are already in a game room"}), 400
 
-    return jsonify({"error": "something bad happened"}), 400
+    try:
+        status = matchmaker.join(user_id)
+    except psycopg2.Error as e:
+        return jsonify({"error": str(e)}), 500
+    if status.get("queued"):
+        return jsonify(status), 202
+    return jsonify(status), 201 if status["created_game"] else 200
+
+@app.route("/api/matchmaking/status", methods=["GET"])
+def matchmaking_status():
+    """
+    Poll a queued random game request
 
-@socketio.on('connect')
+    Parameters: user_id from query string
+    Dependencies: matchmaker
+    Returns: JSON response with room_code once matched, otherwise queued
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    status = matchmaker.status(user_id)
+    if status is None:
+        return jsonify({"error": "Not in the matchmaking queue"}), 404
+    return jsonify(status), 200
+
+@app.route("/api/matchmaking/cancel", methods=["POST"])
+def matchmaking_cancel():
+    """
+    Leave the matchmaking queue
+
+    Parameters: user_id from request JSON
+    Dependencies: matchmaker
+    Returns: JSON response with whether the user was queued
+    """
+    user_id = request.get_json().get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    return jsonify({"cancelled": matchmaker.cancel(user_id)}), 200
+
+@app.route("/api/matchmaking-stats", methods=["GET"])
+def matchmaking_stats():
+    return jsonify({**matchmaker.stats(), **elo_ratings.stats()})
+
+@socket_event('connect')
 def handle_connect():
     """
     Handle new socket connections
@@ -733,182 +1124,181 @@ def handle_connect():
     Dependencies: request.sid from flask-socketio
     Returns: None (emits events)
     """
-    print(f"Client connected: {request.sid}")
-    connected_users.add(request.sid)
-    socketio.emit('player_count_update', {'count': len(connected_users)})
+    log.debug("client_connected", socket_id=request.sid)
+    count = room_registry.connection_opened(request.sid)
+    socketio.emit('player_count_update', {'count': count})
     emit('connected', {'socket_id': request.sid})
 
-@socketio.on('disconnect')
+@socket_event('disconnect')
 def handle_disconnect():
     """
     Handle socket disconnections and cleanup
     
     Parameters: None
-    Dependencies: socket_to_user, user_to_socket, game_rooms
+    Dependencies: room_registry
     Returns: None (emits events)
     """
     socket_id = request.sid
-    connected_users.discard(socket_id)  # Use discard to avoid KeyError
-    socketio.emit('player_count_update', {'count': len(connected_users)})
-    print(f"Client disconnected: {socket_id}")
+    count = room_registry.connection_closed(socket_id)
+    socketio.emit('player_count_update', {'count': count})
+    log.debug("client_disconnected", socket_id=socket_id)
     
-    # Find user associated with this socket
-    if socket_id in socket_to_user:
-        user_id = socket_to_user[socket_id]
+    # Find user and room associated with this socket
+    binding = room_registry.unbind_socket(socket_id)
+    if binding is None:
+        return
+    user_id, room_code = binding
+    room = room_registry.get(room_code)
+    if room is None:
+        return
+
+    # Check if user is a spectator first
+    if user_id in room.spectators:
+        # Remove spectator from room
+        log.info("spectator_disconnected", user_id=user_id, room_code=room_code)
+        room_registry.remove_spectator(room_code, user_id)
+        # Don't emit player_disconnected for spectators
         
-        # Clean up mappings
-        del socket_to_user[socket_id]
-        if user_id in user_to_socket:
-            del user_to_socket[user_id]
+    elif user_id in room.players:
+        # Remove actual player from room
+        log.info("player_disconnected", user_id=user_id, room_code=room_code)
+        code_sync.drop(room_code, user_id)
+        end_replay(room_code, "disconnected", {"user_id": user_id})
+        remaining_players = room_registry.remove_player(room_code, user_id)
         
-        # Find and update any game rooms the user was in
-        for room_code, room in list(game_rooms.items()):
-            # Check if user is a spectator first
-            if user_id in room['spectators']:
-                # Remove spectator from room
-                print(f"Spectator {user_id} left room {room_code}")
-                room['spectators'].remove(user_id)
-                if user_id in room['spectator_sockets']:
-                    del room['spectator_sockets'][user_id]
-                # Don't emit player_disconnected for spectators
-                
-            elif user_id in room['players']:
-                # Remove actual player from room
-                print(f"Player {user_id} disconnected from room {room_code}")
-                room['players'].remove(user_id)
-                if user_id in room['health']:
-                    del room['health'][user_id]
-                if user_id in room['code']:
-                    del room['code'][user_id]
-                if user_id in room['questions_answered']:
-                    del room['questions_answered'][user_id]
-                if user_id in room['active_questions']:
-                    del room['active_questions'][user_id]
-                if user_id in room['sockets']:
-                    del room['sockets'][user_id]
-                
-                # Clean up empty rooms
-                if len(room['players']) == 0:
-                    del game_rooms[room_code]
-                    print(f"Room {room_code} deleted - no players remaining")
-                else:
-                    # Only notify when actual players disconnect
-                    socketio.emit('player_disconnected', {
-                        'user_id': user_id,
-                        'remaining_players': room['players']
-                    }, room=room_code)
-                    room['status'] = 'waiting' # delete room?
-                
+        # Clean up empty rooms
+        if remaining_players is None:
+            log.info("room_deleted", room_code=room_code)
+            spectator_feed.drop(room_code)
+        else:
+            # Only notify when actual players disconnect
+            socketio.emit('player_disconnected', {
+                'user_id': user_id,
+                'remaining_players': remaining_players
+            }, room=room_code)
+            spectator_feed.set(room_code, 'players', remaining_players)
+            room_registry.set_status(room_code, 'waiting') # delete room?
+
+def build_spectator_snapshot(room):
+    """
+    Game state sent to spectators as they join
 
-@socketio.on('join_game')
+    Parameters: room - Room snapshot
+    Dependencies: get_usernames_for_ids
+    Returns: joined_as_spectator payload without spectators, which change
+             on every join and leave and so are added as it is sent
+    """
+    state = room.spectator_snapshot()
+    state['player_usernames'] = get_usernames_for_ids(room.player_ids())
+    return state
+
+@socket_event('join_game')
 def handle_join_game(data):
     """
     Handle player joining a game room via Socket.IO
     
     Parameters: data dict with room_code and user_id
-    Dependencies: game_rooms dict, socketio
+    Dependencies: room_registry, socketio
     Returns: None (emits events)
     """
     room_code = data.get('room_code')
     user_id = data.get('user_id')
     
-    if room_code not in game_rooms:
+    room = room_registry.get(room_code)
+    if room is None:
         emit('error', {'message': 'Invalid room code'})
         return
     
-    room = game_rooms[room_code]
-    
     socket_id = request.sid
+    # Update socket mappings
+    room_registry.bind_socket(socket_id, user_id, room_code)
 
-    if len(room['players']) >= 2:
+    # Taking a player slot is atomic; a full room turns the joiner into a spectator
+    player = None
+    if user_id in room.players or len(room.players) < 2:
+        # Stores the socket ID in the player's state
+        player = room_registry.add_player(room_code, user_id, socket_id)
+    if player is None:
         # spectate
-        room['spectators'].append(user_id)
-        room['spectator_sockets'][user_id] = socket_id
-        socket_to_user[socket_id] = user_id
-        user_to_socket[user_id] = socket_id
-    else:
-        # Update socket mappings
-        
-        socket_to_user[socket_id] = user_id
-        user_to_socket[user_id] = socket_id
-        
-        if user_id not in room['players']:
-            room['players'].append(user_id)
-            room['health'][user_id] = 100
-            room['code'][user_id] = ""
-            room['questions_answered'][user_id] = 0
-        
-        # Store socket ID in room
-        room['sockets'][user_id] = socket_id
+        room_registry.add_spectator(room_code, user_id, socket_id)
+    room = room_registry.get(room_code)
     
-    join_room(room_code)
-    print(f"User {user_id} (socket: {socket_id}) joined room {room_code}")
+    # Spectators get their own Socket.IO room, fed by spectator_feed
+    join_room(room_code if player is not None else spectator_room(room_code))
+    log.info("joined_room", user_id=user_id, socket_id=socket_id, room_code=room_code, spectator=player is None)
     
     # Notify all players in room
-    if len(room['players']) == 2:
-        room['status'] = 'ready'
-        room['start_time'] = time.time()
+    if len(room.players) == 2 and player is not None:
+        started_at = room_registry.start_game(room_code)
         
         # Get usernames for players
-        player_usernames = get_usernames_for_ids(room['players'])
+        player_usernames = get_usernames_for_ids(room.player_ids())
         
         socketio.emit('game_ready', {
-            'players': room['players'],
+            'players': room.player_ids(),
             'player_usernames': player_usernames,
-            'health': room['health'],
-            'started_at': room['start_time']
+            'health': room.health(),
+            'started_at': started_at
         }, room=room_code)
-    if user_id in room['spectators']:
-        # Get usernames for players
-        player_usernames = get_usernames_for_ids(room['players'])
-        
-        # Send current game state to spectator
-        emit('joined_as_spectator', {
-            'players': room['players'],
-            'player_usernames': player_usernames,
-            'health': room['health'],
-            'spectators': room['spectators'],
-            'code': room['code'],  # Send current code state
-            'active_questions': {
-                uid: {'title': q['title'], 'difficulty': q['difficulty']} 
-                for uid, q in room['active_questions'].items()
-            }
-        })
-    if len(room['players']) < 2:
+        spectator_feed.set(room_code, 'players', room.player_ids())
+        replay_recorder.begin(room_code, {"players": room.player_ids(), "player_usernames": player_usernames})
+    if player is None:
+        # Send current game state to spectator, built once per room change
+        snapshot = spectator_feed.snapshot(room_code, lambda: build_spectator_snapshot(room))
+        emit('joined_as_spectator', {**snapshot, 'spectators': list(room.spectators)})
+    if len(room.players) < 2:
         emit('waiting_for_player', {'room_code': room_code})
 
-@socketio.on('code_update')
+@socket_event('code_update')
 def handle_code_update(data):
     """
     Handle code editor updates from players
     
-    Parameters: data dict with room_code, user_id, and code
-    Dependencies: game_rooms dict, socketio
+    Parameters: data dict with room_code, user_id, and either code (full
+                snapshot) or base_version and patches (deltas)
+    Dependencies: room_registry, code_sync
+    Returns: None (code_sync emits batched opponent_code_update events)
+    """
+    room_code = data.get('room_code')
+    user_id = data.get('user_id')
+    
+    # Only allow players (not spectators) to update code
+    player = room_registry.get_player(room_code, user_id)
+    if player is not None:
+        code = code_sync.update(room_code, user_id, request.sid, data, player.code)
+        if code is not None:
+            room_registry.set_code(room_code, user_id, code)
+            spectator_feed.update(room_code, 'code', user_id, code)
+            # Deltas as sent keep the log small; snapshots are stored whole
+            if 'patches' in data:
+                replay_recorder.record(room_code, "patch", {"user_id": user_id, "base_version": data.get('base_version'), "patches": data['patches']})
+            else:
+                replay_recorder.record(room_code, "code", {"user_id": user_id, "code": code})
+
+@socket_event('request_code_sync')
+def handle_request_code_sync(data):
+    """
+    Send a full code snapshot to a client whose copy fell out of sync
+    
+    Parameters: data dict with room_code and user_id of the code's owner
+    Dependencies: room_registry, code_sync
     Returns: None (emits events)
     """
     room_code = data.get('room_code')
     user_id = data.get('user_id')
-    code = data.get('code')
     
-    if room_code in game_rooms:
-        room = game_rooms[room_code]
-        
-        # Only allow players (not spectators) to update code
-        if user_id in room['players']:
-            room['code'][user_id] = code
-            # Broadcast to all in room (including spectators)
-            socketio.emit('opponent_code_update', {
-                'user_id': user_id,
-                'code': code
-            }, room=room_code, skip_sid=request.sid)
+    player = room_registry.get_player(room_code, user_id)
+    if player is not None:
+        # The stored code covers streams owned by another worker
+        emit('opponent_code_update', code_sync.snapshot(room_code, user_id, player.code))
 
-@socketio.on('answered-question')
+@socket_event('answered-question')
 def handle_answered_question(data):
     """
     Handle player answering a question correctly
     
     Parameters: data dict with room_code, user_id, question, and correct
-    Dependencies: game_rooms dict, socketio
+    Dependencies: room_registry, socketio
     Returns: None (emits events)
     """
     room_code = data.get('room_code')
@@ -917,27 +1307,19 @@ def handle_answered_question(data):
     question_correct = data.get('correct', False)
     hard_mode = data.get('showImageOverlay')
     
-    if room_code not in game_rooms:
+    room = room_registry.get(room_code)
+    if room is None:
         return
-        
-    room = game_rooms[room_code]
+    player = room.players.get(user_id)
     
     # Verify player has an active question
-    if user_id not in room['active_questions']:
+    if player is None or player.active_question is None:
         emit('error', {'message': 'No active question to answer'})
         return
     
     question_difficulty = question.get("difficulty", "easy")
     dmg = 0
 
-    # Debug logging
-    print(f"=== Damage Calculation Debug ===")
-    print(f"User ID: {user_id}")
-    print(f"Question difficulty: {question_difficulty}")
-    print(f"Question correct: {question_correct}")
-    print(f"Hard mode received: {hard_mode}")
-    print(f"Hard mode type: {type(hard_mode)}")
-
     if question_correct:
         match (question_difficulty):
             case "easy":
@@ -949,29 +1331,18 @@ def handle_answered_question(data):
             case "_":
                 dmg = 0
 
-        print(f"Base damage: {dmg}")
-        
+        base_dmg = dmg
         if hard_mode:
-            original_dmg = dmg
             dmg = int(math.ceil(dmg * 1.1))
-            print(f"Hard mode active - damage boosted from {original_dmg} to {dmg}")
-        else:
-            print(f"Hard mode not active - damage remains {dmg}")
+        log.debug("damage_calculated", user_id=user_id, difficulty=question_difficulty,
+                  hard_mode=hard_mode, base_damage=base_dmg, damage=dmg)
         
         # Find opponent's user_id
-        opponent_id = None
-        for player_id in room['players']:
-            if player_id != user_id:
-                opponent_id = player_id
-                break
+        opponent_id = room.opponent_of(user_id)
         
-        if opponent_id:
-            # Track question answered
-            room['questions_answered'][user_id] += 1
-            
-            # Clear active question for this player
-            del room['active_questions'][user_id]
-            
+        # Track question answered and clear the active question; a repeated
+        # answer for the same question is ignored
+        if opponent_id and room_registry.record_answer(room_code, user_id):
             # Notify room that player answered
             socketio.emit("player_answered_question", {
                 "user_id": user_id,
@@ -979,160 +1350,88 @@ def handle_answered_question(data):
             }, room=room_code)
             
             # Update opponent's health in game state
-            room['health'][opponent_id] -= dmg
-            if room['health'][opponent_id] < 0:
-                room['health'][opponent_id] = 0
+            new_health = room_registry.apply_damage(room_code, opponent_id, dmg)
+            if new_health is None:
+                return
             
             # Emit health update to all players in room
             socketio.emit("update_player_health", {
                 "user_id": opponent_id,
                 "damage": dmg,
-                "new_health": room['health'][opponent_id]
+                "new_health": new_health
             }, room=room_code)
+            spectator_feed.update(room_code, 'health', opponent_id, new_health)
+            spectator_feed.update(room_code, 'active_questions', user_id, None)
+            replay_recorder.record(room_code, "damage", {"user_id": opponent_id, "by": user_id, "damage": dmg, "health": new_health})
             
-            # Check if game is over
-            if room['health'][opponent_id] <= 0:
-                # Save game to database
-                try:
-                    # Calculate game duration
-                    duration = int(time.time() - room['start_time']) if room['start_time'] else 0
-                    
-                    cur.execute("""
-                        INSERT INTO game_history 
-                        (room_code, player1_id, player2_id, winner_id,
-                         player1_questions_answered, player2_questions_answered,
-                         player1_final_health, player2_final_health, duration_seconds)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        room_code, 
-                        room['players'][0], 
-                        room['players'][1], 
-                        user_id,
-                        room['questions_answered'][room['players'][0]],
-                        room['questions_answered'][room['players'][1]],
-                        room['health'][room['players'][0]],
-                        room['health'][room['players'][1]],
-                        duration
-                    ))
-                    cur.execute(""" 
-                    UPDATE users 
-                    SET num_wins = num_wins + 1 
-                    WHERE user_id = %s """, (user_id,))
-                    conn.commit()
-                    print(f"Game saved to database: {room_code}, winner: {user_id}")
-                except psycopg2.Error as e:
-                    conn.rollback()
-                    print(f"Error saving game to database: {e}")
+            # Check if game is over; only the event that ends it records it
+            if new_health <= 0 and room_registry.finish(room_code):
+                room = room_registry.get(room_code)
+                record_match(room_code, room, user_id)
                 
                 # Game over - emit results
-                socketio.emit("game_over", {
+                results = {
                     "winner_id": user_id,
                     "loser_id": opponent_id,
-                    "questions_answered": room['questions_answered'],
-                    "final_health": room['health']
-                }, room=room_code)
-                room['status'] = 'finished'
+                    "questions_answered": room.questions_answered(),
+                    "final_health": room.health(),
+                    "replay_id": end_replay(room_code, "game_over", {"winner_id": user_id})
+                }
+                socketio.emit("game_over", results, room=room_code)
+                spectator_feed.finish(room_code, "game_over", results)
 
 
-@socketio.on('leave_game')
+@socket_event('leave_game')
 def handle_leave_game(data):
     """
     Handle player leaving a game room
     
     Parameters: data dict with room_code and user_id
-    Dependencies: game_rooms dict, socketio
+    Dependencies: room_registry, socketio
     Returns: None (emits events)
     """
     room_code = data.get('room_code')
     user_id = data.get('user_id')
     
-    if room_code in game_rooms:
-        room = game_rooms[room_code]
-        
+    room = room_registry.get(room_code)
+    if room is not None:
         # Save game to database if it's a 2-player game and someone is leaving
         # Only save if the game hasn't already been saved (i.e., not finished)
-        if len(room['players']) == 2 and user_id in room['players'] and room['status'] != 'finished':
+        if len(room.players) == 2 and user_id in room.players and room_registry.finish(room_code):
             # Determine winner (the player who didn't leave)
-            winner_id = room['players'][0] if room['players'][0] != user_id else room['players'][1]
+            winner_id = room.opponent_of(user_id)
             
-            try:
-                # Calculate game duration
-                duration = int(time.time() - room['start_time']) if room['start_time'] else 0
-                
-                cur.execute("""
-                    INSERT INTO game_history 
-                    (room_code, player1_id, player2_id, winner_id,
-                     player1_questions_answered, player2_questions_answered,
-                     player1_final_health, player2_final_health, duration_seconds)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    room_code, 
-                    room['players'][0], 
-                    room['players'][1], 
-                    winner_id,
-                    room['questions_answered'].get(room['players'][0], 0),
-                    room['questions_answered'].get(room['players'][1], 0),
-                    room['health'].get(room['players'][0], 0),
-                    room['health'].get(room['players'][1], 0),
-                    duration
-                ))
-                cur.execute(""" 
-                    UPDATE users 
-                    SET num_wins = num_wins + 1 
-                    WHERE user_id = %s """, (winner_id,))
-                conn.commit()
-                print(f"Game saved to database (player left early): {room_code}, winner: {winner_id}")
-            except psycopg2.Error as e:
-                conn.rollback()
-                print(f"Error saving game to database: {e}")
+            record_match(room_code, room, winner_id)
+            end_replay(room_code, "left", {"user_id": user_id, "winner_id": winner_id})
         
-        if user_id in room['players']:
+        if user_id in room.players:
             # Handle actual player leaving
-            room['players'].remove(user_id)
-            if user_id in room['health']:
-                del room['health'][user_id]
-            if user_id in room['code']:
-                del room['code'][user_id]
-            if user_id in room['questions_answered']:
-                del room['questions_answered'][user_id]
-            if user_id in room['active_questions']:
-                del room['active_questions'][user_id]
+            code_sync.drop(room_code, user_id)
+            remaining_players = room_registry.remove_player(room_code, user_id)
             
             # Clean up socket mappings
-            if user_id in user_to_socket:
-                socket_id = user_to_socket[user_id]
-                if socket_id in socket_to_user:
-                    del socket_to_user[socket_id]
-                del user_to_socket[user_id]
-            
-            if user_id in room['sockets']:
-                del room['sockets'][user_id]
+            room_registry.unbind_user(user_id)
                 
             leave_room(room_code)
             
-            if len(room['players']) == 0:
-                del game_rooms[room_code]
-                print(f"Room {room_code} deleted - no players remaining")
+            if remaining_players is None:
+                log.info("room_deleted", room_code=room_code)
+                spectator_feed.drop(room_code)
             else:
                 # Only emit player_left when an actual player leaves
                 socketio.emit('player_left', {'user_id': user_id}, room=room_code)
-                room['status'] = 'waiting'
+                spectator_feed.set(room_code, 'players', remaining_players)
+                room_registry.set_status(room_code, 'waiting')
                 
-        elif user_id in room['spectators']:
+        elif user_id in room.spectators:
             # Handle spectator leaving
-            print(f"Spectator {user_id} leaving room {room_code}")
-            room['spectators'].remove(user_id)
-            if user_id in room['spectator_sockets']:
-                del room['spectator_sockets'][user_id]
+            log.info("spectator_left", user_id=user_id, room_code=room_code)
+            room_registry.remove_spectator(room_code, user_id)
             
             # Clean up socket mappings for spectator
-            if user_id in user_to_socket:
-                socket_id = user_to_socket[user_id]
-                if socket_id in socket_to_user:
-                    del socket_to_user[socket_id]
-                del user_to_socket[user_id]
+            room_registry.unbind_user(user_id)
                 
-            leave_room(room_code)
+            leave_room(spectator_room(room_code))
             # Don't emit player_left for spectators - game continues normally
 
 if __name__ == "__main__":
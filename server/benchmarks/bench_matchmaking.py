@@ -0,0 +1,92 @@
+"""
+Matchmaking benchmark: pairing throughput and match latency
+
+Usage: python benchmarks/bench_matchmaking.py [queued user counts...]
+
+Queues N users whose ratings follow a normal spread, using a simulated
+clock so windows widen without waiting in real time, and sweeps once per
+simulated second until everyone is paired. Users either trickle in over
+ten seconds or all arrive at once, and a last run keeps N users queued
+whose ratings are too far apart to pair, the worst case for a sweep.
+Reports the CPU cost of join() and sweep(), pairs made per second of CPU,
+simulated wait until matched and the rating gap of the pairs made.
+"""
+import os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from matchmaking import Matchmaker
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+def bench(n, arrival_window=10.0, spacing=None, seed=1):
+    rng = random.Random(seed)
+    if spacing:
+        ratings = {f"user-{i}": i * spacing for i in range(n)}
+    else:
+        ratings = {f"user-{i}": rng.gauss(1200, 200) for i in range(n)}
+    clock = Clock()
+    matched_at = {}
+    matchmaker = Matchmaker(
+        rating=ratings.__getitem__,
+        on_match=lambda creator_id, opponent_id: matched_at.update({creator_id: clock.now, opponent_id: clock.now}) or "ROOM00",
+        spawn=lambda fn: None,
+        clock=clock
+    )
+
+    arrivals = sorted((rng.uniform(0, arrival_window), user_id) for user_id in ratings)
+    join_cpu, sweep_cpu = 0.0, 0.0
+    sweeps = 0
+    index = 0
+    while index < len(arrivals) or matchmaker.stats()["queued"]:
+        clock.now += 0.1
+        started = time.perf_counter()
+        while index < len(arrivals) and arrivals[index][0] <= clock.now:
+            matchmaker.join(arrivals[index][1])
+            index += 1
+        join_cpu += time.perf_counter() - started
+        if round(clock.now * 10) % 10 == 0:
+            started = time.perf_counter()
+            matchmaker.sweep()
+            sweep_cpu += time.perf_counter() - started
+            sweeps += 1
+        if clock.now > 600 or (spacing and sweeps >= 10):
+            break
+
+    arrived = {user_id: at for at, user_id in arrivals}
+    waits = [matched_at[user_id] - arrived[user_id] for user_id in matched_at]
+    stats = matchmaker.stats()
+    return {
+        "queued users": n,
+        "paired": len(matched_at),
+        "join us/op": join_cpu / n * 1e6,
+        "sweep ms/op": sweep_cpu / max(sweeps, 1) * 1e3,
+        "pairs/s cpu": stats["matches"] / (join_cpu + sweep_cpu),
+        "wait p50 s": percentile(waits, 0.5),
+        "wait p99 s": percentile(waits, 0.99),
+        "avg rating gap": stats["avg_rating_gap"]
+    }
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    scenarios = [
+        ("arriving over 10s", {}),
+        ("arriving at once", {"arrival_window": 0.0}),
+        ("unpairable, all waiting", {"arrival_window": 0.0, "spacing": 2000})
+    ]
+    for n in counts:
+        for label, options in scenarios:
+            print(f"\n{n} users {label}")
+            for name, value in bench(n, **options).items():
+                print(f"  {name:<16}{value:>12.2f}" if isinstance(value, float) else f"  {name:<16}{value:>12}")
+
+if __name__ == "__main__":
+    main()
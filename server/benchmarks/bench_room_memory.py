@@ -0,0 +1,97 @@
+"""
+Room memory benchmark: nested dict rooms vs slotted Room/PlayerState
+
+Usage: python benchmarks/bench_room_memory.py [room count] [repeat]
+
+Builds N two-player rooms mid-game (one active question each, a few
+questions asked, some code in both editors) once in the old nested dict
+layout and once as Room objects, and reports traced memory per room plus
+the time of the hot per-event operations (damage, opponent lookup).
+"""
+import os, sys, time, tracemalloc, uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rooms import PlayerState, Room
+
+CODE = "def solve(nums):\n    return sorted(nums)\n"
+
+def dict_room(creator, opponent):
+    # Layout game_rooms used before Room/PlayerState
+    return {
+        "creator": creator,
+        "players": [creator, opponent],
+        "sockets": {creator: f"sid-{creator}", opponent: f"sid-{opponent}"},
+        "spectators": [],
+        "spectator_sockets": {},
+        "health": {creator: 100, opponent: 100},
+        "code": {creator: CODE, opponent: CODE},
+        "questions_answered": {creator: 1, opponent: 0},
+        "questions_asked": ["1", "2", "3"],
+        "question_decks": {},
+        "active_questions": {
+            creator: {"problem_id": "2", "title": "Two Sum", "difficulty": "easy", "started_at": None},
+            opponent: {"problem_id": "3", "title": "Two Sum", "difficulty": "easy", "started_at": None}
+        },
+        "status": "ready",
+        "is_random": False,
+        "start_time": time.time()
+    }
+
+def slotted_room(creator, opponent):
+    room = Room(creator=creator, status="ready", start_time=time.time(),
+                questions_asked=["1", "2", "3"])
+    for user_id, answered, problem_id in ((creator, 1, "2"), (opponent, 0, "3")):
+        room.players[user_id] = PlayerState(
+            code=CODE, questions_answered=answered, socket_id=f"sid-{user_id}",
+            active_question={"problem_id": problem_id, "title": "Two Sum",
+                             "difficulty": "easy", "started_at": None})
+    return room
+
+def measure(build, pairs):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rooms = {str(i): build(a, b) for i, (a, b) in enumerate(pairs)}
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return rooms, used
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e9
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    # User ids are shared so only the room layout differs
+    pairs = [(uuid.uuid4().hex, uuid.uuid4().hex) for _ in range(n)]
+
+    dict_rooms, dict_bytes = measure(dict_room, pairs)
+    slot_rooms, slot_bytes = measure(slotted_room, pairs)
+
+    creator, opponent = pairs[0]
+    old, new = dict_rooms["0"], slot_rooms["0"]
+
+    def dict_damage():
+        opponent_id = None
+        for player_id in old["players"]:
+            if player_id != creator:
+                opponent_id = player_id
+                break
+        old["health"][opponent_id] -= 0
+        if old["health"][opponent_id] < 0:
+            old["health"][opponent_id] = 0
+
+    def slot_damage():
+        target = new.players[new.opponent_of(creator)]
+        target.health = max(target.health - 0, 0)
+
+    print(f"{n} rooms")
+    print(f"{'layout':12}{'bytes/room':>14}{'total MiB':>12}{'damage ns/op':>16}")
+    print(f"{'dict':12}{dict_bytes / n:14.0f}{dict_bytes / 2**20:12.2f}{timed(dict_damage, repeat):16.1f}")
+    print(f"{'slotted':12}{slot_bytes / n:14.0f}{slot_bytes / 2**20:12.2f}{timed(slot_damage, repeat):16.1f}")
+    print(f"saved {1 - slot_bytes / dict_bytes:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Room lookup benchmark: linear scans over game_rooms vs RoomRegistry indexes
+
+Usage: python benchmarks/bench_rooms.py [room counts...]
+
+Fills N rooms (half of them full, the rest waiting for an opponent) and
+times the checks create_room / handle_disconnect do, once as the old full
+scans over the rooms dict and once through the registry.
+Registry latency should stay flat as N grows.
+"""
+import os, sys, time, uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rooms import RoomRegistry
+
+def fill(n):
+    registry = RoomRegistry()
+    for i in range(n):
+        creator = uuid.uuid4().hex
+        room_code = registry.create(creator, is_random=i % 2 == 1)
+        registry.bind_socket(f"sid-{creator}", creator, room_code)
+        if i % 2 == 0:
+            opponent = uuid.uuid4().hex
+            registry.add_player(room_code, opponent)
+            registry.bind_socket(f"sid-{opponent}", opponent, room_code)
+    return registry
+
+def scan_user_room(rooms, user_id):
+    for room_code, room in rooms.items():
+        if user_id in room.players:
+            return room_code
+    return None
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+def bench(n, repeat=200):
+    registry = fill(n)
+    rooms = registry.rooms
+    newcomer = uuid.uuid4().hex
+    results = {
+        "already-in-room scan": timed(lambda: scan_user_room(rooms, newcomer), max(repeat // 10, 5)),
+        "already-in-room index": timed(lambda: registry.room_of(newcomer), repeat),
+    }
+
+    # Create, join, then disconnect both players of fresh rooms
+    def lifecycle():
+        creator, opponent = uuid.uuid4().hex, uuid.uuid4().hex
+        room_code = registry.create(creator)
+        registry.bind_socket("a", creator, room_code)
+        registry.add_player(room_code, opponent)
+        registry.bind_socket("b", opponent, room_code)
+        for socket_id in ("a", "b"):
+            user_id, code = registry.unbind_socket(socket_id)
+            registry.remove_player(code, user_id)
+    results["create/join/disconnect index"] = timed(lifecycle, repeat)
+    return results
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 50000]
+    rows = {n: bench(n) for n in counts}
+    names = list(next(iter(rows.values())))
+    print(f"{'operation (us/op)':32}" + "".join(f"{n:>12}" for n in counts))
+    for name in names:
+        print(f"{name:32}" + "".join(f"{rows[n][name]:12.2f}" for n in counts))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Sandbox benchmark: per-batch latency with and without the warm runner
+
+Usage: python benchmarks/bench_sandbox.py [batches] [cases per batch]
+
+Runs the same small batch repeatedly through a one-container SandboxPool
+on the local stand-in container (benchmarks/standins.py), once starting a
+fresh interpreter per batch and once through the container's forkserver,
+resetting the container between batches as the pool's worker would.
+Interpreter start-up is what the forkserver saves, so the difference shows
+up in the execution phase. Docker exec overhead is not included.
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import standins
+from sandbox import SandboxPool
+
+SOLUTION = "def add(a, b):\n    return a + b\n"
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+def bench(warm, batches, cases):
+    pool = SandboxPool(standins.LocalDockerClient(), size=1, max_uses=batches + 1, warm=warm)
+    container = pool._create()
+    # Give the forkserver time to create its FIFOs
+    time.sleep(0.5)
+    calls = [f"print(add({i}, {i}))" for i in range(cases)]
+    elapsed, execution = [], []
+    try:
+        for _ in range(batches):
+            pool._idle.append(container)
+            timings = {}
+            started = time.perf_counter()
+            records = pool.run_batch(SOLUTION, calls, timings=timings)
+            elapsed.append(time.perf_counter() - started)
+            execution.append(timings["execution"])
+            assert all(record["status"] == "ok" for record in records), records
+            pool._reset(pool._dirty.popleft())
+    finally:
+        container.remove(force=True)
+    return {
+        "batch p50 ms": percentile(elapsed, 0.5) * 1e3,
+        "batch p99 ms": percentile(elapsed, 0.99) * 1e3,
+        "execution avg ms": sum(execution) / len(execution) * 1e3
+    }
+
+def main():
+    batches = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    cases = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    for label, warm in (("fresh interpreter", False), ("warm forkserver", True)):
+        print(f"\n{batches} batches of {cases} cases, {label}")
+        for name, value in bench(warm, batches, cases).items():
+            print(f"  {name:<18}{value:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""
+Load test: simulated duels through the real HTTP and Socket.IO flow
+
+Usage: python benchmarks/loadtest.py [--duels N] [--spectators N]
+                                     [--rounds N] [--runs N] [--url URL]
+                                     [--save-baseline] [--tolerance F]
+
+Every simulated player runs the client's flow on its own thread:
+create-room (or find-random-game and the matchmaking poll), join_game,
+then rounds of get-question, code_update snapshot plus typed patches,
+submit-solution polled until judged, and answered-question, until the game
+is over; then leave_game. Spectators join each private room once the game
+is ready and watch until it ends.
+
+By default the server runs in-process on Flask and Flask-SocketIO test
+clients, with Postgres and Docker replaced by the stand-ins in
+standins.py, so only the server's own code is measured. --url drives a
+running server over the network instead (needs requests and
+python-socketio; socket latency is then the round trip to the ack).
+
+Reports count, p50, p99 and throughput per endpoint and event, as the
+median over --runs runs of the duels, since single runs vary by several
+times. With --save-baseline the results are stored in baselines/;
+otherwise they are compared with the stored baseline and the run fails
+if any p50, or any p99 of at least MIN_P99_SAMPLES samples, got slower
+by more than --tolerance and by more than NOISE_FLOOR_MS.
+"""
+import argparse, json, os, random, sys, tempfile, threading, time, uuid
+from collections import deque
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+BASELINE_DIR = os.path.join(HERE, "baselines")
+
+# Below this many samples a p99 is just the slowest one, too noisy to gate on
+MIN_P99_SAMPLES = 100
+
+# Every simulated client is a thread, as is the in-process server, so a
+# request can wait a few GIL switch intervals for its turn; slowdowns up to
+# this many milliseconds are scheduling, not the server's code
+NOISE_FLOOR_MS = 5 * sys.getswitchinterval() * 1000
+
+class Recorder:
+    """
+    Latencies per operation and event counts, shared by every simulated
+    client
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def timed(self, op, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            raise
+        finally:
+            self.add(op, time.perf_counter() - started)
+
+    def add(self, op, seconds):
+        with self._lock:
+            self.samples.setdefault(op, []).append(seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def report(self, elapsed):
+        """
+        Returns: dict of op -> {count, errors, p50_ms, p99_ms, per_second}
+        """
+        results = {}
+        for op, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            results[op] = {
+                "count": len(samples),
+                "errors": self.errors.get(op, 0),
+                "p50_ms": samples[len(samples) // 2] * 1000,
+                "p99_ms": samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000,
+                "per_second": len(samples) / elapsed
+            }
+        return results
+
+class LocalClient:
+    """
+    One simulated user on the in-process server's test clients
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.http = server.app.test_client()
+        self.socket = None
+
+    def request(self, method, path, body=None):
+        response = self.http.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+    def connect(self):
+        self.socket = self.server.socketio.test_client(self.server.app, flask_test_client=self.http)
+
+    def emit(self, event, data):
+        # The test client runs the handler before returning
+        self.socket.emit(event, data)
+
+    def received(self):
+        return [(packet["name"], packet["args"][0] if packet["args"] else None)
+                for packet in self.socket.get_received()]
+
+    def disconnect(self):
+        if self.socket is not None and self.socket.is_connected():
+            self.socket.disconnect()
+
+class RemoteClient:
+    """
+    One simulated user against a running server
+    """
+
+    def __init__(self, url):
+        import requests, socketio
+        self.url = url.rstrip("/")
+        self.http = requests.Session()
+        self.socket = socketio.Client()
+        self._events = deque()
+        self.socket.on("*", lambda event, data=None: self._events.append((event, data)))
+
+    def request(self, method, path, body=None):
+        response = self.http.request(method, self.url + path, json=body, timeout=30)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def connect(self):
+        self.socket.connect(self.url, transports=["websocket"])
+
+    def emit(self, event, data):
+        # Waiting for the ack makes the latency cover the handler
+        self.socket.call(event, data, timeout=30)
+
+    def received(self):
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+    def disconnect(self):
+        self.socket.disconnect()
+
+class Player:
+    """
+    Simulated player or spectator following the client's flow
+    """
+
+    def __init__(self, client, user_id, recorder, options, rng):
+        self.client = client
+        self.user_id = user_id
+        self.recorder = recorder
+        self.options = options
+        self.rng = rng
+        self.events = []
+
+    def request(self, method, path, body=None, op=None):
+        status, data = self.recorder.timed(op or f"{method} {path}", self.client.request, method, path, body)
+        return status, data or {}
+
+    def emit(self, event, data):
+        self.recorder.timed(f"emit {event}", self.client.emit, event, data)
+
+    def poll(self):
+        self.events.extend(self.client.received())
+        return self.events
+
+    def seen(self, event):
+        return any(name == event for name, _ in self.poll())
+
+    def wait_for(self, event, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not self.seen(event):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{self.user_id} never received {event}")
+            time.sleep(0.005)
+
+    def find_random_room(self):
+        status, data = self.request("POST", "/api/find-random-game", {"user_id": self.user_id})
+        started = time.perf_counter()
+        while data.get("queued"):
+            time.sleep(0.05)
+            status, data = self.request("GET", f"/api/matchmaking/status?user_id={self.user_id}",
+                                        op="GET /api/matchmaking/status")
+        self.recorder.add("matchmaking wait", time.perf_counter() - started)
+        return data["room_code"]
+
+    def play(self, room_code, problems, on_ready=None):
+        self.client.connect()
+        self.emit("join_game", {"room_code": room_code, "user_id": self.user_id})
+        self.wait_for("game_ready")
+        if on_ready is not None:
+            on_ready()
+
+        for _ in range(self.options.rounds):
+            if self.seen("game_over"):
+                break
+            difficulty = self.rng.choice(["easy", "medium", "hard"])
+            status, question = self.request("POST", "/api/get-question", {
+                "room_code": room_code, "difficulty": difficulty, "user_id": self.user_id
+            })
+            if status != 200:
+                break
+            self.type_solution(room_code, problems[question["title"]])
+            if self.submit(room_code, question, problems[question["title"]]):
+                self.emit("answered-question", {
+                    "room_code": room_code,
+                    "user_id": self.user_id,
+                    "question": {"difficulty": difficulty},
+                    "correct": True,
+                    "showImageOverlay": False
+                })
+
+        self.emit("leave_game", {"room_code": room_code, "user_id": self.user_id})
+        self.client.disconnect()
+
+    def type_solution(self, room_code, problem):
+        code = problem["solution_template"]
+        self.emit("code_update", {"room_code": room_code, "user_id": self.user_id, "code": code})
+        version = 1
+        solution = problem["solution"]
+        chunk = max(1, len(solution) // self.options.patches)
+        for offset in range(0, len(solution), chunk):
+            text = solution[offset:offset + chunk]
+            self.emit("code_update", {
+                "room_code": room_code,
+                "user_id": self.user_id,
+                "base_version": version,
+                "patches": [{"offset": len(code), "length": 0, "text": text}]
+            })
+            code += text
+            version += 1
+
+    def submit(self, room_code, question, problem):
+        # A unique comment keeps every submission out of the verdict cache
+        code = f"{problem['solution']}# {self.user_id} {uuid.uuid4().hex}\n"
+        started = time.perf_counter()
+        status, job = self.request("POST", "/api/submit-solution", {
+            "code": code, "question_id": question["problem_id"], "room_code": room_code, "user_id": self.user_id
+        })
+        if status != 202:
+            return False
+        while True:
+            time.sleep(0.01)
+            status, result = self.request("GET", f"/api/submission/{job['job_id']}", op="GET /api/submission/<job_id>")
+            if result.get("status") == "finished":
+                self.recorder.add("judge round trip", time.perf_counter() - started)
+                return bool(result["verdict"].get("passed"))
+
+    def spectate(self, room_code, game_done):
+        self.client.connect()
+        self.emit("join_game", {"room_code": room_code, "user_id": self.user_id})
+        game_done.wait(timeout=120)
+        self.poll()
+        for name, _ in self.events:
+            self.recorder.count(f"spectator received {name}")
+        self.emit("leave_game", {"room_code": room_code, "user_id": self.user_id})
+        self.client.disconnect()
+
+def run_duel(index, make_client, recorder, options, problems, failures):
+    """
+    One duel: a private room with spectators for even indexes, a pair of
+    matchmaking players for odd ones
+    """
+    rng = random.Random(index)
+    users = [str(uuid.uuid4()) for _ in range(2 + options.spectators)]
+    players = [Player(make_client(), user_id, recorder, options, rng) for user_id in users]
+    private = index % 2 == 0
+    room = {}
+    room_ready, game_ready, game_done = threading.Event(), threading.Event(), threading.Event()
+
+    def creator():
+        if private:
+            status, data = players[0].request("POST", "/api/create-room", {"user_id": users[0]})
+            room["code"] = data["room_code"]
+        else:
+            room["code"] = players[0].find_random_room()
+        room_ready.set()
+        players[0].play(room["code"], problems, on_ready=game_ready.set)
+
+    def opponent():
+        if private:
+            room_ready.wait(timeout=30)
+            code = room["code"]
+        else:
+            # May be matched with another duel's player; it plays wherever it lands
+            code = players[1].find_random_room()
+        players[1].play(code, problems)
+
+    def spectator(player):
+        # Joining once both players are in keeps the player slots free
+        game_ready.wait(timeout=30)
+        player.spectate(room["code"], game_done)
+
+    def guard(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            failures.append(f"duel {index}: {type(e).__name__}: {e}")
+        finally:
+            if fn is creator:
+                room_ready.set()
+                game_ready.set()
+                game_done.set()
+
+    threads = [threading.Thread(target=guard, args=(creator,)), threading.Thread(target=guard, args=(opponent,))]
+    if private:
+        threads += [threading.Thread(target=guard, args=(spectator, player)) for player in players[2:]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def start_local_server(options):
+    from standins import LocalDatabase, install
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ.setdefault("SOCKETIO_ASYNC_MODE", "threading")
+    os.environ.setdefault("REPLAY_DIR", os.path.join(scratch, "replays"))
+    os.environ.setdefault("MATCH_WRITER_SPILL_PATH", os.path.join(scratch, "match_results.spill"))
+    os.environ.setdefault("MATCH_WRITER_DEAD_LETTER_PATH", os.path.join(scratch, "match_results.rejected"))
+    os.environ.setdefault("SANDBOX_POOL_SIZE", str(options.sandboxes))
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    install(LocalDatabase())
+    import app as server
+    server.sandbox_pool.warmup()
+    return server
+
+def combine(reports):
+    """
+    Merge the reports of several runs: counts and errors add up, latencies
+    and throughput are the median over the runs that saw the operation
+
+    Returns: dict of op -> {count, errors, p50_ms, p99_ms, per_second}
+    """
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    results = {}
+    for op in sorted({op for report in reports for op in report}):
+        runs = [report[op] for report in reports if op in report]
+        results[op] = {
+            "count": sum(run["count"] for run in runs),
+            "errors": sum(run["errors"] for run in runs),
+            **{key: median(run[key] for run in runs) for key in ("p50_ms", "p99_ms", "per_second")}
+        }
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Returns: list of regressions, ops slower than baseline by more than tolerance
+    """
+    regressions = []
+    for op, result in results.items():
+        before = baseline.get(op)
+        # Matchmaking wait depends on arrival order more than on the server
+        if before is None or op == "matchmaking wait":
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if key == "p99_ms" and min(result["count"], before["count"]) < MIN_P99_SAMPLES:
+                continue
+            if result[key] > max(before[key] * (1 + tolerance), before[key] + NOISE_FLOOR_MS):
+                regressions.append(f"{op} {key}: {before[key]:.2f} -> {result[key]:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the duel server")
+    parser.add_argument("--duels", type=int, default=20, help="concurrent duels")
+    parser.add_argument("--spectators", type=int, default=2, help="spectators per private duel")
+    parser.add_argument("--rounds", type=int, default=10, help="questions per player at most")
+    parser.add_argument("--patches", type=int, default=8, help="code_update patches per solution")
+    parser.add_argument("--runs", type=int, default=5, help="runs of the duels, reported as their median")
+    parser.add_argument("--sandboxes", type=int, default=4, help="warm sandboxes for the local server")
+    parser.add_argument("--url", help="drive a running server instead of an in-process one")
+    parser.add_argument("--baseline", help="baseline file (default: baselines/loadtest-<mode>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown before failing, 0.5 = 50%%")
+    options = parser.parse_args()
+
+    # A remote server must have the same problems seeded to be judged correct
+    from standins import PROBLEMS
+    if options.url:
+        make_client = lambda: RemoteClient(options.url)
+    else:
+        server = start_local_server(options)
+        make_client = lambda: LocalClient(server)
+    problems = {problem["title"]: problem for problem in PROBLEMS}
+
+    reports, counts, failures = [], {}, []
+    started = time.perf_counter()
+    for _ in range(options.runs):
+        recorder = Recorder()
+        run_started = time.perf_counter()
+        threads = [threading.Thread(target=run_duel, args=(i, make_client, recorder, options, problems, failures))
+                   for i in range(options.duels)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reports.append(recorder.report(time.perf_counter() - run_started))
+        for name, count in recorder.counts.items():
+            counts[name] = counts.get(name, 0) + count
+    elapsed = time.perf_counter() - started
+
+    results = combine(reports)
+    print(f"{options.duels} duels x {options.runs} runs, {options.spectators} spectators per private duel, "
+          f"{elapsed:.1f}s\n")
+    print(f"{'operation':<36}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'per s':>10}")
+    for op, result in results.items():
+        print(f"{op:<36}{result['count']:>8}{result['errors']:>8}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['per_second']:>10.1f}")
+    for name, count in sorted(counts.items()):
+        print(f"{name:<36}{count:>8}")
+    for failure in failures:
+        print(f"FAILED {failure}")
+
+    path = options.baseline or os.path.join(BASELINE_DIR, f"loadtest-{'remote' if options.url else 'local'}.json")
+    if options.save_baseline:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"options": {key: value for key, value in vars(options).items() if "baseline" not in key},
+                       "results": results, "counts": counts}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {path}")
+    elif os.path.exists(path):
+        with open(path) as f:
+            regressions = compare(results, json.load(f)["results"], options.tolerance)
+        print(f"\nCompared with {path}: {len(regressions)} regressions")
+        for regression in regressions:
+            print(f"  {regression}")
+        if regressions:
+            sys.exit(1)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
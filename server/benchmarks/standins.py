@@ -0,0 +1,236 @@
+"""
+Local stand-ins for Postgres and Docker used by the load test
+
+LocalDatabase answers the statements the game flow issues from memory;
+LocalDockerClient runs sandbox batches as local subprocesses in a scratch
+directory. install() swaps them in before app.py is imported, so the real
+handlers, registry, judge queue and sandbox pool run unchanged on top.
+
+These run simulated players' own solutions, never user code - do not
+point them at anything else.
+"""
+import os, shutil, subprocess, sys, tarfile, tempfile, threading, uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Seeded problems, each with the solution simulated players submit
+PROBLEMS = [
+    {
+        "title": "Add Two Numbers",
+        "difficulty": "easy",
+        "description": "Return a + b.",
+        "solution_template": "def add(a, b):\n    pass\n",
+        "solution": "def add(a, b):\n    return a + b\n",
+        "test_cases": [{"input": {"a": a, "b": b}, "expected_output": str(a + b)} for a, b in [(1, 2), (5, 7), (-3, 3)]]
+    },
+    {
+        "title": "Reverse a String",
+        "difficulty": "medium",
+        "description": "Return s reversed.",
+        "solution_template": "def reverse(s):\n    pass\n",
+        "solution": "def reverse(s):\n    return s[::-1]\n",
+        "test_cases": [{"input": {"s": s}, "expected_output": s[::-1]} for s in ["abc", "racecar", "duel"]]
+    },
+    {
+        "title": "Nth Fibonacci",
+        "difficulty": "hard",
+        "description": "Return the nth Fibonacci number.",
+        "solution_template": "def fib(n):\n    pass\n",
+        "solution": "def fib(n):\n    a, b = 0, 1\n    for _ in range(n):\n        a, b = b, a + b\n    return a\n",
+        "test_cases": [{"input": {"n": n}, "expected_output": str(f)} for n, f in [(1, 1), (10, 55), (30, 832040)]]
+    }
+]
+
+class LocalCursor:
+    """
+    Cursor over LocalDatabase; rows are matched by statement shape
+    """
+
+    class _Connection:
+        encoding = "UTF8"
+
+    def __init__(self, db):
+        self.db = db
+        self.connection = self._Connection()
+        self._rows = []
+        self._values = []  # rows mogrified by execute_values for the next execute
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args):
+        self._values.append(tuple(args))
+        return b"(?)"
+
+    def execute(self, sql, params=None):
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        statement = " ".join(sql.split())
+        values, self._values = self._values, []
+        self._rows = self.db.run(statement, params, values)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+class LocalDatabase:
+    """
+    In-memory stand-in for db.Database
+
+    Parameters: users - dict of user_id -> username, problems - list of
+                problem dicts as in PROBLEMS
+    """
+
+    def __init__(self, users=None, problems=PROBLEMS):
+        self.users = {user_id: {"username": username, "num_wins": 0} for user_id, username in (users or {}).items()}
+        self.problems = [dict(problem, problem_id=str(uuid.uuid4())) for problem in problems]
+        self.game_history = []
+        self.statements = Counter()
+        self.unknown = Counter()
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    @contextmanager
+    def cursor(self):
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield LocalCursor(self)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+
+    def run(self, statement, params, values):
+        with self._lock:
+            if statement.startswith("SELECT problem_id, updated_on, hidden_tests"):
+                self.statements["problem stamps"] += 1
+                return [(p["problem_id"], 0, None) for p in self.problems]
+            if statement.startswith("SELECT problem_id, updated_on, title"):
+                self.statements["load problems"] += 1
+                return [(p["problem_id"], 0, p["title"], p["description"], p["difficulty"], p["test_cases"],
+                         p["solution_template"], None, None) for p in self.problems if p["problem_id"] in params[0]]
+            if statement.startswith("SELECT user_id, username FROM users WHERE user_id IN"):
+                self.statements["usernames"] += 1
+                return [(user_id, self.users[user_id]["username"]) for user_id in params if user_id in self.users]
+            if statement.startswith("SELECT user_id, username, num_wins FROM users"):
+                self.statements["load leaderboard"] += 1
+                return [(user_id, user["username"], user["num_wins"]) for user_id, user in self.users.items()]
+            if statement.startswith("SELECT player1_id, player2_id, winner_id FROM game_history"):
+                self.statements["load ratings"] += 1
+                return [(game[1], game[2], game[3]) for game in self.game_history]
+            if statement.startswith("INSERT INTO game_history"):
+                self.statements["insert games"] += 1
+                self.game_history.extend(values)
+                return []
+            if statement.startswith("UPDATE users SET num_wins"):
+                self.statements["update wins"] += 1
+                for user_id, wins in values:
+                    if user_id in self.users:
+                        self.users[user_id]["num_wins"] += wins
+                return []
+            self.unknown[statement[:60]] += 1
+            return []
+
+    def stats(self):
+        return {"min": 0, "max": 0, "in_use": self.in_use, "utilization": 0.0, "checkouts": 0,
+                "checkout_wait_avg": 0.0, "reconnects": 0}
+
+    def close(self):
+        pass
+
+class LocalContainer:
+    """
+    Scratch directory standing in for a sandbox container; only the
+    `timeout ...` run and the detached forkserver are executed, anything
+    else (the pool's reset commands) just wipes the directory except for
+    the forkserver's
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.root = tempfile.mkdtemp(prefix="sandbox-")
+        self.forkserver = None
+
+    def start(self):
+        pass
+
+    def put_archive(self, path, data):
+        # /app and / both land in the scratch directory
+        with tarfile.open(fileobj=data) as tar:
+            tar.extractall(self.root)
+
+    def exec_run(self, command, workdir=None, user=None, demux=False, detach=False):
+        if detach:
+            # The forkserver; its children stay the current user, who owns the FIFOs
+            argv = [self._local(arg) for arg in command]
+            for option in ("--user", "--group"):
+                if option in argv:
+                    del argv[argv.index(option):argv.index(option) + 2]
+            self.forkserver = subprocess.Popen(argv, cwd=self.root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return None
+        if command[0] != "timeout":
+            for name in os.listdir(self.root):
+                if name == "forkserver":
+                    continue
+                path = os.path.join(self.root, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            return (0, (b"", b"")) if demux else (0, b"")
+        argv = [self._local(arg) for arg in command]
+        result = subprocess.run(argv, cwd=self.root, capture_output=True)
+        # timeout -s KILL reports a killed run as 128 + SIGKILL, as in the container
+        exit_code = 137 if result.returncode == -9 else result.returncode
+        return exit_code, (result.stdout, result.stderr)
+
+    def remove(self, force=False):
+        if self.forkserver is not None:
+            self.forkserver.kill()
+            self.forkserver.wait()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _local(self, arg):
+        if arg == "python":
+            return sys.executable
+        arg = arg.replace("exec python ", f"exec {sys.executable} ")
+        arg = arg.replace("/tmp/runner.err", os.path.join(self.root, "runner.err"))
+        return arg.replace("/forkserver", os.path.join(self.root, "forkserver")).replace("/app", self.root)
+
+class LocalDockerClient:
+    class _Image:
+        id = "local"
+        attrs = {"RepoDigests": []}
+
+    class _Images:
+        def get(self, name):
+            return LocalDockerClient._Image()
+
+        def pull(self, name):
+            return LocalDockerClient._Image()
+
+    class _Containers:
+        def create(self, **kwargs):
+            return LocalContainer()
+
+    def __init__(self):
+        self.images = self._Images()
+        self.containers = self._Containers()
+
+def install(db):
+    """
+    Make app.py use db and local sandboxes; call before importing app
+
+    Parameters: db - LocalDatabase
+    """
+    import docker
+    import db as db_module
+    import catalog
+
+    docker.from_env = lambda: LocalDockerClient()
+    db_module.Database = lambda **kwargs: db
+    # LISTEN needs a real Postgres; load the catalog once instead
+    catalog.ProblemCatalog.listen = lambda self, **kwargs: self.load()
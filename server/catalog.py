@@ -0,0 +1,224 @@
+import os, random, select, threading, time
+import psycopg2
+from test_packages import compile_tests, entry_signature, file_signature
+from logs import get_logger
+
+log = get_logger()
+
+# Channel the coding_problems trigger in db/init.sql notifies on
+CATALOG_CHANNEL = "coding_problems_changed"
+
+def entry_point(source):
+    """
+    Returns: name of the first top-level function defined in source, or
+             None if it defines none or does not parse
+    """
+    return entry_signature(source)[0]
+
+class ProblemCatalog:
+    """
+    In-memory copy of coding_problems indexed by problem_id and difficulty
+
+    Loaded once from the database and swapped wholesale on reload, so reads
+    never touch Postgres. Reloads happen on invalidate() or when the
+    coding_problems trigger sends a NOTIFY, and are incremental: only rows
+    whose updated_on or hidden test file changed are fetched and have their
+    tests compiled again, the rest keep their compiled TestSet.
+
+    Parameters: db - Database used for loading, tests_dir - where hidden
+                test files named by coding_problems.hidden_tests live
+    """
+
+    def __init__(self, db, tests_dir="problem_tests"):
+        self.db = db
+        self.tests_dir = tests_dir
+        self._by_id = {}
+        self._by_difficulty = {}
+        self._stamps = {}  # problem_id -> (updated_on, hidden test file signature)
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._listener = None
+        self._callbacks = []
+        self.loads = 0
+        self.compiled = 0
+
+    def load(self):
+        """
+        (Re)load problems that changed since the last load
+
+        Dependencies: db, test_packages
+        Returns: number of problems loaded
+        """
+        with self._lock:
+            old_by_id, old_stamps = self._by_id, self._stamps
+
+        with self.db.cursor() as cur:
+            cur.execute("SELECT problem_id, updated_on, hidden_tests FROM coding_problems")
+            stamps = {str(problem_id): (updated_on, self._signature(hidden_tests))
+                      for problem_id, updated_on, hidden_tests in cur.fetchall()}
+            stale = [problem_id for problem_id, stamp in stamps.items()
+                     if problem_id not in old_by_id or old_stamps.get(problem_id) != stamp]
+            rows = []
+            if stale:
+                cur.execute("""
+                    SELECT problem_id, updated_on, title, description, difficulty, test_cases,
+                           solution_template, comparator, hidden_tests
+                    FROM coding_problems
+                    WHERE problem_id = ANY(%s::uuid[])
+                """, (stale,))
+                rows = cur.fetchall()
+
+        by_id = {problem_id: old_by_id[problem_id] for problem_id in stamps
+                 if problem_id in old_by_id and old_stamps.get(problem_id) == stamps[problem_id]}
+        compiled = 0
+        for row in rows:
+            problem_id = str(row[0])
+            try:
+                by_id[problem_id] = self._compile(row)
+            except (OSError, ValueError, SyntaxError) as e:
+                log.error("problem_tests_invalid", problem_id=str(problem_id), error=str(e))
+                # Keep judging with the previous version until it is fixed
+                if problem_id in old_by_id:
+                    by_id[problem_id] = old_by_id[problem_id]
+                stamps[problem_id] = old_stamps.get(problem_id)
+                continue
+            stamps[problem_id] = (row[1], self._signature(row[8]))
+            compiled += 1
+        by_difficulty = {}
+        for problem_id, problem in by_id.items():
+            by_difficulty.setdefault(problem["difficulty"], []).append(problem_id)
+
+        # Swap both indexes at once so readers never see a half-built catalog
+        with self._lock:
+            self._by_id, self._by_difficulty = by_id, by_difficulty
+            self._stamps = stamps
+            self._loaded = True
+            self.loads += 1
+            self.compiled += compiled
+        log.info("catalog_loaded", problems=len(by_id), compiled=compiled)
+
+        # Report problems whose test cases changed or that were removed
+        changed = [pid for pid, problem in old_by_id.items()
+                   if pid not in by_id or by_id[pid]["version"] != problem["version"]]
+        if changed:
+            for callback in self._callbacks:
+                callback(changed)
+        return len(by_id)
+
+    def _signature(self, hidden_tests):
+        return file_signature(os.path.join(self.tests_dir, hidden_tests)) if hidden_tests else None
+
+    def _compile(self, row):
+        problem_id, _, title, description, difficulty, test_cases, solution_template, comparator, hidden_tests = row
+        entry, parameters = entry_signature(solution_template)
+        tests = compile_tests(test_cases, comparator,
+                              os.path.join(self.tests_dir, hidden_tests) if hidden_tests else None,
+                              parameters)
+        return {
+            "problem_id": str(problem_id),
+            "title": title,
+            "description": description,
+            "difficulty": difficulty,
+            "test_cases": test_cases,
+            "tests": tests,
+            "version": tests.version,
+            "solution_template": solution_template,
+            # Function the tests call, as declared by the template
+            "entry_point": entry
+        }
+
+    def on_change(self, callback):
+        """
+        Register callback(problem_ids) for problems whose test cases changed
+        """
+        self._callbacks.append(callback)
+
+    def invalidate(self):
+        """
+        Reload after coding_problems changed
+        """
+        self.load()
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get(self, problem_id):
+        """
+        Returns: problem dict or None if unknown
+        """
+        self.ensure_loaded()
+        return self._by_id.get(str(problem_id))
+
+    def draw(self, difficulty, questions_asked, decks):
+        """
+        Pick a random problem of a difficulty that has not been asked yet
+
+        Each room keeps a shuffled deck per difficulty built from the problems
+        not in questions_asked; drawing pops from it, so picks are amortized
+        O(1). Once a difficulty is exhausted its ids are removed from
+        questions_asked and the deck is rebuilt from every problem.
+
+        Parameters: difficulty, questions_asked - room's list of asked ids,
+                    decks - room's dict of difficulty to deck
+        Returns: problem dict, or None if there are no problems of difficulty
+        """
+        self.ensure_loaded()
+        by_id, by_difficulty = self._by_id, self._by_difficulty
+        deck = decks.get(difficulty)
+
+        for _ in range(2):
+            if not deck:
+                asked = set(questions_asked)
+                deck = [pid for pid in by_difficulty.get(difficulty, []) if pid not in asked]
+                if not deck:
+                    # Every question of this difficulty has been asked - start over
+                    questions_asked[:] = [pid for pid in questions_asked
+                                          if by_id.get(pid, {}).get("difficulty") != difficulty]
+                    deck = list(by_difficulty.get(difficulty, []))
+                random.shuffle(deck)
+                decks[difficulty] = deck
+
+            while deck:
+                problem = by_id.get(deck.pop())
+                # Skip problems removed or moved since the deck was built
+                if problem is not None and problem["difficulty"] == difficulty:
+                    return problem
+        return None
+
+    def listen(self, **connect_kwargs):
+        """
+        Start a background LISTEN on coding_problems changes
+
+        Parameters: connect kwargs for a dedicated psycopg2 connection
+        """
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._run_listener, kwargs=connect_kwargs,
+                                              name="catalog-listener", daemon=True)
+            self._listener.start()
+
+    def _run_listener(self, **connect_kwargs):
+        delay = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**connect_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CATALOG_CHANNEL}")
+                # Catch up on anything missed while not listening
+                self.load()
+                delay = 1
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.load()
+            except Exception as e:
+                log.warning("catalog_listener_failed", retry_in=delay, error=str(e))
+                if conn is not None:
+                    conn.close()
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
@@ -0,0 +1,218 @@
+import threading, time
+from logs import get_logger
+
+log = get_logger()
+
+class PatchError(ValueError):
+    """
+    Raised when a patch does not fit the code it is applied to
+    """
+
+def apply_patches(code, patches):
+    """
+    Apply editor patches in order
+
+    Offsets and lengths are UTF-16 code units, as reported by the browser
+    editor, so non-BMP characters are handled in UTF-16 space.
+
+    Parameters: code, patches - list of {"offset", "length", "text"}
+    Returns: patched code
+    Raises: PatchError for malformed or out of range patches
+    """
+    if not isinstance(patches, list):
+        raise PatchError("patches must be a list")
+    wide = not code.isascii() and any(ord(c) > 0xFFFF for c in code)
+    if wide:
+        units = code.encode("utf-16-le")
+    for patch in patches:
+        try:
+            offset, length, text = patch["offset"], patch["length"], patch["text"]
+        except (KeyError, TypeError):
+            raise PatchError("patch needs offset, length and text")
+        if not (isinstance(offset, int) and isinstance(length, int) and isinstance(text, str)):
+            raise PatchError("patch has the wrong types")
+        size = len(units) // 2 if wide else len(code)
+        if offset < 0 or length < 0 or offset + length > size:
+            raise PatchError("patch out of range")
+        if not wide and not text.isascii() and any(ord(c) > 0xFFFF for c in text):
+            wide = True
+            units = code.encode("utf-16-le")
+        if wide:
+            units = units[:offset * 2] + text.encode("utf-16-le") + units[(offset + length) * 2:]
+        else:
+            code = code[:offset] + text + code[offset + length:]
+    return units.decode("utf-16-le") if wide else code
+
+class CodeSync:
+    """
+    Versioned, delta-encoded editor sync with coalesced fan-out
+
+    Every accepted code_update bumps the stream's version and is applied to
+    the stored code straight away. Fan-out is batched: once per window the
+    patches received since the last flush go out as one delta, or as a full
+    snapshot when that is smaller or a snapshot was received.
+
+    Parameters: emit - callable(room_code, payload, skip_sid) fanning out
+                opponent_code_update, send - callable(sid, event, payload)
+                replying to one socket, window - coalescing window in
+                seconds, spawn/sleep - background task helpers
+    """
+
+    def __init__(self, emit, send, window=0.05, spawn=None, sleep=time.sleep):
+        self.emit = emit
+        self.send = send
+        self.window = window
+        self.spawn = spawn or (lambda fn: threading.Thread(target=fn, daemon=True).start())
+        self.sleep = sleep
+
+        self._streams = {}  # (room_code, user_id) -> stream dict
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flusher = False
+
+        # Metrics
+        self.updates = 0
+        self.flushes = 0
+        self.resyncs = 0
+
+    def _stream(self, room_code, user_id, code=""):
+        key = (room_code, user_id)
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = {
+                "code": code,
+                "version": 0,
+                "flushed_version": 0,
+                "patches": [],
+                "snapshot": False,
+                "sid": None,
+                "awaiting_snapshot": False
+            }
+        return stream
+
+    def update(self, room_code, user_id, sid, data, code=""):
+        """
+        Apply one code_update from a player
+
+        Parameters: room_code, user_id, sid - sender socket, data - event
+                    payload with either code (snapshot) or base_version and
+                    patches, code - stored code if the stream is new
+        Returns: the new code, or None if the update was rejected and a
+                 code_resync was sent to the sender
+        """
+        with self._lock:
+            stream = self._stream(room_code, user_id, code)
+            stream["sid"] = sid
+
+            if "patches" not in data:
+                stream["code"] = data.get("code") or ""
+                stream["snapshot"] = True
+                stream["patches"] = []
+                stream["awaiting_snapshot"] = False
+            else:
+                if stream["awaiting_snapshot"]:
+                    # Patches in flight after a mismatch are based on a stale version
+                    return None
+                try:
+                    if data.get("base_version") != stream["version"]:
+                        raise PatchError("version mismatch")
+                    stream["code"] = apply_patches(stream["code"], data["patches"])
+                except PatchError:
+                    stream["awaiting_snapshot"] = True
+                    self.resyncs += 1
+                    resync = {"user_id": user_id, "version": stream["version"]}
+                else:
+                    resync = None
+                    if not stream["snapshot"]:
+                        stream["patches"].extend(data["patches"])
+                if resync is not None:
+                    self.send(sid, "code_resync", resync)
+                    return None
+
+            stream["version"] += 1
+            self.updates += 1
+            self._dirty.add((room_code, user_id))
+            if not self._flusher:
+                self._flusher = True
+                self.spawn(self._run_flusher)
+            return stream["code"]
+
+    def snapshot(self, room_code, user_id, code=""):
+        """
+        Flush pending deltas, then return the stream's full state
+
+        Parameters: code - stored code, used if this worker has no stream
+        Returns: dict with user_id, version and code
+        """
+        self.flush((room_code, user_id))
+        with self._lock:
+            stream = self._stream(room_code, user_id, code)
+            return {"user_id": user_id, "version": stream["version"], "code": stream["code"]}
+
+    def versions(self, room_code, user_ids):
+        """
+        Flush pending deltas of a room's players, then return their versions
+        """
+        for user_id in user_ids:
+            self.flush((room_code, user_id))
+        with self._lock:
+            return {user_id: self._stream(room_code, user_id)["version"] for user_id in user_ids}
+
+    def drop(self, room_code, user_id):
+        """
+        Forget a player's stream when they leave the room
+        """
+        with self._lock:
+            self._streams.pop((room_code, user_id), None)
+            self._dirty.discard((room_code, user_id))
+
+    def flush(self, key):
+        """
+        Fan out one stream's pending changes
+        """
+        with self._lock:
+            if key not in self._dirty:
+                return
+            self._dirty.discard(key)
+            stream = self._streams[key]
+            payload = {
+                "user_id": key[1],
+                "base_version": stream["flushed_version"],
+                "version": stream["version"]
+            }
+            patch_size = sum(len(p.get("text", "")) for p in stream["patches"])
+            if stream["snapshot"] or patch_size >= len(stream["code"]):
+                payload["code"] = stream["code"]
+            else:
+                payload["patches"] = stream["patches"]
+            stream["patches"] = []
+            stream["snapshot"] = False
+            stream["flushed_version"] = stream["version"]
+            sid = stream["sid"]
+            self.flushes += 1
+        self.emit(key[0], payload, sid)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "streams": len(self._streams),
+                "updates": self.updates,
+                "flushes": self.flushes,
+                "coalesce_ratio": self.updates / self.flushes if self.flushes else 0.0,
+                "resyncs": self.resyncs
+            }
+
+    def _run_flusher(self):
+        while True:
+            self.sleep(self.window)
+            with self._lock:
+                dirty = list(self._dirty)
+                if not dirty:
+                    # Idle - the next update starts a new flusher
+                    self._flusher = False
+                    return
+            for key in dirty:
+                try:
+                    self.flush(key)
+                except Exception as e:
+                    log.error("code_update_flush_failed", error=str(e))
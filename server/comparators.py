@@ -0,0 +1,161 @@
+"""
+Answer comparison for judged test cases
+
+A problem picks its comparator in coding_problems.comparator; the spec is
+compiled once when the catalog loads it into a function
+compare(result, output, case) -> bool, where case carries the expected
+output already parsed:
+
+    null or {"type": "typed"}       return values by type, see typed_equal
+    {"type": "exact"}               the answer's text, exactly
+    {"type": "float", "tolerance"}  as typed, floats within tolerance
+    {"type": "unordered"}           as typed, lists in any order
+    {"type": "checker", "source"}   source defines check(actual, expected,
+                                    input) -> bool; run in the server, so
+                                    only for trusted problem authors
+"""
+import ast, json, math
+
+# Relative and absolute tolerance when a float is involved
+FLOAT_TOLERANCE = 1e-6
+
+COMPARATOR_TYPES = ("typed", "exact", "float", "unordered", "checker")
+
+def parse_expected(text):
+    """
+    Read an expected output as a typed value
+
+    Parameters: text - expected output as stored with the test case
+    Returns: tuple of (True, value) for JSON or Python literals such as
+             3, 2.5, true, [1, 2] or "abc", otherwise (False, None)
+    """
+    text = text.strip()
+    try:
+        return True, json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return True, ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return False, None
+
+def typed_equal(actual, expected, tolerance=FLOAT_TOLERANCE):
+    """
+    Compare two decoded values by type: bools only equal bools, ints and
+    floats compare numerically within tolerance, lists and tuples element
+    by element, dicts key by key
+    """
+    if isinstance(actual, bool) or isinstance(expected, bool):
+        return isinstance(actual, bool) and isinstance(expected, bool) and actual == expected
+    if isinstance(actual, (int, float)) and isinstance(expected, (int, float)):
+        if isinstance(actual, float) or isinstance(expected, float):
+            return math.isclose(actual, expected, rel_tol=tolerance, abs_tol=tolerance)
+        return actual == expected
+    if isinstance(actual, (list, tuple)) and isinstance(expected, (list, tuple)):
+        return len(actual) == len(expected) and all(typed_equal(a, e, tolerance) for a, e in zip(actual, expected))
+    if isinstance(actual, dict) and isinstance(expected, dict):
+        # JSON turned the solution's keys into strings
+        expected = {str(key): value for key, value in expected.items()}
+        return actual.keys() == expected.keys() and all(typed_equal(actual[key], expected[key], tolerance)
+                                                        for key in actual)
+    return type(actual) is type(expected) and actual == expected
+
+def unordered_equal(actual, expected, tolerance=FLOAT_TOLERANCE):
+    """
+    As typed_equal, but top-level lists match in any order
+    """
+    if isinstance(actual, (list, tuple)) and isinstance(expected, (list, tuple)):
+        if len(actual) != len(expected):
+            return False
+        key = lambda item: json.dumps(item, sort_keys=True, default=str)
+        return all(typed_equal(a, e, tolerance) for a, e in zip(sorted(actual, key=key), sorted(expected, key=key)))
+    return typed_equal(actual, expected, tolerance)
+
+def matches(result, output, expected_text, expected=None, equal=typed_equal):
+    """
+    Decide whether a case's answer matches the expected output
+
+    Parameters: result - the runner's result dict for entry point calls
+                ({"value": ...} or {"repr": ...}), None for print-based
+                runs, output - captured stdout, expected_text, expected -
+                parse_expected(expected_text) if already known, equal -
+                comparison of decoded values
+    Returns: True if the answer matches
+    """
+    expected_text = str(expected_text).strip()
+    if result is None:
+        return output.strip() == expected_text
+    if "repr" in result:
+        return result["repr"].strip() == expected_text
+    value = result["value"]
+    # A function that prints its answer instead of returning it
+    if value is None and output.strip():
+        return output.strip() == expected_text
+    parsed, expected = expected or parse_expected(expected_text)
+    if parsed:
+        # A string only matches an expected string, never 15 or [1, 2] as text
+        return equal(value, expected)
+    return display(result, output) == expected_text
+
+def display(result, output):
+    """
+    Returns: the answer as text for verdicts - the return value as Python
+             shows it (strings as they are), or the captured output for
+             print-based runs
+    """
+    if result is None:
+        return output
+    if "repr" in result:
+        return result["repr"]
+    value = result["value"]
+    if value is None and output.strip():
+        return output
+    return value if isinstance(value, str) else repr(value)
+
+def display_expected(expected_text, expected=None):
+    """
+    Returns: the expected output as text for verdicts, shown the way
+             display() shows answers, so true reads True as a return value
+             would
+    """
+    parsed, value = expected or parse_expected(expected_text)
+    if not parsed:
+        return str(expected_text).strip()
+    return value if isinstance(value, str) else repr(value)
+
+def compile_comparator(spec):
+    """
+    Turn a comparator spec into compare(result, output, case)
+
+    Parameters: spec - dict as described above, or None for typed
+    Returns: callable taking the runner's result dict (or None), captured
+             output and a test case with expected, expected_value and input
+    Raises: ValueError for unknown types or a checker without check()
+    """
+    spec = spec or {"type": "typed"}
+    kind = spec.get("type", "typed")
+    if kind == "typed":
+        return lambda result, output, case: matches(result, output, case.expected, case.expected_value)
+    if kind == "exact":
+        return lambda result, output, case: display(result, output).strip() == case.expected.strip()
+    if kind in ("float", "unordered"):
+        tolerance = float(spec.get("tolerance", FLOAT_TOLERANCE))
+        equal = unordered_equal if kind == "unordered" else typed_equal
+        return lambda result, output, case: matches(result, output, case.expected, case.expected_value,
+                                                    lambda a, e: equal(a, e, tolerance))
+    if kind == "checker":
+        scope = {}
+        exec(compile(spec.get("source", ""), "<checker>", "exec"), scope)
+        check = scope.get("check")
+        if not callable(check):
+            raise ValueError("Checker source must define check(actual, expected, input)")
+
+        def compare(result, output, case):
+            if result is None or "repr" in result or (result["value"] is None and output.strip()):
+                actual = display(result, output)
+            else:
+                actual = result["value"]
+            parsed, expected = case.expected_value
+            return bool(check(actual, expected if parsed else case.expected, case.input))
+        return compare
+    raise ValueError(f"Unknown comparator type {kind!r}, expected one of {', '.join(COMPARATOR_TYPES)}")
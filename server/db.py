@@ -0,0 +1,174 @@
+import threading, time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool
+from logs import get_logger
+
+log = get_logger()
+
+def green_psycopg(async_mode):
+    """
+    Let psycopg2 wait on the server through the eventlet or gevent hub
+
+    psycopg2 blocks in C, so under those servers every query stalls the
+    whole hub and the pool runs one query at a time. psycogreen's wait
+    callback hands the wait to the hub instead. Threaded servers need
+    nothing.
+
+    Parameters: async_mode - Flask-SocketIO async mode the server runs under
+    Dependencies: psycogreen
+    Returns: True if psycopg2 now yields to the hub
+    """
+    if async_mode not in ("eventlet", "gevent", "gevent_uwsgi"):
+        return False
+    try:
+        if async_mode == "eventlet":
+            from psycogreen.eventlet import patch_psycopg
+        else:
+            from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        log.warning("psycopg_blocks_hub", async_mode=async_mode, error="psycogreen is not installed")
+        return False
+    patch_psycopg()
+    return True
+
+class Database:
+    """
+    Pooled PostgreSQL access
+
+    Each `with db.cursor() as cur:` block checks a connection out of the pool,
+    commits when the block succeeds, rolls back when it raises, and returns
+    the connection. Broken connections are discarded so the next checkout
+    reconnects. Queries only overlap on threaded servers, or under eventlet
+    and gevent once green_psycopg() has run.
+
+    Parameters: minconn/maxconn - pool bounds, statement_timeout - ms per
+                statement, checkout_timeout - seconds to wait for a free
+                connection, health_check_interval - idle seconds after which
+                a connection is pinged before use, connect kwargs for psycopg2
+    """
+
+    def __init__(self, minconn=1, maxconn=10, statement_timeout=5000, checkout_timeout=5,
+                 health_check_interval=30, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = dict(connect_kwargs)
+        self.connect_kwargs["options"] = f"-c statement_timeout={int(statement_timeout)}"
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._stats_lock = threading.Lock()
+
+        # Metrics, updated under _stats_lock
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.reconnects = 0
+
+    def _get_pool(self):
+        # Created lazily so the server can start before the database is up
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self.connect_kwargs)
+        return self._pool
+
+    def _checkout(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise pool.PoolError(f"No database connection free after {self.checkout_timeout}s")
+        reconnected = False
+        try:
+            db_pool = self._get_pool()
+            conn = db_pool.getconn()
+            if conn.closed or not self._is_alive(conn):
+                db_pool.putconn(conn, close=True)
+                conn = db_pool.getconn()
+                reconnected = True
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.checkout_wait_total += time.monotonic() - started
+            self.reconnects += reconnected
+        return conn
+
+    def _checkin(self, conn, broken=False):
+        with self._stats_lock:
+            self.in_use -= 1
+        try:
+            self._last_used[id(conn)] = time.monotonic()
+            if broken or conn.closed:
+                self._last_used.pop(id(conn), None)
+            self._get_pool().putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def _is_alive(self, conn):
+        # Only ping connections that sat idle long enough to have been dropped
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            self._last_used.pop(id(conn), None)
+            return False
+
+    @contextmanager
+    def cursor(self):
+        """
+        Check out a connection for one unit of work
+
+        Dependencies: connection pool
+        Returns: context manager yielding a cursor; commits on success,
+                 rolls back on error
+        """
+        conn = self._checkout()
+        broken = False
+        try:
+            with conn.cursor() as cur:
+                yield cur
+            conn.commit()
+        except BaseException as e:
+            # A statement timeout leaves the connection usable; a lost one does not
+            broken = (isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+                      and not isinstance(e, psycopg2.extensions.QueryCanceledError))
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    def stats(self):
+        """
+        Returns: dict of pool metrics
+        """
+        with self._stats_lock:
+            in_use, checkouts, wait_total, reconnects = (self.in_use, self.checkouts,
+                                                         self.checkout_wait_total, self.reconnects)
+        return {
+            "min": self.minconn,
+            "max": self.maxconn,
+            "in_use": in_use,
+            "utilization": in_use / self.maxconn if self.maxconn else 0.0,
+            "checkouts": checkouts,
+            "checkout_wait_avg": wait_total / checkouts if checkouts else 0.0,
+            "reconnects": reconnects
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
@@ -0,0 +1,188 @@
+import threading, time, uuid
+from collections import OrderedDict, deque
+from metrics import Histogram
+from logs import get_logger
+
+log = get_logger()
+
+class JudgeQueueFull(Exception):
+    """
+    Raised when a submission cannot be queued
+
+    Attributes: retry_after - seconds the client should wait before retrying,
+                per_user - True if only this user's share of the queue is full
+    """
+
+    def __init__(self, message, retry_after=1, per_user=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.per_user = per_user
+
+class JudgeQueue:
+    """
+    Bounded submission queue served by a pool of judge workers
+
+    Jobs are queued per user and workers take them round-robin across users,
+    so one player spamming submit cannot starve everyone else.
+
+    Parameters: judge - callable(job) returning the verdict dict,
+                notify - callable(job) called on every status change,
+                workers - number of judge workers, max_queued - total queue
+                bound, max_per_user - pending jobs allowed per user,
+                result_ttl - seconds finished jobs stay queryable
+    """
+
+    def __init__(self, judge, notify, workers=2, max_queued=100, max_per_user=2, result_ttl=300):
+        self.judge = judge
+        self.notify = notify
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.result_ttl = result_ttl
+
+        self._pending = OrderedDict()  # user_id -> deque of queued jobs
+        self._queued = 0
+        self._running = 0
+        self._jobs = {}  # job_id -> job, kept until result_ttl expires
+        self._finished = deque()  # (finished_at, job_id) for expiry
+        self._cond = threading.Condition()
+        self._threads = []
+
+        # Metrics
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_wait_total = 0.0
+        self.judge_time_total = 0.0
+        self.latency = {"queue_wait": Histogram(), "judge": Histogram()}
+
+    def start(self):
+        """
+        Start the judge workers
+        """
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run_worker, name=f"judge-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, user_id, **fields):
+        """
+        Queue a submission
+
+        Parameters: user_id, fields - stored on the job for judge/notify
+        Returns: job dict with job_id, status and position
+        Raises: JudgeQueueFull when the queue or the user's share is full
+        """
+        with self._cond:
+            self._expire()
+            user_jobs = self._pending.get(user_id)
+            if self._queued >= self.max_queued:
+                self.rejected += 1
+                raise JudgeQueueFull("Judge queue is full, try again shortly",
+                                     retry_after=max(1, self._queued // max(self.workers, 1)))
+            if user_jobs is not None and len(user_jobs) >= self.max_per_user:
+                self.rejected += 1
+                raise JudgeQueueFull("You already have submissions waiting to be judged", per_user=True)
+
+            job = dict(fields)
+            job.update({
+                "job_id": uuid.uuid4().hex,
+                "user_id": user_id,
+                "status": "queued",
+                "position": self._queued + 1,
+                "queued_at": time.time(),
+                "verdict": None
+            })
+            if user_jobs is None:
+                user_jobs = self._pending[user_id] = deque()
+            user_jobs.append(job)
+            self._queued += 1
+            self._jobs[job["job_id"]] = job
+            self.submitted += 1
+            self._cond.notify()
+
+        self._notify(job)
+        return job
+
+    def get(self, job_id):
+        """
+        Returns: job dict or None if unknown or expired
+        """
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """
+        Returns: dict of queue metrics
+        """
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "max_queued": self.max_queued,
+                "users_waiting": len(self._pending),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queue_wait_avg": self.queue_wait_total / self.completed if self.completed else 0.0,
+                "judge_time_avg": self.judge_time_total / self.completed if self.completed else 0.0
+            }
+
+    def _next_job(self):
+        # Round-robin: take the first user's oldest job, then move them to the back
+        user_id, user_jobs = next(iter(self._pending.items()))
+        job = user_jobs.popleft()
+        if user_jobs:
+            self._pending.move_to_end(user_id)
+        else:
+            del self._pending[user_id]
+        self._queued -= 1
+        return job
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        while self._finished and self._finished[0][0] < cutoff:
+            _, job_id = self._finished.popleft()
+            self._jobs.pop(job_id, None)
+
+    def _notify(self, job):
+        try:
+            self.notify(job)
+        except Exception as e:
+            log.error("judge_notify_failed", job_id=job["job_id"], error=str(e))
+
+    def _run_worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._next_job()
+                self._running += 1
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            self._notify(job)
+
+            try:
+                verdict = self.judge(job)
+                failed = False
+            except Exception as e:
+                verdict = {"error": str(e), "passed": False}
+                failed = True
+
+            with self._cond:
+                finished_at = time.time()
+                job["verdict"] = verdict
+                job["status"] = "finished"
+                job["finished_at"] = finished_at
+                self._running -= 1
+                self.completed += 1
+                self.failed += failed
+                self.queue_wait_total += job["started_at"] - job["queued_at"]
+                self.judge_time_total += finished_at - job["started_at"]
+                self.latency["queue_wait"].observe(job["started_at"] - job["queued_at"])
+                self.latency["judge"].observe(finished_at - job["started_at"])
+                self._finished.append((finished_at, job["job_id"]))
+            self._notify(job)
@@ -0,0 +1,214 @@
+import bisect, threading, time
+from logs import get_logger
+
+log = get_logger()
+
+class Leaderboard:
+    """
+    In-memory leaderboard of users ranked by num_wins
+
+    Users are grouped into buckets by win count, each sorted by username
+    for a stable order between ties, and a Fenwick tree over win counts
+    holds bucket sizes. "My rank" is one prefix sum and finding the entry
+    at any offset is one Fenwick search, both O(log max_wins), so pages and
+    rank lookups never touch Postgres. Wins are applied incrementally as
+    games end, and the whole board is periodically reloaded from users to
+    pick up writes from other workers and correct any drift.
+
+    Parameters: db - Database, reconcile_interval - seconds between reloads
+    """
+
+    def __init__(self, db, reconcile_interval=300):
+        self.db = db
+        self.reconcile_interval = reconcile_interval
+
+        self._users = {}  # user_id -> (username, num_wins)
+        self._buckets = {}  # num_wins -> sorted list of (username, user_id)
+        self._tree = [0] * 65  # Fenwick tree of users per win count, 1-based
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # Metrics
+        self.loads = 0
+        self.updates = 0
+        self.last_drift = 0
+
+    def load(self):
+        """
+        (Re)build the board from the users table
+
+        Dependencies: db
+        Returns: number of users whose wins differed from the board
+        """
+        with self.db.cursor() as cur:
+            cur.execute("SELECT user_id, username, num_wins FROM users")
+            rows = cur.fetchall()
+
+        with self._lock:
+            old_users = self._users
+            self._users, self._buckets = {}, {}
+            self._tree = [0] * len(self._tree)
+            for user_id, username, num_wins in rows:
+                user_id = str(user_id)
+                self._users[user_id] = (username, num_wins or 0)
+                self._buckets.setdefault(num_wins or 0, []).append((username, user_id))
+                self._tree_add(num_wins or 0, 1)
+            for bucket in self._buckets.values():
+                bucket.sort()
+            drift = sum(1 for user_id, entry in self._users.items() if old_users.get(user_id, entry) != entry)
+            self._loaded = True
+            self.loads += 1
+            self.last_drift = drift
+        return drift
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def start(self):
+        """
+        Start periodic reconciliation against the database
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_reconciler, name="leaderboard", daemon=True)
+            self._thread.start()
+
+    def add_user(self, user_id, username, num_wins=0):
+        """
+        Add a newly signed up user
+        """
+        with self._lock:
+            if str(user_id) not in self._users:
+                self._insert(str(user_id), username, num_wins)
+
+    def record_win(self, user_id, count=1):
+        """
+        Move a user up by count wins; unknown users wait for the next reload
+        """
+        with self._lock:
+            entry = self._users.get(str(user_id))
+            if entry is None:
+                return
+            self._remove(str(user_id))
+            self._insert(str(user_id), entry[0], entry[1] + count)
+            self.updates += 1
+
+    def top(self, limit=10, offset=0):
+        """
+        Returns: list of {rank, username, num_wins}, best first, starting at
+                 offset; ties share a rank
+        """
+        self.ensure_loaded()
+        with self._lock:
+            total = len(self._users)
+            entries = []
+            position = offset
+            while len(entries) < limit and position < total:
+                num_wins, index = self._locate(position)
+                bucket = self._buckets[num_wins]
+                rank = total - self._prefix(num_wins) + 1
+                for username, _ in bucket[index:index + limit - len(entries)]:
+                    entries.append({"rank": rank, "username": username, "num_wins": num_wins})
+                position += len(bucket) - index
+            return entries
+
+    def rank_of(self, user_id):
+        """
+        Returns: {rank, username, num_wins, total} for a user, or None
+        """
+        self.ensure_loaded()
+        with self._lock:
+            entry = self._users.get(str(user_id))
+            if entry is None:
+                return None
+            username, num_wins = entry
+            total = len(self._users)
+            return {
+                "rank": total - self._prefix(num_wins) + 1,
+                "username": username,
+                "num_wins": num_wins,
+                "total": total
+            }
+
+    def stats(self):
+        return {
+            "users": len(self._users),
+            "loads": self.loads,
+            "updates": self.updates,
+            "last_drift": self.last_drift
+        }
+
+    def _insert(self, user_id, username, num_wins):
+        self._users[user_id] = (username, num_wins)
+        bisect.insort(self._buckets.setdefault(num_wins, []), (username, user_id))
+        self._tree_add(num_wins, 1)
+
+    def _remove(self, user_id):
+        username, num_wins = self._users.pop(user_id)
+        bucket = self._buckets[num_wins]
+        del bucket[bisect.bisect_left(bucket, (username, user_id))]
+        if not bucket:
+            del self._buckets[num_wins]
+        self._tree_add(num_wins, -1)
+
+    def _tree_add(self, num_wins, delta):
+        if num_wins + 1 >= len(self._tree):
+            self._grow(num_wins + 1)
+        i = num_wins + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _grow(self, needed):
+        # Rebuild with room for higher win counts
+        size = len(self._tree) - 1
+        counts = [self._prefix(v) - self._prefix(v - 1) for v in range(size)]
+        while size <= needed:
+            size *= 2
+        self._tree = [0] * (size + 1)
+        for v, count in enumerate(counts):
+            i = v + 1
+            while count and i <= size:
+                self._tree[i] += count
+                i += i & -i
+
+    def _prefix(self, num_wins):
+        # Users with at most num_wins wins
+        total = 0
+        i = min(num_wins + 1, len(self._tree) - 1)
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position):
+        """
+        Returns: (num_wins, index in bucket) of the entry at a 0-based
+                 position counted from the top
+        """
+        # Fenwick search for the bucket holding the target-th user from the bottom
+        target = len(self._users) - position
+        i, remaining = 0, target
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            j = i + step
+            if j < len(self._tree) and self._tree[j] < remaining:
+                i = j
+                remaining -= self._tree[j]
+            step >>= 1
+        num_wins = i
+        below = self._prefix(num_wins - 1) if num_wins else 0
+        bucket = self._buckets[num_wins]
+        # Within a bucket the top of the board is the start of the list
+        return num_wins, below + len(bucket) - target
+
+    def _run_reconciler(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                drift = self.load()
+                if drift:
+                    log.info("leaderboard_reconciled", corrected=drift)
+            except Exception as e:
+                log.error("leaderboard_reconcile_failed", error=str(e))
@@ -0,0 +1,201 @@
+import ctypes, errno, os, resource, shutil, signal, subprocess, sys, tempfile, threading, time
+from metrics import Histogram
+from sandbox import SandboxBackend, RUN_TIMEOUT, TIMEOUT_EXIT_CODE
+from logs import get_logger
+
+log = get_logger()
+
+try:
+    import seccomp
+except ImportError:
+    seccomp = None
+
+# unshare(2) flags: a user namespace lets an unprivileged process create
+# the network namespace, which has nothing but a downed loopback
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+# Syscalls a solution has no business making, denied with EPERM when the
+# seccomp bindings are installed
+DENIED_SYSCALLS = (
+    "socket", "socketpair", "ptrace", "process_vm_readv", "process_vm_writev", "mount", "umount2",
+    "unshare", "setns", "chroot", "pivot_root", "bpf", "keyctl", "add_key", "request_key",
+    "init_module", "finit_module", "delete_module", "kexec_load", "reboot", "swapon", "swapoff"
+)
+
+class LocalSandbox(SandboxBackend):
+    """
+    Runs solutions in forked, locally isolated worker processes
+
+    Each run gets a fresh scratch directory standing in for /app and a
+    child process that, before exec'ing the interpreter, starts its own
+    session, drops to a dedicated uid if one is given, enters empty
+    network (and, unprivileged, user) namespaces where the kernel allows,
+    installs a seccomp filter when the seccomp bindings are available and
+    sets rlimits on address space, CPU time, file size, open files and,
+    with a dedicated uid, processes. The whole process group is killed at
+    the wall-clock deadline. There is no container to start or reset, so
+    a run costs a fork and an interpreter start.
+
+    Parameters: memory_limit_mb - address space per run, uid - unprivileged
+                uid to run as, honoured only when started as root; it must
+                be able to execute the interpreter
+    """
+
+    name = "local"
+
+    def __init__(self, memory_limit_mb=256, uid=None):
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.uid = uid if os.geteuid() == 0 else None
+        self.isolation = {"network": False, "seccomp": seccomp is not None, "uid": self.uid}
+        self._unshare = _libc_unshare()
+        self._namespaces = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.runs = 0
+        self.killed = 0
+        self.latency = {phase: Histogram() for phase in ("setup", "execution", "teardown")}
+
+    def start(self):
+        """
+        Work out which namespaces this host lets a worker enter, then check
+        the sandboxed interpreter really has no network
+        """
+        # Root can enter a network namespace directly, anyone else needs a user namespace too
+        candidates = [CLONE_NEWNET] if os.geteuid() == 0 else [CLONE_NEWUSER | CLONE_NEWNET]
+        for flags in candidates:
+            if self._probe(flags):
+                self._namespaces = flags
+                break
+        probe = ("import socket\n"
+                 "try:\n"
+                 "    socket.create_connection(('1.1.1.1', 53), timeout=1)\n"
+                 "except OSError:\n"
+                 "    print('isolated')\n")
+        _, stdout, _ = self.run({"probe.py": probe.encode()}, ["python", "/app/probe.py"], timeout=5)
+        self.isolation["network"] = stdout.strip() == "isolated"
+        if not self.isolation["network"]:
+            log.warning("local_sandbox_network_open")
+
+    def health(self):
+        """
+        Returns: dict with the isolation this host provides and run metrics
+        """
+        return {"ready": True, "backend": self.name, "isolation": dict(self.isolation), "pool": self.stats()}
+
+    def run(self, files, command, timeout=RUN_TIMEOUT, timings=None):
+        """
+        Copy files into a scratch directory and run a command there
+
+        Parameters: files - dict of name to bytes placed under /app,
+                    command - argv list, timeout - wall clock seconds,
+                    timings - optional dict filled with seconds spent in
+                    setup, execution and teardown
+        Returns: tuple of (exit_code, stdout, stderr)
+        """
+        timings = {} if timings is None else timings
+        started = time.monotonic()
+        root = tempfile.mkdtemp(prefix="sandbox-")
+        try:
+            for name, content in files.items():
+                with open(os.path.join(root, name), "wb") as f:
+                    f.write(content)
+            if self.uid is not None:
+                os.chown(root, self.uid, self.uid)
+            # -I: ignore PYTHON* variables and user site-packages, as in the image
+            argv = [[sys.executable, "-I"] if arg == "python" else [arg.replace("/app", root)] for arg in command]
+            argv = [arg for args in argv for arg in args]
+            timings["setup"] = time.monotonic() - started
+
+            started = time.monotonic()
+            process = subprocess.Popen(
+                argv,
+                cwd=root,
+                env={"PATH": "/usr/bin:/bin", "HOME": root, "TMPDIR": root, "LANG": "C.UTF-8"},
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                preexec_fn=lambda: self._isolate(timeout),
+                close_fds=True
+            )
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+                exit_code = process.returncode
+            except subprocess.TimeoutExpired:
+                _kill_group(process.pid)
+                stdout, stderr = process.communicate()
+                exit_code = TIMEOUT_EXIT_CODE
+            # Whatever the solution left running goes with the session
+            _kill_group(process.pid)
+            timings["execution"] = time.monotonic() - started
+            if exit_code == -signal.SIGKILL:
+                exit_code = TIMEOUT_EXIT_CODE
+            with self._lock:
+                self.runs += 1
+                self.killed += exit_code == TIMEOUT_EXIT_CODE
+            return exit_code, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        finally:
+            started = time.monotonic()
+            shutil.rmtree(root, ignore_errors=True)
+            timings["teardown"] = time.monotonic() - started
+            for phase, seconds in timings.items():
+                self.latency[phase].observe(seconds)
+
+    def stats(self):
+        """
+        Returns: dict of run metrics
+        """
+        with self._lock:
+            return {"runs": self.runs, "killed": self.killed}
+
+    def _probe(self, flags):
+        # Namespace support depends on kernel and container settings, so try it
+        if self._unshare is None:
+            return False
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if self._unshare(flags) == 0 else 1)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status) == 0
+
+    def _isolate(self, timeout):
+        # Runs in the child between fork and exec; raising aborts the run
+        os.setsid()
+        if self._namespaces:
+            self._unshare(self._namespaces)
+        cpu = int(timeout) + 1
+        limits = [
+            (resource.RLIMIT_AS, self.memory_limit),
+            (resource.RLIMIT_CPU, cpu),
+            (resource.RLIMIT_FSIZE, 16 * 1024 * 1024),
+            (resource.RLIMIT_NOFILE, 64),
+            (resource.RLIMIT_CORE, 0)
+        ]
+        if self.uid is not None:
+            # Process counts are per uid, so only cap them for a dedicated one
+            limits.append((resource.RLIMIT_NPROC, 64))
+        for limit, value in limits:
+            resource.setrlimit(limit, (value, value))
+        if self.uid is not None:
+            os.setgroups([])
+            os.setgid(self.uid)
+            os.setuid(self.uid)
+        if seccomp is not None:
+            sandbox_filter = seccomp.SyscallFilter(seccomp.ALLOW)
+            for syscall in DENIED_SYSCALLS:
+                sandbox_filter.add_rule(seccomp.ERRNO(errno.EPERM), syscall)
+            sandbox_filter.load()
+
+def _libc_unshare():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.unshare
+    except (OSError, AttributeError):
+        return None
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
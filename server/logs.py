@@ -0,0 +1,68 @@
+import json, logging, random, sys, time
+
+# Logger the server's modules share; app.py configures it from LOG_LEVEL
+APP_LOGGER = "code_duels"
+
+class EventLogger:
+    """
+    Levelled, sampled structured logging for hot paths
+
+    Each call logs one JSON line: {"ts", "level", "event", **fields}. The
+    level check comes first, so a disabled call returns before anything is
+    formatted; enabled calls at debug or info can additionally be sampled,
+    keeping only a fraction of them.
+
+    Parameters: name - logger name, level - minimum level name,
+                sample_rate - fraction of debug/info events kept
+    """
+
+    def __init__(self, name, level="WARNING", sample_rate=1.0):
+        self.logger = logging.getLogger(name)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+        self.configure(level, sample_rate)
+
+    def configure(self, level, sample_rate=1.0):
+        self.logger.setLevel(getattr(logging, str(level).upper(), logging.WARNING))
+        self.sample_rate = sample_rate
+
+    def enabled(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, event, **fields):
+        if self.logger.isEnabledFor(logging.DEBUG) and self._sampled():
+            self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        if self.logger.isEnabledFor(logging.INFO) and self._sampled():
+            self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self._log(logging.ERROR, event, fields)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _log(self, level, event, fields):
+        record = {"ts": round(time.time(), 3), "level": logging.getLevelName(level).lower(), "event": event}
+        record.update(fields)
+        self.logger.log(level, json.dumps(record, default=str))
+
+_loggers = {}
+
+def get_logger(name=APP_LOGGER):
+    """
+    Returns: the EventLogger for name, one instance shared by every module
+             that asks for it, so configure() applies to all of them
+    """
+    if name not in _loggers:
+        _loggers[name] = EventLogger(name)
+    return _loggers[name]
@@ -0,0 +1,246 @@
+import json, os, threading, time
+from collections import deque
+import psycopg2
+from psycopg2.extras import execute_values
+from logs import get_logger
+
+log = get_logger()
+
+# Failures that mean the database rejected the rows themselves. Anything
+# else - the database down, the pool busy, a bug - is retried.
+REJECTED_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+def match_result(room_code, room, winner_id, ended_at=None):
+    """
+    Build the game_history record for a finished two-player room
+
+    Parameters: room_code, room - Room snapshot, winner_id
+    Returns: result dict for MatchResultWriter.record
+    """
+    ended_at = ended_at or time.time()
+    (player1_id, player1), (player2_id, player2) = room.players.items()
+    return {
+        "room_code": room_code,
+        "player1_id": player1_id,
+        "player2_id": player2_id,
+        "winner_id": winner_id,
+        "player1_questions_answered": player1.questions_answered,
+        "player2_questions_answered": player2.questions_answered,
+        "player1_final_health": player1.health,
+        "player2_final_health": player2.health,
+        "duration_seconds": int(ended_at - room.start_time) if room.start_time else 0,
+        "played_on": ended_at
+    }
+
+class MatchResultWriter:
+    """
+    Batched, asynchronous writer for game_history rows and num_wins
+
+    Handlers record() a finished game and move on; a background thread
+    writes queued games in one transaction per batch - a multi-row INSERT
+    into game_history plus one UPDATE of num_wins per batch - once
+    batch_size games are queued or flush_interval has passed. A batch that
+    fails with a DataError or IntegrityError was rejected for its contents:
+    it is split until the offending games are found; those go to a
+    dead-letter file and the rest are written. A batch that fails any other
+    way, such as the database being unreachable or the pool busy, is
+    appended to a JSON lines spill file and retried, oldest first, before
+    newer games, with backoff.
+
+    Parameters: db - Database, batch_size, flush_interval - seconds,
+                spill_path - file failed batches are kept in until written,
+                dead_letter_path - file rejected games are moved to
+    """
+
+    def __init__(self, db, batch_size=50, flush_interval=1.0, spill_path="match_results.spill",
+                 dead_letter_path="match_results.rejected"):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closing = False
+        self._retry_at = 0.0
+        self._backoff = flush_interval
+
+        # Metrics
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.spilled = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_writer, name="match-results", daemon=True)
+            self._thread.start()
+
+    def record(self, result):
+        """
+        Queue a finished game; returns without touching the database
+        """
+        with self._cond:
+            self._pending.append(result)
+            self.recorded += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def close(self):
+        """
+        Write everything still queued, spilling it if the database is down
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        else:
+            self._flush()
+
+    def stats(self):
+        """
+        Returns: dict of writer metrics
+        """
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "spill_pending": self._spill_size(),
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "spilled": self.spilled,
+            "rejected": self.rejected
+        }
+
+    def _run_writer(self):
+        while True:
+            with self._cond:
+                if not self._closing and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closing = self._closing
+            self._flush(force=closing)
+            if closing:
+                return
+
+    def _flush(self, force=False):
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not force and time.monotonic() < self._retry_at:
+            # Database was down recently; park new games with the spilled ones
+            if batch:
+                self._spill(batch)
+            return
+
+        # Earlier failures go first so games land in the order they ended
+        spilled = self._read_spill()
+        queue = spilled + batch
+        chunks = deque(queue[start:start + self.batch_size] for start in range(0, len(queue), self.batch_size))
+        # Games written or rejected so far, always a prefix of queue
+        done = 0
+        try:
+            while chunks:
+                chunk = chunks.popleft()
+                try:
+                    self._write(chunk)
+                except REJECTED_ERRORS as e:
+                    if len(chunk) > 1:
+                        # Split to find the games the database rejects
+                        middle = len(chunk) // 2
+                        chunks.extendleft([chunk[middle:], chunk[:middle]])
+                        continue
+                    self._reject(chunk[0], e)
+                done += len(chunk)
+        except Exception as e:
+            self.failures += 1
+            log.warning("game_results_save_failed", retry_in=round(self._backoff, 1), error=str(e))
+            self.spilled += len(queue) - max(done, len(spilled))
+            self._replace_spill(queue[done:])
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, 60)
+        else:
+            if spilled:
+                os.remove(self.spill_path)
+            self._backoff = self.flush_interval
+            self._retry_at = 0.0
+
+    def _write(self, batch):
+        if not batch:
+            return
+        wins = {}
+        for result in batch:
+            wins[result["winner_id"]] = wins.get(result["winner_id"], 0) + 1
+        with self.db.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO game_history
+                (room_code, player1_id, player2_id, winner_id,
+                 player1_questions_answered, player2_questions_answered,
+                 player1_final_health, player2_final_health, duration_seconds, played_on)
+                VALUES %s
+            """, [(
+                r["room_code"], r["player1_id"], r["player2_id"], r["winner_id"],
+                r["player1_questions_answered"], r["player2_questions_answered"],
+                r["player1_final_health"], r["player2_final_health"],
+                r["duration_seconds"], r["played_on"]
+            ) for r in batch], template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, to_timestamp(%s)::timestamp)")
+            execute_values(cur, """
+                UPDATE users SET num_wins = users.num_wins + v.wins
+                FROM (VALUES %s) AS v(user_id, wins)
+                WHERE users.user_id = v.user_id::uuid
+            """, list(wins.items()))
+        self.written += len(batch)
+        self.batches += 1
+
+    def _spill(self, batch):
+        if not batch:
+            return
+        with open(self.spill_path, "a") as f:
+            for result in batch:
+                f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.spilled += len(batch)
+
+    def _reject(self, result, error):
+        log.error("game_result_rejected", room_code=result.get("room_code"), moved_to=self.dead_letter_path,
+                  error=str(error))
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps({"result": result, "error": str(error)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.rejected += 1
+
+    def _replace_spill(self, results):
+        tmp_path = f"{self.spill_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.spill_path)
+
+    def _read_spill(self):
+        if not os.path.exists(self.spill_path):
+            return []
+        results = []
+        with open(self.spill_path) as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    log.warning("game_results_spill_line_unreadable", path=self.spill_path)
+        return results
+
+    def _spill_size(self):
+        try:
+            with open(self.spill_path) as f:
+                return sum(1 for _ in f)
+        except OSError:
+            return 0
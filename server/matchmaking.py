@@ -0,0 +1,496 @@
+import json, threading, time
+from dataclasses import dataclass
+from room_store import KEY_PREFIX
+from logs import get_logger
+
+log = get_logger()
+
+@dataclass(slots=True)
+class Ticket:
+    user_id: str
+    rating: float
+    enqueued_at: float
+
+class EloRatings:
+    """
+    Elo rating per user, derived from game_history
+
+    Ratings are rebuilt by replaying every finished game in the order it
+    was played, then updated in memory as games end. Users without games
+    start at the initial rating.
+
+    Parameters: db - Database, k_factor - largest change per game,
+                initial - rating of new users
+    """
+
+    def __init__(self, db, k_factor=32, initial=1200):
+        self.db = db
+        self.k_factor = k_factor
+        self.initial = initial
+        self._ratings = {}  # user_id -> rating
+        self._loaded = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.loads = 0
+        self.games = 0
+
+    def load(self):
+        """
+        (Re)build ratings from game_history
+
+        Dependencies: db
+        Returns: number of games replayed
+        """
+        with self.db.cursor() as cur:
+            cur.execute("""
+                SELECT player1_id, player2_id, winner_id
+                FROM game_history
+                WHERE winner_id IS NOT NULL
+                ORDER BY played_on, game_id
+            """)
+            rows = cur.fetchall()
+
+        ratings = {}
+        for player1_id, player2_id, winner_id in rows:
+            loser_id = player2_id if winner_id == player1_id else player1_id
+            self._apply(ratings, str(winner_id), str(loser_id))
+        with self._lock:
+            self._ratings = ratings
+            self._loaded = True
+            self.loads += 1
+            self.games = len(rows)
+        return len(rows)
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def rating(self, user_id):
+        self.ensure_loaded()
+        with self._lock:
+            return self._ratings.get(str(user_id), self.initial)
+
+    def record(self, winner_id, loser_id):
+        """
+        Update both players' ratings for a finished game
+        """
+        with self._lock:
+            self._apply(self._ratings, str(winner_id), str(loser_id))
+            self.games += 1
+
+    def stats(self):
+        return {
+            "rated_users": len(self._ratings),
+            "games": self.games,
+            "loads": self.loads
+        }
+
+    def _apply(self, ratings, winner_id, loser_id):
+        winner = ratings.get(winner_id, self.initial)
+        loser = ratings.get(loser_id, self.initial)
+        expected = 1 / (1 + 10 ** ((loser - winner) / 400))
+        change = self.k_factor * (1 - expected)
+        ratings[winner_id] = winner + change
+        ratings[loser_id] = loser - change
+
+class Matchmaker:
+    """
+    Skill-based matchmaking queue
+
+    Waiting users sit in tiers of tier_width rating points, oldest first.
+    A user accepts opponents within a window that starts at base_window
+    and widens by widen_rate points per second waited, up to max_window;
+    two users are paired only if each is inside the other's window, and
+    the longest-waiting acceptable opponent wins. Pairing happens under
+    one lock that moves both tickets aside, so concurrent requests can never
+    hand the same user two opponents; the pair still polls as queued until
+    their room exists. A ticker re-checks waiting users as
+    their windows widen and exits when the queue is empty.
+
+    Parameters: rating - callable(user_id) returning a rating,
+                on_match - callable(creator_id, opponent_id) returning the
+                room code created for the pair, tier_width, base_window,
+                widen_rate, max_window - rating points (per second),
+                tick - seconds between sweeps, spawn/sleep - background
+                task helpers
+    """
+
+    def __init__(self, rating, on_match, tier_width=100, base_window=50, widen_rate=25,
+                 max_window=1000, tick=1.0, spawn=None, sleep=time.sleep, clock=time.monotonic):
+        self.rating = rating
+        self.on_match = on_match
+        self.tier_width = tier_width
+        self.base_window = base_window
+        self.widen_rate = widen_rate
+        self.max_window = max_window
+        self.tick = tick
+        self.spawn = spawn or (lambda fn: threading.Thread(target=fn, daemon=True).start())
+        self.sleep = sleep
+        self.clock = clock
+
+        self._tickets = {}  # user_id -> Ticket
+        self._tiers = {}  # tier -> dict of user_id -> Ticket, oldest first
+        self._matching = {}  # user_id -> Ticket, paired while their room is created
+        self._matched = {}  # user_id -> (room_code, created_game, matched_at), until polled
+        self._lock = threading.Lock()
+        self._ticker = False
+
+        # Metrics
+        self.enqueued = 0
+        self.matches = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_gap = 0.0
+
+    def join(self, user_id):
+        """
+        Queue a user, pairing them at once if an opponent is acceptable
+
+        Returns: {"room_code", "created_game"} once matched, otherwise
+                 {"queued": True, "window"}
+        """
+        user_id = str(user_id)
+        status = self.status(user_id)
+        if status is not None:
+            return status
+
+        rating = self.rating(user_id)
+        with self._lock:
+            if user_id not in self._tickets:
+                ticket = Ticket(user_id, rating, self.clock())
+                self._tickets[user_id] = ticket
+                self._tiers.setdefault(self._tier(rating), {})[user_id] = ticket
+                self.enqueued += 1
+            pair = self._pair(self._tickets[user_id], self.clock())
+            if pair is None:
+                self._start_ticker()
+
+        if pair is not None:
+            self._create_room(*pair)
+            return self.status(user_id)
+        return {"queued": True, "window": self._window(0)}
+
+    def status(self, user_id):
+        """
+        Returns: the user's match once (then forgets it), {"queued": True,
+                 "window", "waited"} while waiting, or None if not queued
+        """
+        user_id = str(user_id)
+        with self._lock:
+            match = self._matched.pop(user_id, None)
+            if match is not None:
+                return {"room_code": match[0], "created_game": match[1]}
+            ticket = self._tickets.get(user_id) or self._matching.get(user_id)
+            if ticket is None:
+                return None
+            waited = self.clock() - ticket.enqueued_at
+            return {"queued": True, "window": self._window(waited), "waited": round(waited, 1)}
+
+    def cancel(self, user_id):
+        """
+        Take a user out of the queue
+
+        Returns: True if they were waiting
+        """
+        with self._lock:
+            ticket = self._tickets.get(str(user_id))
+            if ticket is None:
+                return False
+            self._remove(ticket)
+            self.cancelled += 1
+            return True
+
+    def sweep(self):
+        """
+        Pair every waiting user whose widened window now allows it,
+        longest-waiting first, and forget matches nobody polled for
+
+        Returns: number of pairs made
+        """
+        pairs = []
+        now = self.clock()
+        with self._lock:
+            # Tickets are kept in the order users queued
+            for ticket in list(self._tickets.values()):
+                if ticket.user_id in self._tickets:
+                    pair = self._pair(ticket, now)
+                    if pair is not None:
+                        pairs.append(pair)
+            for user_id, match in list(self._matched.items()):
+                if now - match[2] > 300:
+                    del self._matched[user_id]
+        for pair in pairs:
+            self._create_room(*pair)
+        return len(pairs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": len(self._tickets),
+                "tiers": len(self._tiers),
+                "enqueued": self.enqueued,
+                "matches": self.matches,
+                "cancelled": self.cancelled,
+                "avg_wait": self.total_wait / (2 * self.matches) if self.matches else 0.0,
+                "max_wait": self.max_wait,
+                "avg_rating_gap": self.total_gap / self.matches if self.matches else 0.0
+            }
+
+    def _tier(self, rating):
+        return int(rating // self.tier_width)
+
+    def _window(self, waited):
+        return min(self.base_window + self.widen_rate * waited, self.max_window)
+
+    def _pair(self, ticket, now):
+        # Called with the lock held; removes and returns (creator, opponent)
+        window = self._window(now - ticket.enqueued_at)
+        best = None
+        for tier in range(self._tier(ticket.rating - window), self._tier(ticket.rating + window) + 1):
+            for candidate in self._tiers.get(tier, {}).values():
+                if best is not None and candidate.enqueued_at >= best.enqueued_at:
+                    # Tiers are oldest first; nothing later here beats best
+                    break
+                if candidate is ticket:
+                    continue
+                gap = abs(candidate.rating - ticket.rating)
+                if gap <= window and gap <= self._window(now - candidate.enqueued_at):
+                    best = candidate
+                    break
+        if best is None:
+            return None
+
+        creator, opponent = (best, ticket) if best.enqueued_at <= ticket.enqueued_at else (ticket, best)
+        self._remove(creator)
+        self._remove(opponent)
+        self._matching[creator.user_id] = creator
+        self._matching[opponent.user_id] = opponent
+        self._count_match(creator, opponent, now)
+        return creator.user_id, opponent.user_id
+
+    def _count_match(self, creator, opponent, now):
+        self.matches += 1
+        self.total_gap += abs(creator.rating - opponent.rating)
+        for waiting in (creator, opponent):
+            waited = now - waiting.enqueued_at
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def _remove(self, ticket):
+        del self._tickets[ticket.user_id]
+        tier = self._tiers[self._tier(ticket.rating)]
+        del tier[ticket.user_id]
+        if not tier:
+            del self._tiers[self._tier(ticket.rating)]
+
+    def _create_room(self, creator_id, opponent_id):
+        try:
+            room_code = self.on_match(creator_id, opponent_id)
+        except Exception as e:
+            log.error("matched_room_failed", error=str(e))
+            self._requeue(creator_id, opponent_id)
+            return
+        self._deliver(room_code, creator_id, opponent_id)
+
+    def _requeue(self, *user_ids):
+        with self._lock:
+            now = self.clock()
+            for user_id in user_ids:
+                self._matching.pop(user_id, None)
+                ticket = Ticket(user_id, self.rating(user_id), now)
+                self._tickets[user_id] = ticket
+                self._tiers.setdefault(self._tier(ticket.rating), {})[user_id] = ticket
+            self._start_ticker()
+
+    def _deliver(self, room_code, creator_id, opponent_id):
+        now = self.clock()
+        with self._lock:
+            self._matching.pop(creator_id, None)
+            self._matching.pop(opponent_id, None)
+            self._matched[creator_id] = (room_code, True, now)
+            self._matched[opponent_id] = (room_code, False, now)
+
+    def _start_ticker(self):
+        # Called with the lock held
+        if not self._ticker:
+            self._ticker = True
+            self.spawn(self._run_ticker)
+
+    def _idle(self):
+        return not self._tickets
+
+    def _run_ticker(self):
+        while True:
+            self.sleep(self.tick)
+            with self._lock:
+                if self._idle():
+                    # Idle - the next queued user starts a new ticker
+                    self._ticker = False
+                    return
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error("matchmaking_sweep_failed", error=str(e))
+
+class SharedMatchmaker(Matchmaker):
+    """
+    Matchmaker whose queue lives in Redis, so users waiting on different
+    workers and nodes are paired with each other
+
+    Waiting users are a sorted set scored by rating, which the search
+    window reads as a score range, plus a hash of when each joined. Windows
+    and the oldest-acceptable-opponent rule are Matchmaker's. A pair is
+    claimed with one ZREM per user: Redis lets exactly one caller remove a
+    member, so whichever worker removes both users owns the pair, and one
+    that loses the opponent puts its own user back. The claimed pair sits in
+    a matching hash while their room is created, and matches wait in a shared
+    hash until the user polls, on any worker. Every worker with users in
+    the queue runs a ticker; metrics other than queued are this worker's.
+
+    Parameters: redis - redis.Redis client with decode_responses=True, or a
+                LocalRedis stand-in; the rest as Matchmaker, with clock
+                defaulting to wall time, which workers share
+    """
+
+    def __init__(self, redis, rating, on_match, clock=time.time, **kwargs):
+        super().__init__(rating, on_match, clock=clock, **kwargs)
+        self.r = redis
+        self.queue_key = f"{KEY_PREFIX}matchmaking:queue"
+        self.joined_key = f"{KEY_PREFIX}matchmaking:joined"
+        self.matching_key = f"{KEY_PREFIX}matchmaking:matching"
+        self.matched_key = f"{KEY_PREFIX}matchmaking:matched"
+
+    def join(self, user_id):
+        user_id = str(user_id)
+        status = self.status(user_id)
+        if status is not None:
+            return status
+
+        rating = self.rating(user_id)
+        added = (self.r.pipeline()
+                 .hsetnx(self.joined_key, user_id, self.clock())
+                 .zadd(self.queue_key, {user_id: rating}, nx=True)
+                 .execute())[1]
+        self.enqueued += added
+        pair = self._claim(user_id, self.clock())
+        if pair is not None:
+            self._create_room(*pair)
+            return self.status(user_id)
+        with self._lock:
+            self._start_ticker()
+        return {"queued": True, "window": self._window(0)}
+
+    def status(self, user_id):
+        user_id = str(user_id)
+        # One transaction, so a pair moving from matching to matched is seen in one of them
+        match, joined, matching = (self.r.pipeline()
+                                   .hget(self.matched_key, user_id)
+                                   .hget(self.joined_key, user_id)
+                                   .hget(self.matching_key, user_id)
+                                   .execute())
+        if match is not None and self.r.hdel(self.matched_key, user_id):
+            room_code, created_game, _ = json.loads(match)
+            return {"room_code": room_code, "created_game": created_game}
+        if joined is None:
+            if matching is None:
+                return None
+            joined = json.loads(matching)[0]
+        waited = self.clock() - float(joined)
+        return {"queued": True, "window": self._window(waited), "waited": round(waited, 1)}
+
+    def cancel(self, user_id):
+        user_id = str(user_id)
+        removed = self.r.pipeline().zrem(self.queue_key, user_id).hdel(self.joined_key, user_id).execute()[0]
+        if removed:
+            self.cancelled += 1
+        return bool(removed)
+
+    def sweep(self):
+        now = self.clock()
+        joined = self.r.hgetall(self.joined_key)
+        pairs = 0
+        # Longest-waiting first, as Matchmaker does
+        for user_id, _ in sorted(joined.items(), key=lambda item: float(item[1])):
+            pair = self._claim(user_id, now)
+            if pair is not None:
+                self._create_room(*pair)
+                pairs += 1
+        for key, matched_at in ((self.matched_key, 2), (self.matching_key, 1)):
+            stale = [user_id for user_id, match in self.r.hgetall(key).items()
+                     if now - json.loads(match)[matched_at] > 300]
+            if stale:
+                self.r.hdel(key, *stale)
+        return pairs
+
+    def stats(self):
+        stats = super().stats()
+        del stats["tiers"]
+        stats["queued"] = self.r.zcard(self.queue_key)
+        return stats
+
+    def _claim(self, user_id, now):
+        # Returns (creator, opponent) once both are removed from the queue
+        rating, joined = self.r.pipeline(transaction=False).zscore(self.queue_key, user_id) \
+            .hget(self.joined_key, user_id).execute()
+        if rating is None or joined is None:
+            return None
+        ticket = Ticket(user_id, float(rating), float(joined))
+        window = self._window(now - ticket.enqueued_at)
+        candidates = [(member, score) for member, score in
+                      self.r.zrangebyscore(self.queue_key, ticket.rating - window, ticket.rating + window,
+                                           withscores=True) if member != user_id]
+        if not candidates:
+            return None
+        joined = self.r.hmget(self.joined_key, [member for member, _ in candidates])
+        acceptable = [Ticket(member, float(score), float(enqueued_at))
+                      for (member, score), enqueued_at in zip(candidates, joined) if enqueued_at is not None]
+        acceptable = [candidate for candidate in acceptable
+                      if abs(candidate.rating - ticket.rating) <= self._window(now - candidate.enqueued_at)]
+        if not acceptable:
+            return None
+        best = min(acceptable, key=lambda candidate: candidate.enqueued_at)
+
+        # Claim our own user first; losing it means another worker paired them
+        if not self.r.zrem(self.queue_key, user_id):
+            return None
+        if not self.r.zrem(self.queue_key, best.user_id):
+            # The opponent went to another worker's pair; back in line
+            self.r.zadd(self.queue_key, {user_id: ticket.rating}, nx=True)
+            return None
+        (self.r.pipeline()
+         .hset(self.matching_key, mapping={
+             user_id: json.dumps([ticket.enqueued_at, now]),
+             best.user_id: json.dumps([best.enqueued_at, now])
+         })
+         .hdel(self.joined_key, user_id, best.user_id)
+         .execute())
+        creator, opponent = (best, ticket) if best.enqueued_at <= ticket.enqueued_at else (ticket, best)
+        with self._lock:
+            self._count_match(creator, opponent, now)
+        return creator.user_id, opponent.user_id
+
+    def _requeue(self, *user_ids):
+        now = self.clock()
+        pipe = self.r.pipeline()
+        for user_id in user_ids:
+            pipe.hset(self.joined_key, user_id, now)
+            pipe.zadd(self.queue_key, {user_id: self.rating(user_id)})
+            pipe.hdel(self.matching_key, user_id)
+        pipe.execute()
+        with self._lock:
+            self._start_ticker()
+
+    def _deliver(self, room_code, creator_id, opponent_id):
+        now = self.clock()
+        (self.r.pipeline()
+         .hset(self.matched_key, mapping={
+             creator_id: json.dumps([room_code, True, now]),
+             opponent_id: json.dumps([room_code, False, now])
+         })
+         .hdel(self.matching_key, creator_id, opponent_id)
+         .execute())
+
+    def _idle(self):
+        return not self.r.zcard(self.queue_key)
@@ -0,0 +1,187 @@
+import bisect, threading
+from logs import get_logger
+
+log = get_logger()
+
+# Upper bounds in seconds, from a fast cache hit to a slow judge run
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    """
+    Fixed-bucket histogram of observed values, typically latencies
+
+    Observing is a bisect and two additions, cheap enough for hot paths.
+    Quantiles are estimated by interpolating inside the bucket they fall in.
+
+    Parameters: buckets - sorted upper bounds, an implicit +Inf bucket
+                catches everything above the last one
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """
+        Returns: estimated value below which a fraction q of observations fall
+        """
+        with self._lock:
+            return self._quantile(q)
+
+    def snapshot(self):
+        """
+        Returns: dict with count, sum, avg, p50/p90/p99 and cumulative
+                 counts per upper bound
+        """
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + ("+Inf",), self._counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "avg": self._sum / self._count if self._count else 0.0,
+                "p50": self._quantile(0.5),
+                "p90": self._quantile(0.9),
+                "p99": self._quantile(0.99),
+                "buckets": buckets
+            }
+
+    def _quantile(self, q):
+        # Called with the lock held
+        if not self._count:
+            return 0.0
+        rank = q * self._count
+        seen = 0
+        for i, count in enumerate(self._counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                # Everything above the last bound is reported as that bound
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """
+    Counters, histograms and scrape-time gauges rendered in the Prometheus
+    text exposition format
+
+    Counters and histograms are keyed by a tuple of label values, so
+    recording one is a dict lookup plus the update. Gauges are callables
+    evaluated only when the metrics are scraped, so values such as queue
+    depth or pool usage cost nothing between scrapes.
+
+    Parameters: prefix - prepended to every metric name
+    """
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._families = {}  # name -> (type, help, label names, {label values: value})
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        self._family(name, "counter", help, labels)
+        return lambda *values, amount=1: self._inc(name, values, amount)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self._family(name, "histogram", help, labels, buckets)
+        return lambda *values: self._histogram(name, values)
+
+    def attach(self, name, help, histograms, label):
+        """
+        Export histograms kept elsewhere, e.g. a component's own latency
+        dict, as one family labelled by their keys
+        """
+        self._family(name, "histogram", help, (label,))
+        self._families[name][3].update({(key,): histogram for key, histogram in histograms.items()})
+
+    def gauge(self, name, help, read, labels=()):
+        """
+        Register a gauge read at scrape time; read() returns a number, or a
+        dict of label value tuples -> number when labels are given
+        """
+        self._family(name, "gauge", help, labels)
+        self._collectors.append(((name,), lambda: {name: read()}))
+
+    def gauges(self, specs, read):
+        """
+        Register several gauges filled by one read at scrape time
+
+        Parameters: specs - list of (name, help, labels), read - callable
+                    returning a dict of name -> value as for gauge()
+        """
+        for name, help, labels in specs:
+            self._family(name, "gauge", help, labels)
+        self._collectors.append((tuple(name for name, _, _ in specs), read))
+
+    def render(self):
+        """
+        Returns: all metrics in the Prometheus text format
+        """
+        for names, read in self._collectors:
+            try:
+                values = read()
+            except Exception as e:
+                log.error("metrics_read_failed", metrics=names, error=str(e))
+                continue
+            with self._lock:
+                for name in names:
+                    value = values.get(name, 0)
+                    samples = self._families[name][3]
+                    samples.clear()
+                    samples.update(value if isinstance(value, dict) else {(): value})
+
+        lines = []
+        with self._lock:
+            families = [(name, family[:3], dict(family[3])) for name, family in self._families.items()]
+        for name, (kind, help, label_names), samples in families:
+            full_name = self.prefix + name
+            lines.append(f"# HELP {full_name} {help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for values, sample in samples.items():
+                labels = [f'{label}="{_escape(value)}"' for label, value in zip(label_names, values)]
+                if kind == "histogram":
+                    snapshot = sample.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        bucket_labels = labels + [f'le="{bound}"']
+                        lines.append(f"{full_name}_bucket{_labels(bucket_labels)} {count}")
+                    lines.append(f"{full_name}_sum{_labels(labels)} {snapshot['sum']}")
+                    lines.append(f"{full_name}_count{_labels(labels)} {snapshot['count']}")
+                else:
+                    lines.append(f"{full_name}{_labels(labels)} {sample}")
+        return "\n".join(lines) + "\n"
+
+    def _family(self, name, kind, help, labels, buckets=None):
+        with self._lock:
+            self._families[name] = (kind, help, tuple(labels), {}, buckets)
+
+    def _inc(self, name, values, amount):
+        samples = self._families[name][3]
+        with self._lock:
+            samples[values] = samples.get(values, 0) + amount
+
+    def _histogram(self, name, values):
+        family = self._families[name]
+        histogram = family[3].get(values)
+        if histogram is None:
+            with self._lock:
+                histogram = family[3].setdefault(values, Histogram(family[4]))
+        return histogram
+
+def _labels(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,170 @@
+import gzip, json, os, re, shutil, threading, time
+from collections import deque
+from logs import get_logger
+
+log = get_logger()
+
+MATCH_ID_PATTERN = re.compile(r"^[A-Z0-9]{6}-\d+$")
+
+class ReplayRecorder:
+    """
+    Append-only event log per match, written off the hot path
+
+    record() only appends a tuple to an in-memory buffer; a background
+    thread drains it every flush_interval and appends compact JSON lines -
+    [ms since match start, event, data] - to the match's log. When a match
+    ends its log is gzipped, and finished matches can be streamed back.
+
+    Parameters: directory - where logs are kept, flush_interval - seconds,
+                max_buffer - buffered events kept before new ones are dropped
+    """
+
+    def __init__(self, directory="replays", flush_interval=1.0, max_buffer=100000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._buffer = deque()
+        self._matches = {}  # room_code -> (match_id, started_at monotonic)
+        self._files = {}  # match_id -> open log file, writer thread only
+        self._thread = None
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()
+
+        # Metrics
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.finished = 0
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run_writer, name="replays", daemon=True)
+            self._thread.start()
+
+    def begin(self, room_code, data=None):
+        """
+        Start recording a new match in a room, ending any previous one
+
+        Returns: match id
+        """
+        if room_code in self._matches:
+            self.end(room_code)
+        match_id = f"{room_code}-{int(time.time() * 1000)}"
+        self._matches[room_code] = (match_id, time.monotonic())
+        self._buffer.append((match_id, 0, "begin", {"room_code": room_code, "started_at": time.time(), **(data or {})}))
+        return match_id
+
+    def match_id(self, room_code):
+        match = self._matches.get(room_code)
+        return match[0] if match else None
+
+    def record(self, room_code, event, data):
+        """
+        Buffer one event of the room's current match; no-op outside a match
+        """
+        match = self._matches.get(room_code)
+        if match is None:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append((match[0], int((time.monotonic() - match[1]) * 1000), event, data))
+        self.recorded += 1
+
+    def end(self, room_code):
+        """
+        Stop recording the room's match; its log is finalized by the writer
+        """
+        match = self._matches.pop(room_code, None)
+        if match is not None:
+            self._buffer.append((match[0], None, None, None))
+            self._wake.set()
+
+    def path(self, match_id):
+        """
+        Returns: path of a finished match's log, or None
+        """
+        if not MATCH_ID_PATTERN.match(match_id or ""):
+            return None
+        path = os.path.join(self.directory, f"{match_id}.jsonl.gz")
+        return path if os.path.exists(path) else None
+
+    def stream(self, match_id):
+        """
+        Yield a finished match's log line by line
+        """
+        with gzip.open(self.path(match_id), "rt") as f:
+            for line in f:
+                yield line
+
+    def matches(self, room_code=None):
+        """
+        Returns: ids of finished matches, newest first
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        ids = [name[:-len(".jsonl.gz")] for name in names if name.endswith(".jsonl.gz")]
+        if room_code:
+            ids = [match_id for match_id in ids if match_id.startswith(f"{room_code}-")]
+        return sorted(ids, key=lambda match_id: int(match_id.rsplit("-", 1)[1]), reverse=True)
+
+    def stats(self):
+        return {
+            "active_matches": len(self._matches),
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "finished": self.finished
+        }
+
+    def close(self):
+        for room_code in list(self._matches):
+            self.end(room_code)
+        self._drain()
+
+    def _run_writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self._drain()
+            except Exception as e:
+                log.error("replay_write_failed", error=str(e))
+
+    def _drain(self):
+        with self._write_lock:
+            self._drain_locked()
+
+    def _drain_locked(self):
+        touched = set()
+        while self._buffer:
+            match_id, elapsed, event, data = self._buffer.popleft()
+            if event is None:
+                self._finish(match_id)
+                touched.discard(match_id)
+                continue
+            f = self._files.get(match_id)
+            if f is None:
+                f = self._files[match_id] = open(os.path.join(self.directory, f"{match_id}.jsonl"), "a")
+            f.write(json.dumps([elapsed, event, data], separators=(",", ":")) + "\n")
+            touched.add(match_id)
+            self.written += 1
+        for match_id in touched:
+            self._files[match_id].flush()
+
+    def _finish(self, match_id):
+        f = self._files.pop(match_id, None)
+        if f is None:
+            return
+        f.close()
+        raw_path = os.path.join(self.directory, f"{match_id}.jsonl")
+        with open(raw_path, "rb") as src, gzip.open(f"{raw_path}.gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(f"{raw_path}.gz.tmp", f"{raw_path}.gz")
+        os.remove(raw_path)
+        self.finished += 1
@@ -0,0 +1,516 @@
+import copy, json, threading, time
+from rooms import STARTING_HEALTH, PlayerState, Room, active_question, generate_room_code
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:
+    class WatchError(Exception):
+        """
+        Raised by LocalPipeline.execute when a watched key changed
+        """
+
+KEY_PREFIX = "duel:"
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of Redis that SharedRoomStore and
+    SharedMatchmaker use
+
+    Values are stored as strings like Redis with decode_responses=True.
+    Only shares state within one process, so it is meant for development,
+    benchmarks and exercising SharedRoomStore without a Redis server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def exists(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if key in self._data)
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    # Hashes
+    def hget(self, key, field):
+        with self._lock:
+            return self._data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data.get(key, {}))
+
+    def hmget(self, key, fields):
+        with self._lock:
+            data = self._data.get(key, {})
+            return [data.get(field) for field in fields]
+
+    def hexists(self, key, field):
+        with self._lock:
+            return field in self._data.get(key, {})
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            fields = dict(mapping or {})
+            if field is not None:
+                fields[field] = value
+            data = self._data.setdefault(key, {})
+            added = sum(1 for name in fields if name not in data)
+            data.update((name, str(value)) for name, value in fields.items())
+            return added
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            data = self._data.setdefault(key, {})
+            if field in data:
+                return 0
+            data[field] = str(value)
+            return 1
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            data = self._data.get(key, {})
+            removed = sum(1 for field in fields if data.pop(field, None) is not None)
+            if key in self._data and not data:
+                del self._data[key]
+            return removed
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            data = self._data.setdefault(key, {})
+            data[field] = str(int(data.get(field, 0)) + amount)
+            return int(data[field])
+
+    # Lists
+    def rpush(self, key, *values):
+        with self._lock:
+            items = self._data.setdefault(key, [])
+            items.extend(str(value) for value in values)
+            return len(items)
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            items = self._data.get(key, [])
+            return list(items[start:None if end == -1 else end + 1])
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._data.get(key, []))
+
+    def lrem(self, key, count, value):
+        # Only count=0 (remove all) is used here
+        with self._lock:
+            items = self._data.get(key, [])
+            kept = [item for item in items if item != str(value)]
+            removed = len(items) - len(kept)
+            if kept:
+                self._data[key] = kept
+            else:
+                self._data.pop(key, None)
+            return removed
+
+    # Sets
+    def sadd(self, key, *members):
+        with self._lock:
+            data = self._data.setdefault(key, set())
+            before = len(data)
+            data.update(str(member) for member in members)
+            return len(data) - before
+
+    def srem(self, key, *members):
+        with self._lock:
+            data = self._data.get(key, set())
+            before = len(data)
+            data.difference_update(str(member) for member in members)
+            if key in self._data and not data:
+                del self._data[key]
+            return before - len(data)
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self._data.get(key, set()))
+
+    def scard(self, key):
+        with self._lock:
+            return len(self._data.get(key, set()))
+
+    # Sorted sets
+    def zadd(self, key, mapping, nx=False):
+        with self._lock:
+            data = self._data.setdefault(key, {})
+            added = 0
+            for member, score in mapping.items():
+                if member in data and nx:
+                    continue
+                added += member not in data
+                data[str(member)] = float(score)
+            return added
+
+    def zrem(self, key, *members):
+        with self._lock:
+            data = self._data.get(key, {})
+            removed = sum(1 for member in members if data.pop(str(member), None) is not None)
+            if key in self._data and not data:
+                del self._data[key]
+            return removed
+
+    def zrange(self, key, start, end):
+        with self._lock:
+            members = sorted(self._data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+            return [member for member, _ in members[start:None if end == -1 else end + 1]]
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        with self._lock:
+            members = sorted(((member, score) for member, score in self._data.get(key, {}).items()
+                              if low <= score <= high), key=lambda item: (item[1], item[0]))
+            return members if withscores else [member for member, _ in members]
+
+    def zscore(self, key, member):
+        with self._lock:
+            return self._data.get(key, {}).get(str(member))
+
+    def zcard(self, key):
+        with self._lock:
+            return len(self._data.get(key, {}))
+
+class LocalPipeline:
+    """
+    Queues LocalRedis commands and runs them together under its lock
+
+    Like a redis-py pipeline, watch() switches to running commands at once
+    until multi(), and execute() raises WatchError if a watched key changed
+    since it was watched.
+    """
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+        self._watched = None  # key -> copy of its value when watched
+        self._immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+        if self._immediate:
+            return method
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def watch(self, *keys):
+        with self._redis._lock:
+            self._watched = {key: copy.deepcopy(self._redis._data.get(key)) for key in keys}
+        self._immediate = True
+
+    def multi(self):
+        self._immediate = False
+
+    def reset(self):
+        self._commands = []
+        self._watched = None
+        self._immediate = False
+
+    def execute(self):
+        try:
+            with self._redis._lock:
+                if self._watched and any(self._redis._data.get(key) != value
+                                         for key, value in self._watched.items()):
+                    raise WatchError("Watched variable changed.")
+                return [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        finally:
+            self.reset()
+
+class SharedRoomStore:
+    """
+    Room store kept in Redis so any worker on any node can serve any event
+
+    Implements the RoomRegistry interface. Each room is a hash of room
+    fields, a list of player ids in join order, a hash per player and a hash
+    of spectators; the player and socket indexes are shared hashes. Updates that race across workers use
+    single atomic commands: damage is an HINCRBY on damage taken, answering
+    and skipping HDEL the active question, and finishing a game and claiming
+    a player slot are HSETNX guards. Drawing a question updates the room's
+    shared decks, so it runs as a WATCH/MULTI transaction on the room and
+    the player, retried if either changed.
+
+    Parameters: redis - redis.Redis client with decode_responses=True, or a
+                LocalRedis stand-in
+    """
+
+    def __init__(self, redis):
+        self.r = redis
+        self.rooms_key = f"{KEY_PREFIX}rooms"
+        self.user_rooms_key = f"{KEY_PREFIX}user_rooms"
+        self.socket_users_key = f"{KEY_PREFIX}socket_users"
+        self.user_sockets_key = f"{KEY_PREFIX}user_sockets"
+        self.connections_key = f"{KEY_PREFIX}connections"
+
+    @classmethod
+    def from_url(cls, url):
+        """
+        Parameters: url - redis:// URL, or "local" for the in-process stand-in
+        """
+        if url == "local":
+            return cls(LocalRedis())
+        import redis
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    def _room_key(self, room_code):
+        return f"{KEY_PREFIX}room:{room_code}"
+
+    def _order_key(self, room_code):
+        return f"{KEY_PREFIX}room:{room_code}:players"
+
+    def _player_key(self, room_code, user_id):
+        return f"{KEY_PREFIX}room:{room_code}:player:{user_id}"
+
+    def _spectators_key(self, room_code):
+        return f"{KEY_PREFIX}room:{room_code}:spectators"
+
+    @staticmethod
+    def _player_state(fields):
+        active = fields.get("active")
+        return PlayerState(
+            health=max(STARTING_HEALTH - int(fields.get("damage", 0)), 0),
+            code=fields.get("code", ""),
+            questions_answered=int(fields.get("answered", 0)),
+            active_question=json.loads(active) if active else None,
+            socket_id=fields.get("sid")
+        )
+
+    def get(self, room_code):
+        """
+        Returns: a Room snapshot, or None if there is no such room
+        """
+        if not room_code:
+            return None
+        fields, order, spectators = (self.r.pipeline(transaction=False)
+                                     .hgetall(self._room_key(room_code))
+                                     .lrange(self._order_key(room_code), 0, -1)
+                                     .hgetall(self._spectators_key(room_code))
+                                     .execute())
+        if not fields.get("creator"):
+            return None
+        pipe = self.r.pipeline(transaction=False)
+        for user_id in order:
+            pipe.hgetall(self._player_key(room_code, user_id))
+        players = pipe.execute() if order else []
+        return Room(
+            creator=fields["creator"],
+            is_random=fields.get("is_random") == "1",
+            status=fields.get("status", "waiting"),
+            start_time=float(fields["start_time"]) if fields.get("start_time") else None,
+            players={user_id: self._player_state(state) for user_id, state in zip(order, players)},
+            spectators=spectators,
+            questions_asked=json.loads(fields.get("questions_asked", "[]")),
+            question_decks=json.loads(fields.get("question_decks", "{}"))
+        )
+
+    def get_player(self, room_code, user_id):
+        """
+        Returns: the player's PlayerState, or None if they are not playing there
+        """
+        if not room_code or not user_id:
+            return None
+        fields = self.r.hgetall(self._player_key(room_code, user_id))
+        return self._player_state(fields) if fields else None
+
+    def all_rooms(self):
+        rooms = {}
+        for room_code in self.r.smembers(self.rooms_key):
+            room = self.get(room_code)
+            if room is not None:
+                rooms[room_code] = room
+        return rooms
+
+    def room_of(self, user_id):
+        return self.r.hget(self.user_rooms_key, user_id)
+
+    def create(self, user_id, is_random=False):
+        room_code = generate_room_code()
+        # HSETNX on creator claims the code; retry on collision
+        while not self.r.hsetnx(self._room_key(room_code), "creator", user_id):
+            room_code = generate_room_code()
+        pipe = self.r.pipeline()
+        pipe.hset(self._room_key(room_code), mapping={
+            "is_random": "1" if is_random else "0",
+            "status": "waiting",
+            "questions_asked": "[]",
+            "question_decks": "{}"
+        })
+        pipe.rpush(self._order_key(room_code), user_id)
+        pipe.hset(self._player_key(room_code, user_id), mapping={"damage": 0, "answered": 0, "code": ""})
+        pipe.sadd(self.rooms_key, room_code)
+        pipe.hset(self.user_rooms_key, user_id, room_code)
+        pipe.execute()
+        return room_code
+
+    def set_status(self, room_code, status):
+        if not self.r.hexists(self._room_key(room_code), "creator"):
+            return
+        pipe = self.r.pipeline()
+        pipe.hset(self._room_key(room_code), "status", status)
+        if status != 'finished':
+            pipe.hdel(self._room_key(room_code), "finished")
+        pipe.execute()
+
+    def start_game(self, room_code):
+        started = time.time()
+        (self.r.pipeline()
+         .hset(self._room_key(room_code), mapping={"status": "ready", "start_time": started})
+         .hdel(self._room_key(room_code), "finished")
+         .execute())
+        return started
+
+    def finish(self, room_code):
+        if not self.r.hexists(self._room_key(room_code), "creator"):
+            return False
+        if not self.r.hsetnx(self._room_key(room_code), "finished", "1"):
+            return False
+        self.r.hset(self._room_key(room_code), "status", "finished")
+        return True
+
+    def add_player(self, room_code, user_id, socket_id=None):
+        """
+        Add a player unless the room already has two
+
+        Returns: the player's PlayerState, or None if the room is full
+        """
+        if not self.r.hexists(self._room_key(room_code), "creator"):
+            raise KeyError(room_code)
+        player_key = self._player_key(room_code, user_id)
+        if self.r.hsetnx(player_key, "damage", 0):
+            # New player: take a slot, and give it back if two were taken first
+            if self.r.rpush(self._order_key(room_code), user_id) > 2:
+                self.r.pipeline().lrem(self._order_key(room_code), 0, user_id).delete(player_key).execute()
+                return None
+        pipe = self.r.pipeline()
+        if socket_id is not None:
+            pipe.hset(player_key, "sid", socket_id)
+        pipe.hset(self.user_rooms_key, user_id, room_code)
+        pipe.execute()
+        return self.get_player(room_code, user_id)
+
+    def remove_player(self, room_code, user_id):
+        if not self.r.hexists(self._room_key(room_code), "creator"):
+            return None
+        pipe = self.r.pipeline()
+        pipe.lrem(self._order_key(room_code), 0, user_id)
+        pipe.delete(self._player_key(room_code, user_id))
+        pipe.lrange(self._order_key(room_code), 0, -1)
+        remaining = pipe.execute()[-1]
+        if self.r.hget(self.user_rooms_key, user_id) == room_code:
+            self.r.hdel(self.user_rooms_key, user_id)
+
+        if not remaining:
+            self._delete(room_code)
+            return None
+        return remaining
+
+    def add_spectator(self, room_code, user_id, socket_id):
+        self.r.hset(self._spectators_key(room_code), user_id, socket_id)
+
+    def remove_spectator(self, room_code, user_id):
+        self.r.hdel(self._spectators_key(room_code), user_id)
+
+    def assign_question(self, room_code, user_id, pick, started_at=None):
+        room_key, player_key = self._room_key(room_code), self._player_key(room_code, user_id)
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(room_key, player_key)
+                    if not pipe.exists(player_key) or pipe.hget(player_key, "active"):
+                        return None
+                    questions_asked = json.loads(pipe.hget(room_key, "questions_asked") or "[]")
+                    question_decks = json.loads(pipe.hget(room_key, "question_decks") or "{}")
+                    problem = pick(questions_asked, question_decks)
+                    if problem is None:
+                        return None
+                    questions_asked.append(problem['problem_id'])
+                    pipe.multi()
+                    pipe.hset(player_key, "active", json.dumps(active_question(problem, started_at)))
+                    pipe.hset(room_key, mapping={
+                        "questions_asked": json.dumps(questions_asked),
+                        "question_decks": json.dumps(question_decks)
+                    })
+                    pipe.execute()
+                    return problem
+                except WatchError:
+                    # The other player drew, or this one got a question, meanwhile
+                    continue
+
+    def clear_question(self, room_code, user_id):
+        player_key = self._player_key(room_code, user_id)
+        active, removed = self.r.pipeline().hget(player_key, "active").hdel(player_key, "active").execute()
+        return json.loads(active) if removed and active else None
+
+    def record_answer(self, room_code, user_id):
+        player_key = self._player_key(room_code, user_id)
+        # Only the HDEL that actually removed the question counts the answer
+        if not self.r.hdel(player_key, "active"):
+            return False
+        self.r.hincrby(player_key, "answered", 1)
+        return True
+
+    def apply_damage(self, room_code, user_id, amount):
+        player_key = self._player_key(room_code, user_id)
+        if not self.r.exists(player_key):
+            return None
+        return max(STARTING_HEALTH - self.r.hincrby(player_key, "damage", amount), 0)
+
+    def set_code(self, room_code, user_id, code):
+        player_key = self._player_key(room_code, user_id)
+        if self.r.exists(player_key):
+            self.r.hset(player_key, "code", code)
+
+    def connection_opened(self, socket_id):
+        return self.r.pipeline().sadd(self.connections_key, socket_id).scard(self.connections_key).execute()[-1]
+
+    def connection_closed(self, socket_id):
+        return self.r.pipeline().srem(self.connections_key, socket_id).scard(self.connections_key).execute()[-1]
+
+    def connection_count(self):
+        return self.r.scard(self.connections_key)
+
+    def bind_socket(self, socket_id, user_id, room_code):
+        (self.r.pipeline()
+         .hset(self.socket_users_key, socket_id, json.dumps([user_id, room_code]))
+         .hset(self.user_sockets_key, user_id, socket_id)
+         .execute())
+
+    def socket_of(self, user_id):
+        return self.r.hget(self.user_sockets_key, user_id)
+
+    def unbind_socket(self, socket_id):
+        binding = self.r.hget(self.socket_users_key, socket_id)
+        if binding is None or not self.r.hdel(self.socket_users_key, socket_id):
+            return None
+        user_id, room_code = json.loads(binding)
+        if self.r.hget(self.user_sockets_key, user_id) == socket_id:
+            self.r.hdel(self.user_sockets_key, user_id)
+        return user_id, room_code
+
+    def unbind_user(self, user_id):
+        socket_id = self.r.hget(self.user_sockets_key, user_id)
+        if socket_id is not None:
+            self.r.pipeline().hdel(self.user_sockets_key, user_id).hdel(self.socket_users_key, socket_id).execute()
+
+    def _delete(self, room_code):
+        order = self.r.lrange(self._order_key(room_code), 0, -1)
+        pipe = self.r.pipeline()
+        pipe.delete(self._room_key(room_code), self._order_key(room_code), self._spectators_key(room_code),
+                    *[self._player_key(room_code, user_id) for user_id in order])
+        pipe.srem(self.rooms_key, room_code)
+        pipe.execute()
@@ -0,0 +1,365 @@
+import random, string, threading, time
+from dataclasses import dataclass, field
+
+STARTING_HEALTH = 100
+
+def generate_room_code():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+
+@dataclass(slots=True)
+class PlayerState:
+    """
+    Per-player state inside a room
+    """
+    health: int = STARTING_HEALTH
+    code: str = ""
+    questions_answered: int = 0
+    active_question: dict | None = None  # problem_id, title, difficulty, started_at
+    socket_id: str | None = None
+
+@dataclass(slots=True)
+class Room:
+    """
+    State of one game room
+
+    players maps user_id to PlayerState in join order, so the first entry
+    is player 1. spectators maps user_id to socket_id.
+    """
+    creator: str
+    is_random: bool = False
+    status: str = "waiting"
+    start_time: float | None = None
+    players: dict = field(default_factory=dict)
+    spectators: dict = field(default_factory=dict)
+    questions_asked: list = field(default_factory=list)  # Track question IDs already asked
+    question_decks: dict = field(default_factory=dict)  # Shuffled unasked question IDs per difficulty
+
+    def player_ids(self) -> list:
+        return list(self.players)
+
+    def opponent_of(self, user_id):
+        """
+        Returns: the other player's user_id, or None
+        """
+        for player_id in self.players:
+            if player_id != user_id:
+                return player_id
+        return None
+
+    def health(self) -> dict:
+        return {uid: p.health for uid, p in self.players.items()}
+
+    def questions_answered(self) -> dict:
+        return {uid: p.questions_answered for uid, p in self.players.items()}
+
+    def active_questions(self) -> dict:
+        """
+        Returns: user_id -> title and difficulty of the question they are on
+        """
+        return {
+            uid: {'title': p.active_question['title'], 'difficulty': p.active_question['difficulty']}
+            for uid, p in self.players.items() if p.active_question is not None
+        }
+
+    def to_dict(self) -> dict:
+        """
+        Serialize in the shape /api/get_all_games has always returned
+        """
+        return {
+            "creator": self.creator,
+            "players": self.player_ids(),
+            "sockets": {uid: p.socket_id for uid, p in self.players.items() if p.socket_id},
+            "spectators": list(self.spectators),
+            "spectator_sockets": dict(self.spectators),
+            "health": self.health(),
+            "code": {uid: p.code for uid, p in self.players.items()},
+            "questions_answered": self.questions_answered(),
+            "questions_asked": self.questions_asked,
+            "active_questions": {uid: p.active_question for uid, p in self.players.items()
+                                 if p.active_question is not None},
+            "status": self.status,
+            "is_random": self.is_random,
+            "start_time": self.start_time
+        }
+
+    def spectator_snapshot(self) -> dict:
+        """
+        Game state sent to a spectator as they join, apart from the
+        spectator list, which the sender adds
+        """
+        return {
+            'players': self.player_ids(),
+            'health': self.health(),
+            'code': {uid: p.code for uid, p in self.players.items()},  # Send current code state
+            'active_questions': self.active_questions()
+        }
+
+def active_question(problem, started_at=None):
+    """
+    Returns: the active question record stored for a player
+    """
+    return {
+        "problem_id": str(problem['problem_id']),
+        "title": problem['title'],
+        "difficulty": problem['difficulty'],
+        "started_at": started_at
+    }
+
+class RoomRegistry:
+    """
+    In-process room store: game rooms plus the indexes that keep lookups O(1)
+
+    Besides rooms by code it tracks which room each player is in and which
+    room and user each socket belongs to. Rooms returned by get() are
+    read-only views; every change goes through the methods here, which
+    SharedRoomStore in room_store.py implements as well, so handlers work
+    unchanged on either backend.
+    """
+
+    def __init__(self):
+        self.rooms = {}  # room_code -> Room
+        self.user_rooms = {}  # user_id -> room_code the user plays in
+        self.socket_users = {}  # socket_id -> (user_id, room_code)
+        self.user_sockets = {}  # user_id -> socket_id
+        self.connections = set()  # connected socket ids
+        self._lock = threading.Lock()
+
+    def get(self, room_code):
+        return self.rooms.get(room_code)
+
+    def get_player(self, room_code, user_id):
+        """
+        Returns: the player's PlayerState, or None if they are not playing there
+        """
+        room = self.rooms.get(room_code)
+        return room.players.get(user_id) if room else None
+
+    def all_rooms(self):
+        """
+        Returns: dict of room_code -> Room
+        """
+        with self._lock:
+            return dict(self.rooms)
+
+    def room_of(self, user_id):
+        """
+        Returns: code of the room the user plays in, or None
+        """
+        return self.user_rooms.get(user_id)
+
+    def create(self, user_id, is_random=False):
+        """
+        Create a room with user_id as its first player
+
+        Returns: new room code
+        """
+        with self._lock:
+            room_code = generate_room_code()
+            # Ensure unique room code
+            while room_code in self.rooms:
+                room_code = generate_room_code()
+            self.rooms[room_code] = Room(creator=user_id, is_random=is_random, players={user_id: PlayerState()})
+            self.user_rooms[user_id] = room_code
+            return room_code
+
+    def set_status(self, room_code, status):
+        """
+        Change a room's status
+        """
+        with self._lock:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return
+            room.status = status
+
+    def start_game(self, room_code):
+        """
+        Mark a full room ready and start its clock
+
+        Returns: start time
+        """
+        with self._lock:
+            room = self.rooms[room_code]
+            room.status = 'ready'
+            room.start_time = time.time()
+            return room.start_time
+
+    def finish(self, room_code):
+        """
+        Mark a room's game finished
+
+        Returns: True for the caller that finished it, False if it was
+                 already finished or is gone, so results are saved once
+        """
+        with self._lock:
+            room = self.rooms.get(room_code)
+            if room is None or room.status == 'finished':
+                return False
+            room.status = 'finished'
+            return True
+
+    def add_player(self, room_code, user_id, socket_id=None):
+        """
+        Add a player unless the room already has two
+
+        Returns: the player's PlayerState, or None if the room is full
+        """
+        with self._lock:
+            room = self.rooms[room_code]
+            player = room.players.get(user_id)
+            if player is None:
+                if len(room.players) >= 2:
+                    return None
+                player = room.players[user_id] = PlayerState()
+            if socket_id is not None:
+                player.socket_id = socket_id
+            self.user_rooms[user_id] = room_code
+            return player
+
+    def remove_player(self, room_code, user_id):
+        """
+        Remove a player and their per-player state; delete the room if empty
+
+        Returns: list of remaining players, or None if the room was deleted
+        """
+        with self._lock:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return None
+            room.players.pop(user_id, None)
+            if self.user_rooms.get(user_id) == room_code:
+                del self.user_rooms[user_id]
+
+            if not room.players:
+                self._delete(room_code)
+                return None
+            return room.player_ids()
+
+    def add_spectator(self, room_code, user_id, socket_id):
+        with self._lock:
+            self.rooms[room_code].spectators[user_id] = socket_id
+
+    def remove_spectator(self, room_code, user_id):
+        with self._lock:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return
+            room.spectators.pop(user_id, None)
+
+    def assign_question(self, room_code, user_id, pick, started_at=None):
+        """
+        Draw a question and make it the player's active question
+
+        Parameters: pick - callable(questions_asked, question_decks) returning
+                    a problem dict or None, started_at - client timestamp
+        Returns: the problem, or None if the player already has an active
+                 question or nothing could be drawn
+        """
+        with self._lock:
+            room = self.rooms.get(room_code)
+            player = room.players.get(user_id) if room else None
+            if player is None or player.active_question is not None:
+                return None
+            problem = pick(room.questions_asked, room.question_decks)
+            if problem is None:
+                return None
+            room.questions_asked.append(problem['problem_id'])
+            player.active_question = active_question(problem, started_at)
+            return problem
+
+    def clear_question(self, room_code, user_id):
+        """
+        Returns: the player's active question, now cleared, or None if they
+                 had none
+        """
+        with self._lock:
+            player = self.get_player(room_code, user_id)
+            if player is None:
+                return None
+            question, player.active_question = player.active_question, None
+            return question
+
+    def record_answer(self, room_code, user_id):
+        """
+        Count a correct answer and clear the player's active question
+
+        Returns: True if the player had an active question to answer
+        """
+        with self._lock:
+            player = self.get_player(room_code, user_id)
+            if player is None or player.active_question is None:
+                return False
+            player.active_question = None
+            player.questions_answered += 1
+            return True
+
+    def apply_damage(self, room_code, user_id, amount):
+        """
+        Returns: the player's health after the hit, or None if they left
+        """
+        with self._lock:
+            player = self.get_player(room_code, user_id)
+            if player is None:
+                return None
+            player.health = max(player.health - amount, 0)
+            return player.health
+
+    def set_code(self, room_code, user_id, code):
+        player = self.get_player(room_code, user_id)
+        if player is not None:
+            player.code = code
+
+    def connection_opened(self, socket_id):
+        """
+        Returns: number of connected sockets
+        """
+        with self._lock:
+            self.connections.add(socket_id)
+            return len(self.connections)
+
+    def connection_closed(self, socket_id):
+        """
+        Returns: number of connected sockets
+        """
+        with self._lock:
+            self.connections.discard(socket_id)
+            return len(self.connections)
+
+    def connection_count(self):
+        return len(self.connections)
+
+    def bind_socket(self, socket_id, user_id, room_code):
+        with self._lock:
+            self.socket_users[socket_id] = (user_id, room_code)
+            self.user_sockets[user_id] = socket_id
+
+    def socket_of(self, user_id):
+        """
+        Returns: id of the socket the user joined with, or None
+        """
+        return self.user_sockets.get(user_id)
+
+    def unbind_socket(self, socket_id):
+        """
+        Returns: (user_id, room_code) the socket was bound to, or None
+        """
+        with self._lock:
+            binding = self.socket_users.pop(socket_id, None)
+            if binding is not None and self.user_sockets.get(binding[0]) == socket_id:
+                del self.user_sockets[binding[0]]
+            return binding
+
+    def unbind_user(self, user_id):
+        """
+        Drop the socket binding of a user leaving through leave_game
+        """
+        with self._lock:
+            socket_id = self.user_sockets.pop(user_id, None)
+            if socket_id is not None:
+                self.socket_users.pop(socket_id, None)
+
+    def _delete(self, room_code):
+        room = self.rooms.pop(room_code)
+        for user_id in room.players:
+            if self.user_rooms.get(user_id) == room_code:
+                del self.user_rooms[user_id]
@@ -0,0 +1,491 @@
+import io, os, json, tarfile, threading, time
+from collections import deque
+from docker.errors import ImageNotFound
+from metrics import Histogram
+from logs import get_logger
+
+log = get_logger()
+
+SANDBOX_IMAGE = "python:3.11-slim"
+
+# Resource limits applied to every sandbox container
+SANDBOX_LIMITS = {
+    "mem_limit": "128m",
+    "nano_cpus": 500_000_000,
+    "network_disabled": True,
+    "user": 1000
+}
+
+# Seconds a single solution run may take before it is killed
+RUN_TIMEOUT = 5
+
+# Seconds all of a submission's test cases may take together, however many
+# there are; cases the budget does not reach are reported as not run
+BATCH_TIMEOUT = 10
+
+# Allowance on top of BATCH_TIMEOUT for starting the runner and reporting
+BATCH_OVERHEAD = 5
+
+# Exit code of `timeout -s KILL` (128 + SIGKILL) when the run was killed
+TIMEOUT_EXIT_CODE = 137
+
+POOL_LABEL = "code_off.sandbox"
+
+# Everything the sandbox user can write to, wiped between runs; dotfiles
+# included, which a plain * would miss
+SCRATCH_PATHS = [f"{directory}/{pattern}" for directory in ("/app", "/tmp", "/var/tmp", "/dev/shm")
+                 for pattern in ("*", ".[!.]*", "..?*")]
+
+# Where each pooled container's warm runner lives and keeps its FIFOs,
+# outside /app and /tmp so resets leave it alone
+FORKSERVER_DIR = "/forkserver"
+
+# Group runs are exec'd in when the forkserver is on. Only root and this
+# group may use the forkserver's FIFOs, and the batches it forks drop the
+# group, so solutions cannot send it requests
+FORKSERVER_GROUP = 1001
+
+# Where a forked batch's stderr goes, written as the sandbox user
+FORKSERVER_ERRORS = "/tmp/runner.err"
+
+# Asks the warm runner to run the copied-in batch, or runs it with a fresh
+# interpreter if the forkserver has not come up (yet)
+FORKSERVER_CLIENT = (
+    f"if [ -p {FORKSERVER_DIR}/in ]; then "
+    f"echo run > {FORKSERVER_DIR}/in && cat {FORKSERVER_DIR}/out; "
+    f"cat {FORKSERVER_ERRORS} >&2 2>/dev/null; "
+    "else exec python /app/runner.py /app/batch.json /app/solution.py; fi"
+)
+
+# Runner shipped into the sandbox next to the solution
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_runner.py"), "rb") as f:
+    RUNNER_SOURCE = f.read()
+
+def make_tarfile(files):
+    """
+    Build an in-memory tar archive
+
+    Parameters: files - dict mapping archive name to bytes content
+    Returns: BytesIO positioned at the start of the archive
+    """
+    tar_stream = io.BytesIO()
+    with tarfile.open(fileobj=tar_stream, mode='w') as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(content))
+    tar_stream.seek(0)
+    return tar_stream
+
+def missing_case(i, message, status="error"):
+    """
+    Result record for a case the runner never reported on
+
+    Parameters: i - case index, message, status - error, timeout, memory or
+                not_run
+    """
+    return {
+        "case": i,
+        "output": message,
+        "exception": message,
+        "exit_code": None,
+        "timed_out": status == "timeout",
+        "elapsed": 0.0,
+        "cpu_time": 0.0,
+        "peak_memory_kb": 0,
+        "status": status,
+        "missing": True
+    }
+
+class SandboxBackend:
+    """
+    Where submitted solutions run
+
+    A backend implements run(): copy files into a fresh working directory
+    known to the command as /app, run the command there with a wall-clock
+    kill, and report (exit_code, stdout, stderr), with TIMEOUT_EXIT_CODE
+    for a killed run. run_batch() builds on it to ship sandbox_runner.py
+    and parse its per-case records, so every backend returns identical
+    results; sandbox_conformance.py checks that they do.
+    """
+
+    name = None
+
+    # argv running /app/runner.py over /app/batch.json and /app/solution.py
+    batch_command = ["python", "/app/runner.py", "/app/batch.json", "/app/solution.py"]
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def run(self, files, command, timeout=RUN_TIMEOUT, timings=None):
+        raise NotImplementedError
+
+    def run_batch(self, code, calls, timeout=RUN_TIMEOUT, timings=None, budget=BATCH_TIMEOUT):
+        """
+        Run a solution against every test call in a single sandbox run
+
+        Parameters: code - solution source, calls - list of test call sources
+                    ("" runs the solution alone), timeout - seconds per case,
+                    timings - optional dict filled in by run(), budget -
+                    seconds for all cases together
+        Dependencies: sandbox_runner.py
+        Returns: list with one result record per call, in order
+        """
+        timings = {} if timings is None else timings
+        files = {
+            "solution.py": code.encode(),
+            "runner.py": RUNNER_SOURCE,
+            "batch.json": json.dumps({"timeout": timeout, "budget": budget, "cases": calls}).encode()
+        }
+        exit_code, stdout, stderr = self.run(
+            files,
+            self.batch_command,
+            timeout=budget + BATCH_OVERHEAD,
+            timings=timings
+        )
+
+        records = {}
+        for line in stdout.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["case"]] = record
+
+        # Cases the runner never reached still get a result
+        message, status = "Sandbox run was killed before this test case finished", "error"
+        if exit_code == TIMEOUT_EXIT_CODE:
+            # timeout and the container's OOM killer both kill with SIGKILL
+            if timings.get("execution", 0) >= budget + BATCH_OVERHEAD:
+                message, status = "Sandbox run timed out before this test case finished", "timeout"
+            else:
+                message, status = "Sandbox run ran out of memory before this test case finished", "memory"
+        elif stderr.strip():
+            message = stderr.strip()
+        return [records.get(i) or missing_case(i, message, status) for i in range(len(calls))]
+
+    def health(self):
+        return {"ready": True, "backend": self.name}
+
+    def stats(self):
+        return {}
+
+class SandboxPool(SandboxBackend):
+    """
+    Pool of pre-started sandbox containers
+
+    Idle containers sleep until a run is exec'd into them. After a run the
+    container is handed to the background worker, which either resets it and
+    puts it back in the pool or destroys it, then refills the pool up to size.
+    Each run's setup (checkout and copy-in), execution and teardown times
+    feed the latency histograms, as does the background reset.
+
+    With warm set, every container also starts the runner as a root-owned
+    forkserver that survives resets, so a batch forks a pre-imported
+    interpreter instead of starting one. It only ever runs the batch in
+    /app, as the sandbox user, and only FORKSERVER_GROUP may ask it to; a
+    batch whose client timed out is killed with every case it started.
+    Batches fall back to a fresh interpreter until it is up.
+
+    Parameters: docker client, size - number of warm containers to keep,
+                max_uses - runs before a container is destroyed,
+                low_water - refill once fewer than this many are idle,
+                warm - start a forkserver runner in each container
+    """
+
+    name = "docker"
+
+    def __init__(self, client, size=4, max_uses=25, low_water=None, warm=True):
+        self.client = client
+        self.size = size
+        self.max_uses = max_uses
+        self.low_water = size if low_water is None else min(low_water, size)
+        self.warm = warm
+        self.exec_user = f"1000:{FORKSERVER_GROUP}" if warm else "1000"
+        if warm:
+            self.batch_command = ["sh", "-c", FORKSERVER_CLIENT]
+
+        self._idle = deque()
+        self._dirty = deque()
+        self._uses = {}
+        self._creating = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._closed = False
+        self.image = None  # resolved sandbox image, set by warmup()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.recycled = 0
+        self.destroyed = 0
+        self.forkservers = 0
+        self.latency = {phase: Histogram() for phase in ("setup", "execution", "teardown", "reset")}
+
+    def warmup(self):
+        """
+        Resolve the sandbox image once, pulling it only if it is missing
+
+        Dependencies: docker client
+        Returns: dict with image name, id and registry digest
+        """
+        try:
+            image = self.client.images.get(SANDBOX_IMAGE)
+        except ImageNotFound:
+            log.info("sandbox_image_pulling", image=SANDBOX_IMAGE)
+            image = self.client.images.pull(SANDBOX_IMAGE)
+        digests = image.attrs.get("RepoDigests") or []
+        self.image = {
+            "name": SANDBOX_IMAGE,
+            "id": image.id,
+            "digest": digests[0].split("@", 1)[-1] if digests else None
+        }
+        return self.image
+
+    def health(self):
+        """
+        Returns: dict with sandbox image readiness and pool metrics
+        """
+        return {
+            "ready": self.image is not None,
+            "backend": self.name,
+            "image": self.image or {"name": SANDBOX_IMAGE, "id": None, "digest": None},
+            "pool": self.stats()
+        }
+
+    def start(self):
+        """
+        Start the background worker that resolves the image, then fills,
+        recycles and refills the pool
+        """
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run_worker, name="sandbox-pool", daemon=True)
+            self._worker.start()
+        self._wakeup.set()
+
+    def shutdown(self):
+        """
+        Stop refilling and remove every container owned by the pool
+        """
+        self._closed = True
+        self._wakeup.set()
+        with self._lock:
+            containers = list(self._idle) + list(self._dirty)
+            self._idle.clear()
+            self._dirty.clear()
+        for container in containers:
+            self._destroy(container)
+
+    def run(self, files, command, timeout=RUN_TIMEOUT, timings=None):
+        """
+        Copy files into a sandbox container and run a command there
+
+        Parameters: files - dict of name to bytes placed under /app,
+                    command - argv list, timeout - wall clock seconds,
+                    timings - optional dict filled with seconds spent in
+                    setup, execution and teardown
+        Dependencies: docker client
+        Returns: tuple of (exit_code, stdout, stderr)
+        """
+        timings = {} if timings is None else timings
+        started = time.monotonic()
+        container = self.acquire()
+        healthy = False
+        try:
+            container.put_archive("/app", make_tarfile(files))
+            timings["setup"] = time.monotonic() - started
+            started = time.monotonic()
+            exit_code, (stdout, stderr) = container.exec_run(
+                ["timeout", "-s", "KILL", str(timeout)] + command,
+                workdir="/app",
+                user=self.exec_user,
+                demux=True
+            )
+            timings["execution"] = time.monotonic() - started
+            healthy = exit_code != TIMEOUT_EXIT_CODE
+            return exit_code, (stdout or b"").decode(errors="replace"), (stderr or b"").decode(errors="replace")
+        finally:
+            started = time.monotonic()
+            self.release(container, healthy)
+            timings["teardown"] = time.monotonic() - started
+            for phase, seconds in timings.items():
+                self.latency[phase].observe(seconds)
+
+    def acquire(self):
+        """
+        Check a container out of the pool, creating one cold on a miss
+
+        Returns: started docker container
+        """
+        started = time.monotonic()
+        container = None
+        with self._lock:
+            if self._idle:
+                container = self._idle.popleft()
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if container is None:
+            container = self._create()
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self._maybe_refill()
+        return container
+
+    def release(self, container, healthy=True):
+        """
+        Return a used container so the worker can recycle or destroy it
+
+        Parameters: container, healthy - False if the run timed out or failed
+        """
+        with self._lock:
+            self._uses[container.id] = self._uses.get(container.id, 0) + 1
+            if healthy and not self._closed and self._uses[container.id] < self.max_uses:
+                self._dirty.append(container)
+                container = None
+        if container is not None:
+            self._destroy(container)
+        self._wakeup.set()
+
+    def stats(self):
+        """
+        Returns: dict of pool metrics
+        """
+        with self._lock:
+            acquired = self.hits + self.misses
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / acquired if acquired else 0.0,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_avg": self.wait_seconds_total / acquired if acquired else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+                "recycled": self.recycled,
+                "destroyed": self.destroyed,
+                "forkservers": self.forkservers
+            }
+
+    def _maybe_refill(self):
+        with self._lock:
+            low = len(self._idle) + self._creating < self.low_water
+        if low:
+            self._wakeup.set()
+
+    def _create(self):
+        container = self.client.containers.create(
+            image=SANDBOX_IMAGE,
+            command=["sleep", "infinity"],
+            working_dir="/app",
+            labels={POOL_LABEL: "pool"},
+            **SANDBOX_LIMITS
+        )
+        container.start()
+        if self.warm:
+            self._start_forkserver(container)
+        return container
+
+    def _start_forkserver(self, container):
+        # Root-owned, so the reset's kill -1 as the sandbox user spares it
+        try:
+            container.put_archive("/", make_tarfile({FORKSERVER_DIR.strip("/") + "/runner.py": RUNNER_SOURCE}))
+            container.exec_run(
+                ["python", f"{FORKSERVER_DIR}/runner.py", "--serve", FORKSERVER_DIR, "--workdir", "/app",
+                 "--errors", FORKSERVER_ERRORS, "--user", "1000", "--group", str(FORKSERVER_GROUP),
+                 "--timeout", str(BATCH_TIMEOUT + BATCH_OVERHEAD)],
+                user="root",
+                detach=True
+            )
+        except Exception as e:
+            log.warning("sandbox_forkserver_failed", error=str(e))
+            return
+        with self._lock:
+            self.forkservers += 1
+
+    def _destroy(self, container):
+        with self._lock:
+            self._uses.pop(container.id, None)
+            self.destroyed += 1
+        try:
+            container.remove(force=True)
+        except Exception as e:
+            log.error("sandbox_remove_failed", error=str(e))
+
+    def _reset(self, container):
+        # Kill anything the solution left running, then wipe every place it can write
+        container.exec_run(["python", "-c", "import os, signal; os.kill(-1, signal.SIGKILL)"], user="1000")
+        exit_code, _ = container.exec_run(["sh", "-c", f"rm -rf {' '.join(SCRATCH_PATHS)}"], user="root")
+        return exit_code == 0
+
+    def _run_worker(self):
+        # Prefetch the image before any container is created from it
+        delay = 1
+        while self.image is None and not self._closed:
+            try:
+                self.warmup()
+            except Exception as e:
+                log.error("sandbox_image_failed", retry_in=delay, error=str(e))
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+            # Recycle containers returned since the last pass
+            while not self._closed:
+                with self._lock:
+                    container = self._dirty.popleft() if self._dirty else None
+                if container is None:
+                    break
+                started = time.monotonic()
+                try:
+                    reusable = self._reset(container)
+                except Exception as e:
+                    log.error("sandbox_reset_failed", error=str(e))
+                    reusable = False
+                self.latency["reset"].observe(time.monotonic() - started)
+                with self._lock:
+                    if reusable and len(self._idle) < self.size:
+                        self._idle.append(container)
+                        self.recycled += 1
+                        container = None
+                if container is not None:
+                    self._destroy(container)
+
+            # Refill up to size once below the low water mark
+            with self._lock:
+                missing = self.size - len(self._idle) if len(self._idle) < self.low_water else 0
+                self._creating = missing
+            for _ in range(missing):
+                if self._closed:
+                    break
+                try:
+                    container = self._create()
+                except Exception as e:
+                    log.error("sandbox_create_failed", error=str(e))
+                    break
+                finally:
+                    with self._lock:
+                        self._creating -= 1
+                with self._lock:
+                    self._idle.append(container)
+            with self._lock:
+                self._creating = 0
+
+if __name__ == "__main__":
+    # Prefetch step for deploys: python sandbox.py
+    import docker
+    print(SandboxPool(docker.from_env(), size=0).warmup())
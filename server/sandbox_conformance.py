@@ -0,0 +1,159 @@
+"""
+Conformance suite every sandbox backend must pass
+
+Usage: python sandbox_conformance.py [docker|local|all]
+
+Runs the same batches through each backend's run_batch() and checks the
+per-case records: outputs, return values of entry point calls, exceptions,
+timeout and memory classification, no network, isolation between cases
+and the per-submission time budget. Exits non-zero if any check
+fails, so it can gate a deploy that switches a difficulty's backend.
+"""
+import os, sys
+
+# Each check: (name, solution, calls, expectation per case)
+CHECKS = [
+    ("returns output", "def add(a, b):\n    return a + b\n",
+     ["print(add(1, 2))", "print(add(-3, 3))"],
+     [{"status": "ok", "output": "3"}, {"status": "ok", "output": "0"}]),
+    ("solution prints", "def greet(name):\n    print('hi', name)\n",
+     ["greet('bob')"],
+     [{"status": "ok", "output": "hi bob"}]),
+    ("runs solution alone", "print('top level')\n",
+     [""],
+     [{"status": "ok", "output": "top level"}]),
+    ("exception captured", "def f():\n    raise ValueError('bad input')\n",
+     ["f()", "print('after')"],
+     [{"status": "error", "exception": "ValueError: bad input"}, {"status": "ok", "output": "after"}]),
+    ("syntax error", "def f(:\n    pass\n",
+     ["f()", "f()"],
+     [{"status": "error", "exception": "SyntaxError"}, {"status": "error", "exception": "SyntaxError"}]),
+    ("timeout", "import time\ndef f():\n    time.sleep(30)\n",
+     ["f()", "print('next')"],
+     [{"status": "timeout", "timed_out": True}, {"status": "ok", "output": "next"}]),
+    ("busy loop timeout", "def f():\n    while True:\n        pass\n",
+     ["f()"],
+     [{"status": "timeout", "timed_out": True}]),
+    ("memory limit", "def f():\n    return bytearray(4 * 1024 ** 3)\n",
+     ["f()", "print('still here')"],
+     [{"status": "memory"}, {"status": "ok", "output": "still here"}]),
+    ("no network", "import socket\n",
+     ["try:\n    socket.create_connection(('1.1.1.1', 53), timeout=2)\n    print('connected')\n"
+      "except OSError:\n    print('blocked')"],
+     [{"status": "ok", "output": "blocked"}]),
+    ("cases isolated", "seen = []\n",
+     ["seen.append(1)\nprint(len(seen))", "seen.append(1)\nprint(len(seen))"],
+     [{"status": "ok", "output": "1"}, {"status": "ok", "output": "1"}]),
+    ("crash isolated", "import os\n",
+     ["os._exit(3)", "print('survived')"],
+     [{"status": "error", "exit_code": 3}, {"status": "ok", "output": "survived"}]),
+    ("output truncated", "",
+     ["print('x' * (1024 * 1024))"],
+     [{"status": "ok", "max_output": 64 * 1024}]),
+    ("entry point returns typed value", "def pair(a, b):\n    return [a, b, a == b]\n",
+     [{"entry": "pair", "args": [1, "x"]}, {"entry": "pair", "args": [2.5, 2.5]}],
+     [{"status": "ok", "result": {"value": [1, "x", False]}}, {"status": "ok", "result": {"value": [2.5, 2.5, True]}}]),
+    ("entry point keyword arguments", "def repeat(s, n):\n    return s * n\n",
+     [{"entry": "repeat", "kwargs": {"n": 3, "s": "ab"}}],
+     [{"status": "ok", "result": {"value": "ababab"}}]),
+    ("entry point output kept", "def f():\n    print('working')\n    return {'k': (1, 2)}\n",
+     [{"entry": "f", "args": []}],
+     [{"status": "ok", "output": "working", "result": {"value": {"k": [1, 2]}}}]),
+    ("entry point without JSON form", "def f():\n    return object\n",
+     [{"entry": "f", "args": []}],
+     [{"status": "ok", "result": {"repr": "<class 'object'>"}}]),
+    ("entry point missing", "def g():\n    pass\n",
+     [{"entry": "f", "args": []}],
+     [{"status": "error", "exception": "NameError"}]),
+    ("entry point result too large", "def f():\n    return 'x' * (1024 * 1024)\n",
+     [{"entry": "f", "args": []}, {"entry": "f", "args": []}],
+     [{"status": "error", "exception": "ValueError"}, {"status": "error", "exception": "ValueError"}]),
+    ("no files left behind", "import os\n",
+     ["open('leftover.txt', 'w').write('x')", "print(os.path.exists('leftover.txt'))"],
+     [{"status": "ok"}, {"status": "ok", "output": "True"}]),
+]
+
+# Slow cases share one budget per submission: (name, solution, calls,
+# expectations, budget in seconds), run with the same per-case timeout
+BUDGET_CHECK = ("batch budget", "import time\ndef f():\n    time.sleep(30)\n",
+                ["f()", "f()", "f()", "f()"],
+                [{"status": "timeout"}, {"status": "timeout"}, {"status": "not_run"}, {"status": "not_run"}], 3)
+
+# Checks run twice in a row, the second run must not see the first's files
+FOLLOW_UP = ("fresh directory", "import os\n", ["print(os.path.exists('leftover.txt'))"],
+             [{"status": "ok", "output": "False"}])
+
+def mismatches(record, expected):
+    """
+    Returns: list of messages for fields of record that differ from expected
+    """
+    problems = []
+    for field, value in expected.items():
+        if field == "max_output":
+            if len(record.get("output") or "") > value:
+                problems.append(f"output is {len(record['output'])} bytes, over {value}")
+        elif field == "exception":
+            if not (record.get("exception") or "").startswith(value):
+                problems.append(f"exception {record.get('exception')!r} does not start with {value!r}")
+        elif record.get(field) != value:
+            problems.append(f"{field} is {record.get(field)!r}, expected {value!r}")
+    return problems
+
+def check(backend, timeout=2):
+    """
+    Run every check against a started backend
+
+    Parameters: backend - SandboxBackend, timeout - seconds per case
+    Returns: list of (check name, failure message) pairs, empty on success
+    """
+    failures = []
+    checks = [spec + (None,) for spec in CHECKS + [FOLLOW_UP]] + [BUDGET_CHECK]
+    for name, code, calls, expectations, budget in checks:
+        try:
+            if budget is None:
+                records = backend.run_batch(code, calls, timeout=timeout)
+            else:
+                records = backend.run_batch(code, calls, timeout=timeout, budget=budget)
+        except Exception as e:
+            failures.append((name, f"run_batch raised {e!r}"))
+            continue
+        if len(records) != len(calls):
+            failures.append((name, f"{len(records)} records for {len(calls)} cases"))
+            continue
+        for i, (record, expected) in enumerate(zip(records, expectations)):
+            failures.extend((name, f"case {i}: {problem}") for problem in mismatches(record, expected))
+    return failures
+
+def make_backend(name):
+    if name == "local":
+        from local_sandbox import LocalSandbox
+        uid = os.environ.get("SANDBOX_LOCAL_UID")
+        return LocalSandbox(memory_limit_mb=int(os.environ.get("SANDBOX_LOCAL_MEMORY_MB", 256)),
+                            uid=int(uid) if uid else None)
+    import docker
+    from sandbox import SandboxPool
+    pool = SandboxPool(docker.from_env(), size=1)
+    pool.warmup()
+    return pool
+
+def main():
+    names = sys.argv[1:] or ["all"]
+    if names == ["all"]:
+        names = ["docker", "local"]
+    failed = False
+    for name in names:
+        backend = make_backend(name)
+        backend.start()
+        try:
+            failures = check(backend)
+        finally:
+            backend.shutdown()
+        total = len(CHECKS) + 2
+        print(f"{name}: {total - len({check for check, _ in failures})}/{total} checks passed")
+        for check_name, message in failures:
+            print(f"  FAIL {check_name}: {message}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
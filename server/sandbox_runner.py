@@ -0,0 +1,412 @@
+"""
+Batch test runner executed inside the sandbox
+
+Usage: python runner.py batch.json solution.py
+       python runner.py --serve directory [--workdir dir] [--errors path]
+                        [--user uid] [--group gid] [--timeout seconds]
+
+batch.json holds {"timeout": seconds, "budget": seconds, "cases": [case,
+...]}, where a case is either {"entry": function name, "args": [JSON
+values], "kwargs": {name: JSON value}} or the source of a test call (""
+runs the solution alone). Each case may run for timeout seconds, and all
+of them together for budget seconds; cases left when the budget runs out
+are reported as not_run without being started. The solution is compiled once,
+then every case runs in its own forked child so a crash or timeout in one
+case cannot hide the results of the others. One JSON line per case is
+written to stdout, with the case's wall and CPU time, peak memory, exit
+code and a status: ok, error, timeout, memory (killed by the
+out-of-memory killer or raised MemoryError) or not_run. Entry point cases also report
+the return value, as {"value": JSON value} or {"repr": text} when it has
+no JSON form.
+
+With --serve the runner stays resident as a forkserver: it imports the
+modules solutions commonly use once, then waits on the FIFO directory/in
+for a line, forks a clean child that runs workdir/batch.json against
+workdir/solution.py as above as uid, and streams the child's records to
+directory/out. Each batch then costs a fork instead of an interpreter
+start. What a request line says is ignored, so a client can only ask for
+the fixed batch to run. Only root and group gid may use the FIFOs; the
+children drop every group, so solutions cannot send requests. A child's
+stderr goes to the errors file, opened once it runs as uid. A batch whose
+client stops reading, or that outlives --timeout, is killed along with
+every case it started.
+
+Only the standard library may be used here - this file runs inside the
+bare sandbox image.
+"""
+import errno, json, os, select, signal, sys, tempfile, time, traceback
+
+# Largest amount of case output kept, in bytes
+MAX_OUTPUT = 64 * 1024
+
+# Imported by the forkserver up front so forked batches start with them loaded
+WARM_MODULES = (
+    "bisect", "collections", "dataclasses", "functools", "heapq", "itertools",
+    "math", "random", "re", "string", "typing"
+)
+
+def classify(exit_code, timed_out, exception):
+    """
+    Returns: status of a finished case - ok, error, timeout or memory
+    """
+    if timed_out:
+        return "timeout"
+    # Nothing but the kernel's OOM killer sends SIGKILL to a case we did not time out
+    if exit_code == -signal.SIGKILL or (exception or "").startswith("MemoryError"):
+        return "memory"
+    return "ok" if exit_code == 0 else "error"
+
+def encode_result(value):
+    """
+    Returns: JSON text of {"value": value}, or of {"repr": text} for values
+             JSON cannot represent
+    """
+    def jsonable(item):
+        if isinstance(item, (set, frozenset)):
+            try:
+                return sorted(item)
+            except TypeError:
+                return list(item)
+        raise TypeError(f"{type(item).__name__} is not JSON serializable")
+
+    try:
+        encoded = json.dumps({"value": value}, default=jsonable)
+    except (TypeError, ValueError):
+        encoded = json.dumps({"repr": repr(value)})
+    if len(encoded) > MAX_OUTPUT:
+        raise ValueError(f"return value is larger than {MAX_OUTPUT // 1024} KB")
+    return encoded
+
+def run_case(code, call, timeout):
+    """
+    Run the solution plus one test call in a forked child
+
+    Parameters: code - compiled solution, call - compiled test call, an
+                {"entry", "args", "kwargs"} dict or None, timeout - wall clock seconds
+                before the child is killed
+    Returns: dict with output, exception, exit_code, timed_out, elapsed,
+             cpu_time, peak_memory_kb, status and, for entry point calls
+             that returned, result
+    """
+    out = tempfile.TemporaryFile()
+    err = tempfile.TemporaryFile()
+    result = tempfile.TemporaryFile()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    started = time.monotonic()
+    pid = os.fork()
+
+    if pid == 0:
+        # Child: own process group so anything it spawns is killed with it
+        os.setpgid(0, 0)
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+        status = 0
+        try:
+            scope = {"__name__": "__main__", "__builtins__": __builtins__}
+            exec(code, scope)
+            if isinstance(call, dict):
+                function = scope.get(call["entry"])
+                if not callable(function):
+                    raise NameError(f"name '{call['entry']}' is not defined")
+                result.write(encode_result(function(*call.get("args", ()), **call.get("kwargs") or {})).encode())
+                result.flush()
+            elif call is not None:
+                exec(call, scope)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                status = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except BaseException as e:
+            # Skip the runner's own frame so the traceback starts in user code
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            err.write(f"{type(e).__name__}: {e}".encode(errors="replace")[:MAX_OUTPUT])
+            err.flush()
+            status = 1
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+    # Parent: wait for the child, killing it at the deadline
+    deadline = started + timeout
+    delay = 0.0005
+    timed_out = False
+    while True:
+        # wait4 also reports the child's CPU time and peak resident memory
+        waited, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited:
+            break
+        if time.monotonic() >= deadline:
+            timed_out = True
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, status, usage = os.wait4(pid, 0)
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+    elapsed = time.monotonic() - started
+
+    out.seek(0)
+    err.seek(0)
+    output = out.read(MAX_OUTPUT).decode(errors="replace").strip()
+    exception = err.read().decode(errors="replace") or None
+    result.seek(0)
+    returned = result.read()
+    out.close()
+    err.close()
+    result.close()
+    exit_code = os.waitstatus_to_exitcode(status)
+    case_status = classify(exit_code, timed_out, exception)
+    if timed_out:
+        exception = f"TimeoutError: exceeded {timeout:.3g} seconds"
+    elif case_status == "memory" and exception is None:
+        exception = "MemoryError: killed for exceeding the memory limit"
+    return {
+        "output": output,
+        "exception": exception,
+        "exit_code": exit_code,
+        "timed_out": timed_out,
+        "elapsed": elapsed,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux and includes the interpreter
+        "peak_memory_kb": usage.ru_maxrss,
+        "status": case_status,
+        **({"result": json.loads(returned)} if returned and case_status == "ok" else {})
+    }
+
+def not_run(budget):
+    """
+    Returns: record of a case skipped because the batch's budget ran out
+    """
+    message = f"Not run: earlier test cases used the submission's {budget} second time budget"
+    return {
+        "output": message,
+        "exception": message,
+        "exit_code": None,
+        "timed_out": False,
+        "elapsed": 0.0,
+        "cpu_time": 0.0,
+        "peak_memory_kb": 0,
+        "status": "not_run"
+    }
+
+def run_files(batch_path, solution_path):
+    """
+    Run every case of a batch file against a solution file, writing one
+    JSON record per case to stdout
+    """
+    with open(batch_path) as f:
+        batch = json.load(f)
+    with open(solution_path) as f:
+        source = f.read()
+
+    timeout = batch.get("timeout", 5)
+    budget = batch.get("budget")
+    deadline = time.monotonic() + budget if budget is not None else None
+    try:
+        code = compile(source, solution_path, "exec")
+        compile_error = None
+    except SyntaxError as e:
+        code = None
+        compile_error = e
+
+    for i, call_source in enumerate(batch["cases"]):
+        if compile_error is not None:
+            record = {
+                "output": "".join(traceback.format_exception_only(compile_error)).strip(),
+                "exception": f"SyntaxError: {compile_error}",
+                "exit_code": 1,
+                "timed_out": False,
+                "elapsed": 0.0,
+                "cpu_time": 0.0,
+                "peak_memory_kb": 0,
+                "status": "error"
+            }
+        elif deadline is not None and deadline - time.monotonic() <= 0:
+            record = not_run(budget)
+        else:
+            try:
+                if isinstance(call_source, dict):
+                    call = call_source
+                else:
+                    call = compile(call_source, "<test>", "exec") if call_source else None
+                remaining = deadline - time.monotonic() if deadline is not None else timeout
+                record = run_case(code, call, min(timeout, remaining))
+            except SyntaxError as e:
+                record = {
+                    "output": "",
+                    "exception": f"SyntaxError: {e}",
+                    "exit_code": 1,
+                    "timed_out": False,
+                    "elapsed": 0.0,
+                    "cpu_time": 0.0,
+                    "peak_memory_kb": 0,
+                    "status": "error"
+                }
+        record["case"] = i
+        sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
+
+def wait_batch(pid, replies, timeout=None):
+    """
+    Wait for a forked batch while its client reads the reply FIFO
+
+    Parameters: pid - the batch child, replies - path of the reply FIFO,
+                timeout - seconds the batch may run, or None
+    Returns: True once the batch exited, False if the client went away or
+             the timeout passed first
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    poller = select.poll()
+    try:
+        pidfd = os.pidfd_open(pid)
+        poller.register(pidfd, select.POLLIN)
+    except (AttributeError, OSError):
+        # No pidfds here; poll for the exit instead
+        pidfd = None
+    watch = None
+    delay = 0.0005
+    try:
+        while True:
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                return True
+            if watch is None:
+                try:
+                    # Succeeds once the client has the FIFO open to read
+                    watch = os.open(replies, os.O_WRONLY | os.O_NONBLOCK)
+                    # Only errors are asked for: POLLERR means every reader closed it
+                    poller.register(watch, 0)
+                except OSError as e:
+                    if e.errno != errno.ENXIO:
+                        raise
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return False
+            wait = remaining
+            if watch is None or pidfd is None:
+                wait = delay if wait is None else min(wait, delay)
+                delay = min(delay * 2, 0.01)
+            events = poller.poll(None if wait is None else wait * 1000)
+            if any(fd == watch for fd, _ in events):
+                return os.waitpid(pid, os.WNOHANG)[0] != 0
+    finally:
+        for fd in (pidfd, watch):
+            if fd is not None:
+                os.close(fd)
+
+def kill_batch(pid, uid=None):
+    """
+    Kill a forked batch and the cases it started, then reap it
+
+    Cases run in process groups of their own, so with uid every process of
+    that user is killed, as a container reset does; without it, every
+    process in the batch's session.
+    """
+    if uid is not None:
+        killer = os.fork()
+        if killer == 0:
+            try:
+                os.setgroups([])
+                os.setgid(uid)
+                os.setuid(uid)
+                os.kill(-1, signal.SIGKILL)
+            finally:
+                os._exit(0)
+        os.waitpid(killer, 0)
+    else:
+        for name in os.listdir("/proc"):
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    # The session id is the fourth field after the parenthesised command
+                    session = int(f.read().rsplit(")", 1)[1].split()[3])
+                if session == pid:
+                    os.kill(int(name), signal.SIGKILL)
+            except (ValueError, IndexError, OSError):
+                continue
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    os.waitpid(pid, 0)
+
+def serve(directory, workdir="/app", errors="/tmp/runner.err", uid=None, gid=None, timeout=None):
+    """
+    Forkserver loop: run the batch in workdir in a forked child per request
+
+    Parameters: directory - where the in and out FIFOs are created,
+                workdir - directory holding batch.json and solution.py,
+                errors - file the child's stderr is written to, uid - user
+                the children run as, when started as root, gid - group
+                allowed to use the FIFOs, otherwise only their owner may,
+                timeout - seconds a batch may run before it is killed
+    """
+    for module in WARM_MODULES:
+        __import__(module)
+    batch_path, solution_path = os.path.join(workdir, "batch.json"), os.path.join(workdir, "solution.py")
+    os.makedirs(directory, exist_ok=True)
+    requests, replies = os.path.join(directory, "in"), os.path.join(directory, "out")
+    # Clients write requests and read replies
+    for path, mode in ((directory, 0o750), (requests, 0o620), (replies, 0o640)):
+        if path != directory and not os.path.exists(path):
+            os.mkfifo(path)
+        if gid is not None:
+            os.chown(path, -1, gid)
+        os.chmod(path, mode if gid is not None else mode & 0o700)
+
+    while True:
+        with open(requests) as f:
+            if not f.readline():
+                continue
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.setsid()
+                # Blocks until the client opens the reply FIFO to read; opened
+                # first so the client is released however the child ends
+                out = os.open(replies, os.O_WRONLY)
+                os.dup2(out, 1)
+                os.close(out)
+                os.chdir(workdir)
+                if uid is not None:
+                    os.setgroups([])
+                    os.setgid(uid)
+                    os.setuid(uid)
+                err = os.open(errors, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+                os.dup2(err, 2)
+                os.close(err)
+                run_files(batch_path, solution_path)
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os._exit(status)
+        # One batch at a time, as each container serves one run at a time
+        if not wait_batch(pid, replies, timeout):
+            kill_batch(pid, uid)
+
+def main():
+    if sys.argv[1] == "--serve":
+        options = dict(zip(sys.argv[3::2], sys.argv[4::2]))
+        serve(sys.argv[2], workdir=options.get("--workdir", "/app"),
+              errors=options.get("--errors", "/tmp/runner.err"),
+              uid=int(options["--user"]) if "--user" in options else None,
+              gid=int(options["--group"]) if "--group" in options else None,
+              timeout=float(options["--timeout"]) if "--timeout" in options else None)
+    else:
+        run_files(sys.argv[1], sys.argv[2])
+
+if __name__ == "__main__":
+    main()
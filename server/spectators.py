@@ -0,0 +1,141 @@
+import threading, time
+from logs import get_logger
+
+log = get_logger()
+
+def spectator_room(room_code):
+    """
+    Returns: Socket.IO room spectators of a game join, apart from the players
+    """
+    return f"{room_code}:spectators"
+
+class SpectatorFeed:
+    """
+    Snapshot plus coalesced diff stream for spectators
+
+    Spectators sit in their own Socket.IO room, so game events reach the two
+    players without fanning out to every spectator. Handlers record state
+    changes here instead; once per tick each changed room gets one
+    spectator_update carrying the latest value of every field that changed
+    (health, active question, code, players). Joining spectators get a
+    snapshot that is built once and reused until the room changes; it must
+    leave out anything that changes without a call here, such as the
+    spectator list, for callers to add when sending.
+
+    Parameters: emit - callable(room_code, event, payload) emitting to the
+                spectator room, tick - seconds between updates, spawn/sleep -
+                background task helpers
+    """
+
+    def __init__(self, emit, tick=0.25, spawn=None, sleep=time.sleep):
+        self.emit = emit
+        self.tick = tick
+        self.spawn = spawn or (lambda fn: threading.Thread(target=fn, daemon=True).start())
+        self.sleep = sleep
+
+        self._pending = {}  # room_code -> diff dict
+        self._snapshots = {}  # room_code -> cached joined_as_spectator payload
+        self._generations = {}  # room_code -> count of changes, to spot stale builds
+        self._lock = threading.Lock()
+        self._ticker = False
+
+        # Metrics
+        self.changes = 0
+        self.updates_sent = 0
+        self.snapshots_built = 0
+        self.snapshots_served = 0
+
+    def snapshot(self, room_code, build):
+        """
+        Returns: the room's spectator snapshot, calling build() only if the
+                 room changed since it was last built
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(room_code)
+            generation = self._generations.get(room_code, 0)
+            self.snapshots_served += 1
+        if snapshot is None:
+            snapshot = build()
+            with self._lock:
+                self.snapshots_built += 1
+                # Keep it only if nothing changed while it was being built
+                if self._generations.get(room_code, 0) == generation:
+                    self._snapshots[room_code] = snapshot
+        return snapshot
+
+    def update(self, room_code, field, user_id, value):
+        """
+        Record the latest value of a per-player field: health,
+        active_questions or code
+        """
+        with self._lock:
+            self._pending.setdefault(room_code, {}).setdefault(field, {})[user_id] = value
+            self._changed(room_code)
+
+    def set(self, room_code, field, value):
+        """
+        Record the latest value of a room-wide field, e.g. players
+        """
+        with self._lock:
+            self._pending.setdefault(room_code, {})[field] = value
+            self._changed(room_code)
+
+    def finish(self, room_code, event, payload):
+        """
+        Send what is pending, then a final event such as game_over, and
+        forget the room
+        """
+        self.flush(room_code)
+        self.emit(room_code, event, payload)
+        self.drop(room_code)
+
+    def drop(self, room_code):
+        with self._lock:
+            self._pending.pop(room_code, None)
+            self._snapshots.pop(room_code, None)
+            self._generations.pop(room_code, None)
+
+    def flush(self, room_code):
+        with self._lock:
+            diff = self._pending.pop(room_code, None)
+            if diff is None:
+                return
+            self.updates_sent += 1
+        diff['room_code'] = room_code
+        self.emit(room_code, 'spectator_update', diff)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_rooms": len(self._pending),
+                "cached_snapshots": len(self._snapshots),
+                "changes": self.changes,
+                "updates_sent": self.updates_sent,
+                "coalesce_ratio": self.changes / self.updates_sent if self.updates_sent else 0.0,
+                "snapshots_built": self.snapshots_built,
+                "snapshots_served": self.snapshots_served
+            }
+
+    def _changed(self, room_code):
+        # Called with the lock held
+        self.changes += 1
+        self._generations[room_code] = self._generations.get(room_code, 0) + 1
+        self._snapshots.pop(room_code, None)
+        if not self._ticker:
+            self._ticker = True
+            self.spawn(self._run_ticker)
+
+    def _run_ticker(self):
+        while True:
+            self.sleep(self.tick)
+            with self._lock:
+                rooms = list(self._pending)
+                if not rooms:
+                    # Idle - the next change starts a new ticker
+                    self._ticker = False
+                    return
+            for room_code in rooms:
+                try:
+                    self.flush(room_code)
+                except Exception as e:
+                    log.error("spectator_update_failed", error=str(e))
@@ -0,0 +1,205 @@
+"""
+Problem test packages: versioned test sets compiled for the judge
+
+A problem's tests are its visible test_cases row plus, optionally, a
+hidden test file named by coding_problems.hidden_tests and stored under
+the tests directory instead of in the row. Hidden files are JSON lines,
+one {"input": {...}, "expected_output": ...} per line; their inputs and
+expected outputs are never sent to players. compile_tests() turns both,
+with the problem's comparator, into a TestSet: call arguments built,
+expected outputs parsed and the comparator compiled, once per version.
+Inputs are bound to the entry point's parameters by name: Postgres keeps
+JSONB keys sorted by length, not in the order they were written, so the
+order of an input's keys means nothing.
+
+A package on disk is a directory with problem.json (title, description,
+difficulty, solution_template, test_cases and optionally comparator) and
+optionally hidden.jsonl. Import or update one with
+
+    python test_packages.py import path/to/package [tests directory]
+
+which copies the hidden file into the tests directory under its content
+hash and upserts the problem by title; the catalog's NOTIFY then reloads
+just that problem on every server.
+"""
+import ast, hashlib, json, os, shutil, sys
+from dataclasses import dataclass
+from comparators import compile_comparator, parse_expected
+
+@dataclass(slots=True)
+class TestCase:
+    input: dict
+    args: list
+    kwargs: dict
+    expected: str
+    expected_value: tuple  # parse_expected(expected)
+    hidden: bool
+
+@dataclass(slots=True)
+class TestSet:
+    version: str
+    cases: list
+    compare: object  # compare(result, output, case), see comparators
+    comparator: dict
+
+    @property
+    def hidden_count(self):
+        return sum(1 for case in self.cases if case.hidden)
+
+    def calls(self, entry):
+        """
+        Returns: the sandbox runner's {"entry", "args", "kwargs"} call for
+                 each case
+        """
+        return [{"entry": entry, "args": case.args, "kwargs": case.kwargs} for case in self.cases]
+
+def test_version(test_cases, comparator=None, hidden_digest=None, parameters=None):
+    """
+    Returns: short hash identifying a problem's test cases, comparator,
+             hidden test file contents and the parameters inputs bind to
+    """
+    digest = hashlib.sha256(json.dumps(test_cases, sort_keys=True).encode())
+    if comparator or hidden_digest or parameters:
+        digest.update(json.dumps([comparator, hidden_digest, parameters], sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+def entry_signature(source):
+    """
+    Returns: (name, parameter names) of the first top-level function defined
+             in source, or (None, None) if it defines none or does not parse
+    """
+    try:
+        tree = ast.parse(source or "")
+    except (SyntaxError, ValueError):
+        return None, None
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return node.name, [arg.arg for arg in node.args.posonlyargs + node.args.args]
+    return None, None
+
+def file_signature(path):
+    """
+    Returns: (mtime_ns, size) of a file, or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def read_hidden_tests(path):
+    """
+    Read a hidden test file
+
+    Parameters: path - JSON lines file of test cases
+    Returns: tuple of (list of test case dicts, sha256 hex digest of the file)
+    """
+    digest = hashlib.sha256()
+    cases = []
+    with open(path, "rb") as f:
+        for line in f:
+            digest.update(line)
+            if line.strip():
+                cases.append(json.loads(line))
+    return cases, digest.hexdigest()
+
+def bind_input(test_input, parameters=None):
+    """
+    Turn a test case's input into call arguments
+
+    Parameters: test_input - dict of parameter name to value, or a list of
+                positional values, parameters - the entry point's parameter
+                names as declared by the problem's template, or None
+    Returns: tuple of (positional args, keyword args). Named inputs become
+             positional when they fill the template's leading parameters,
+             so solutions that rename them still work, otherwise keywords.
+    """
+    if not isinstance(test_input, dict):
+        return list(test_input), {}
+    leading = list(parameters or ())[:len(test_input)]
+    if set(leading) == set(test_input):
+        return [test_input[name] for name in leading], {}
+    return [], dict(test_input)
+
+def compile_case(test_case, hidden=False, parameters=None):
+    test_input = test_case.get("input") or {}
+    args, kwargs = bind_input(test_input, parameters)
+    expected = str(test_case.get("expected_output", "")).strip()
+    return TestCase(test_input, args, kwargs, expected, parse_expected(expected), hidden)
+
+def compile_tests(test_cases, comparator=None, hidden_path=None, parameters=None):
+    """
+    Build the judge's in-memory form of a problem's tests
+
+    Parameters: test_cases - visible test case dicts from the row,
+                comparator - comparator spec or None, hidden_path - hidden
+                test file or None, parameters - entry point parameter
+                names from the problem's template, see bind_input
+    Returns: TestSet
+    Raises: OSError or ValueError for a missing or malformed hidden file or
+            comparator
+    """
+    hidden, hidden_digest = read_hidden_tests(hidden_path) if hidden_path else ([], None)
+    cases = [compile_case(test_case, parameters=parameters) for test_case in test_cases or []]
+    cases += [compile_case(test_case, hidden=True, parameters=parameters) for test_case in hidden]
+    return TestSet(
+        version=test_version(test_cases, comparator, hidden_digest, parameters),
+        cases=cases,
+        compare=compile_comparator(comparator),
+        comparator=comparator or {"type": "typed"}
+    )
+
+def import_package(db, package_dir, tests_dir):
+    """
+    Upsert a problem package into coding_problems
+
+    Parameters: db - Database, package_dir - directory with problem.json and
+                optionally hidden.jsonl, tests_dir - where hidden files live
+    Returns: problem_id of the imported problem
+    """
+    with open(os.path.join(package_dir, "problem.json")) as f:
+        package = json.load(f)
+    # Fail before touching the database if the tests do not compile
+    hidden_source = os.path.join(package_dir, "hidden.jsonl")
+    hidden_source = hidden_source if os.path.exists(hidden_source) else None
+    compile_tests(package["test_cases"], package.get("comparator"), hidden_source,
+                  entry_signature(package.get("solution_template"))[1])
+
+    hidden_name = None
+    if hidden_source:
+        # Named by content, so a changed file never overwrites one in use
+        _, digest = read_hidden_tests(hidden_source)
+        hidden_name = f"{digest[:16]}.jsonl"
+        os.makedirs(tests_dir, exist_ok=True)
+        shutil.copyfile(hidden_source, os.path.join(tests_dir, hidden_name))
+
+    values = (package["description"], package["difficulty"], json.dumps(package["test_cases"]),
+              package.get("solution_template"), json.dumps(package["comparator"]) if package.get("comparator") else None,
+              hidden_name)
+    with db.cursor() as cur:
+        cur.execute("""
+            UPDATE coding_problems
+            SET description = %s, difficulty = %s, test_cases = %s, solution_template = %s,
+                comparator = %s, hidden_tests = %s
+            WHERE title = %s
+            RETURNING problem_id
+        """, values + (package["title"],))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("""
+                INSERT INTO coding_problems
+                    (description, difficulty, test_cases, solution_template, comparator, hidden_tests, title)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING problem_id
+            """, values + (package["title"],))
+            row = cur.fetchone()
+    return str(row[0])
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "import":
+        sys.exit("Usage: python test_packages.py import path/to/package [tests directory]")
+    from db import Database
+    # Same connection settings as app.py
+    db = Database(host="db", port=5432, database="postgres", user="postgres", password="password")
+    tests_dir = sys.argv[3] if len(sys.argv) > 3 else os.environ.get("PROBLEM_TESTS_DIR", "problem_tests")
+    print(import_package(db, sys.argv[2], tests_dir))
@@ -0,0 +1,20 @@
+from comparators import display, display_expected, matches
+
+def test_display_shows_python_values():
+    assert display({"value": True}, "") == "True"
+    assert display({"value": None}, "") == "None"
+    assert display({"value": [1, "a", False]}, "") == "[1, 'a', False]"
+    assert display({"value": "abc"}, "") == "abc"
+
+def test_expected_shown_like_answers():
+    assert display_expected("true") == display({"value": True}, "")
+    assert display_expected("null") == "None"
+    assert display_expected('"abc"') == "abc"
+    assert display_expected("not a literal") == "not a literal"
+
+def test_string_answer_does_not_match_typed_expectation():
+    assert not matches({"value": "15"}, "", "15")
+    assert not matches({"value": "[1, 2]"}, "", "[1, 2]")
+    assert matches({"value": 15}, "", "15")
+    assert matches({"value": "abc"}, "", '"abc"')
+    assert matches({"value": "two words"}, "", "two words")
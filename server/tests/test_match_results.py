@@ -0,0 +1,69 @@
+import json
+import psycopg2
+from psycopg2.pool import PoolError
+from match_results import MatchResultWriter
+
+def game(room_code, winner_id="u1"):
+    return {"room_code": room_code, "winner_id": winner_id}
+
+class FakeWriter(MatchResultWriter):
+    """
+    Writer whose database rejects any batch holding a game from room BAD,
+    and fails with down while it is set
+    """
+
+    def __init__(self, tmp_path, **kwargs):
+        super().__init__(None, spill_path=str(tmp_path / "spill"),
+                         dead_letter_path=str(tmp_path / "rejected"), **kwargs)
+        self.rows = []
+        self.down = None
+
+    def _write(self, batch):
+        if self.down:
+            raise self.down
+        if any(result["room_code"] == "BAD" for result in batch):
+            raise psycopg2.DataError("invalid input syntax for type uuid")
+        self.rows.extend(result["room_code"] for result in batch)
+
+def test_bad_row_moved_aside(tmp_path):
+    writer = FakeWriter(tmp_path, batch_size=4)
+    codes = ["A", "B", "BAD", "C", "D", "E"]
+    for code in codes:
+        writer.record(game(code))
+    writer._flush()
+
+    assert writer.rows == ["A", "B", "C", "D", "E"]
+    with open(tmp_path / "rejected") as f:
+        rejected = [json.loads(line) for line in f]
+    assert [entry["result"]["room_code"] for entry in rejected] == ["BAD"]
+    assert "uuid" in rejected[0]["error"]
+    assert not (tmp_path / "spill").exists()
+    assert writer.stats()["rejected"] == 1 and writer.failures == 0
+
+def test_unreachable_database_spills_and_retries(tmp_path):
+    writer = FakeWriter(tmp_path, batch_size=2)
+    writer.down = psycopg2.OperationalError("server closed the connection")
+    for code in ["A", "B", "C"]:
+        writer.record(game(code))
+    writer._flush()
+    assert writer.rows == [] and writer.stats()["spill_pending"] == 3
+    assert not (tmp_path / "rejected").exists()
+
+    writer.down = None
+    writer.record(game("D"))
+    writer._flush(force=True)
+    assert writer.rows == ["A", "B", "C", "D"]
+    assert not (tmp_path / "spill").exists()
+
+def test_busy_pool_spills_instead_of_rejecting(tmp_path):
+    writer = FakeWriter(tmp_path, batch_size=2)
+    writer.down = PoolError("No database connection free after 5s")
+    for code in ["A", "B", "C"]:
+        writer.record(game(code))
+    writer._flush()
+    assert writer.rows == [] and writer.stats()["spill_pending"] == 3
+    assert writer.rejected == 0 and not (tmp_path / "rejected").exists()
+
+    writer.down = None
+    writer._flush(force=True)
+    assert writer.rows == ["A", "B", "C"]
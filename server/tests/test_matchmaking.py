@@ -0,0 +1,113 @@
+import threading
+from matchmaking import Matchmaker, SharedMatchmaker
+from room_store import LocalRedis
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def rooms():
+    created = []
+
+    def on_match(creator_id, opponent_id):
+        created.append((creator_id, opponent_id))
+        return f"ROOM{len(created)}"
+    return created, on_match
+
+def workers(count, ratings, clock, on_match):
+    # Matchmakers on separate workers sharing one Redis
+    redis = LocalRedis()
+    return [SharedMatchmaker(redis, rating=ratings.get, on_match=on_match, clock=clock,
+                             spawn=lambda fn: None) for _ in range(count)]
+
+def test_users_on_different_workers_are_paired():
+    clock = Clock()
+    created, on_match = rooms()
+    first, second = workers(2, {"a": 1200, "b": 1220}, clock, on_match)
+
+    assert first.join("a")["queued"]
+    assert second.join("b") == {"room_code": "ROOM1", "created_game": False}
+    assert first.status("a") == {"room_code": "ROOM1", "created_game": True}
+    assert created == [("a", "b")]
+    assert first.stats()["queued"] == 0
+
+def test_windows_widen_across_workers():
+    clock = Clock()
+    created, on_match = rooms()
+    first, second = workers(2, {"a": 1200, "b": 1400}, clock, on_match)
+
+    first.join("a")
+    second.join("b")
+    assert created == []
+    clock.now += 10  # both windows reach 300 points
+    assert first.sweep() == 1
+    assert second.status("b")["room_code"] == first.status("a")["room_code"] == "ROOM1"
+
+def test_cancel_from_another_worker():
+    clock = Clock()
+    _, on_match = rooms()
+    first, second = workers(2, {"a": 1200}, clock, on_match)
+    first.join("a")
+    assert second.cancel("a")
+    assert first.status("a") is None
+
+def test_concurrent_workers_never_pair_a_user_twice():
+    clock = Clock()
+    created, on_match = rooms()
+    lock = threading.Lock()
+
+    def locked_on_match(creator_id, opponent_id):
+        with lock:
+            return on_match(creator_id, opponent_id)
+    users = [f"u{i}" for i in range(200)]
+    matchmakers = workers(4, {user: 1200 for user in users}, clock, locked_on_match)
+    threads = [threading.Thread(target=lambda i=i: [matchmakers[i % 4].join(user) for user in users[i::8]])
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    while matchmakers[0].sweep():
+        pass
+
+    paired = [user for pair in created for user in pair]
+    assert len(paired) == len(set(paired)) == len(users)
+
+def test_single_process_matchmaker_unchanged():
+    clock = Clock()
+    created, on_match = rooms()
+    matchmaker = Matchmaker(rating={"a": 1200, "b": 1210}.get, on_match=on_match, clock=clock,
+                            spawn=lambda fn: None)
+    matchmaker.join("a")
+    assert matchmaker.join("b")["room_code"] == "ROOM1"
+
+def test_pair_polls_as_queued_while_room_is_created():
+    clock = Clock()
+    created, on_match = rooms()
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_on_match(creator_id, opponent_id):
+        entered.set()
+        release.wait(5)
+        return on_match(creator_id, opponent_id)
+    ratings = {"a": 1200, "b": 1210}
+    local = Matchmaker(rating=ratings.get, on_match=slow_on_match, clock=clock, spawn=lambda fn: None)
+    first, second = workers(2, ratings, clock, slow_on_match)
+
+    for waiting, joining in ((local, local), (first, second)):
+        entered.clear()
+        release.clear()
+        waiting.join("a")
+        joined = []
+        thread = threading.Thread(target=lambda: joined.append(joining.join("b")))
+        thread.start()
+        assert entered.wait(5)
+        assert waiting.status("a")["queued"]
+        assert joining.status("b")["queued"]
+        release.set()
+        thread.join()
+        assert waiting.status("a")["created_game"]
+        assert joined == [{"room_code": f"ROOM{len(created)}", "created_game": False}]
@@ -0,0 +1,36 @@
+from room_store import LocalRedis, SharedRoomStore
+
+PROBLEMS = [f"q{i}" for i in range(4)]
+
+def pick(questions_asked, decks):
+    # Deals the deck in order, remembering the position like catalog.draw
+    position = decks.get("easy", 0)
+    decks["easy"] = position + 1
+    return {"problem_id": PROBLEMS[position], "title": "", "difficulty": "easy"}
+
+def test_players_drawing_on_different_workers_get_different_questions():
+    redis = LocalRedis()
+    first, second = SharedRoomStore(redis), SharedRoomStore(redis)
+    room_code = first.create("a")
+    first.add_player(room_code, "b")
+    drawn = []
+
+    def racing_pick(questions_asked, decks):
+        # b draws on the other worker while a's draw is in progress
+        if not drawn:
+            drawn.append(second.assign_question(room_code, "b", pick)["problem_id"])
+        return pick(questions_asked, decks)
+    drawn.append(first.assign_question(room_code, "a", racing_pick)["problem_id"])
+
+    room = first.get(room_code)
+    assert drawn == ["q0", "q1"]
+    assert room.questions_asked == ["q0", "q1"]
+    assert room.question_decks == {"easy": 2}
+    assert room.players["a"].active_question["problem_id"] == "q1"
+
+def test_player_with_active_question_draws_nothing():
+    store = SharedRoomStore(LocalRedis())
+    room_code = store.create("a")
+    assert store.assign_question(room_code, "a", pick)["problem_id"] == "q0"
+    assert store.assign_question(room_code, "a", pick) is None
+    assert store.get(room_code).questions_asked == ["q0"]
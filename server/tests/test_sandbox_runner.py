@@ -0,0 +1,61 @@
+import json, os, signal, subprocess, sys, time
+import pytest
+
+RUNNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sandbox_runner.py")
+
+# Records its pid, then spins until killed
+SOLUTION = "import os\ndef f(path):\n    open(path, 'w').write(str(os.getpid()))\n    while True:\n        pass\n"
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+@pytest.fixture
+def forkserver(tmp_path):
+    workdir, directory = tmp_path / "app", tmp_path / "forkserver"
+    workdir.mkdir()
+    (workdir / "solution.py").write_text(SOLUTION)
+    (workdir / "batch.json").write_text(json.dumps({
+        "timeout": 30, "budget": 60, "cases": [{"entry": "f", "args": [str(tmp_path / "case.pid")]}]
+    }))
+    server = subprocess.Popen([sys.executable, RUNNER, "--serve", str(directory), "--workdir", str(workdir),
+                               "--errors", str(tmp_path / "runner.err"), "--timeout", "3"])
+    assert wait_until(lambda: (directory / "out").exists())
+    yield tmp_path
+    server.kill()
+    server.wait()
+    if (tmp_path / "case.pid").exists() and alive(int((tmp_path / "case.pid").read_text())):
+        os.kill(int((tmp_path / "case.pid").read_text()), signal.SIGKILL)
+
+def start_client(tmp_path):
+    directory = tmp_path / "forkserver"
+    # Its own process group, which `timeout` kills as a whole in the sandbox
+    client = subprocess.Popen(["sh", "-c", f"echo run > {directory}/in && cat {directory}/out"],
+                              start_new_session=True)
+    assert wait_until(lambda: (tmp_path / "case.pid").exists() and (tmp_path / "case.pid").read_text())
+    return client, int((tmp_path / "case.pid").read_text())
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+def test_batch_killed_when_client_goes_away(forkserver):
+    client, case = start_client(forkserver)
+    os.killpg(client.pid, signal.SIGKILL)
+    client.wait()
+    assert wait_until(lambda: not alive(case), timeout=1)
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+def test_batch_killed_at_timeout(forkserver):
+    client, case = start_client(forkserver)
+    # The server's timeout ends the batch, and with it the client's read
+    assert client.wait(timeout=5) == 0
+    assert not alive(case)
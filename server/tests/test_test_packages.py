@@ -0,0 +1,44 @@
+import pytest
+from local_sandbox import LocalSandbox
+from test_packages import compile_tests, entry_signature
+
+TEMPLATE = "def count_prefixed(words, prefix):\n    pass\n"
+
+# As Postgres hands the input back: JSONB orders keys by length
+CASES = [{"input": {"prefix": "ab", "words": ["abc", "b", "ab"]}, "expected_output": "2"}]
+
+@pytest.fixture(scope="module")
+def sandbox():
+    backend = LocalSandbox()
+    backend.start()
+    yield backend
+    backend.shutdown()
+
+def judge(sandbox, code, tests, entry):
+    records = sandbox.run_batch(code, tests.calls(entry), timeout=2)
+    return [tests.compare(record.get("result"), record["output"], case)
+            for record, case in zip(records, tests.cases)]
+
+def test_inputs_follow_template_parameters():
+    tests = compile_tests(CASES, parameters=entry_signature(TEMPLATE)[1])
+    assert tests.cases[0].args == [["abc", "b", "ab"], "ab"]
+    assert tests.cases[0].kwargs == {}
+
+def test_inputs_without_template_bind_by_keyword():
+    tests = compile_tests(CASES)
+    assert tests.cases[0].args == []
+    assert tests.cases[0].kwargs == {"prefix": "ab", "words": ["abc", "b", "ab"]}
+
+def test_parameters_change_version():
+    assert compile_tests(CASES).version != compile_tests(CASES, parameters=["words", "prefix"]).version
+
+def test_reordered_input_judged_by_name(sandbox):
+    tests = compile_tests(CASES, parameters=entry_signature(TEMPLATE)[1])
+    # Renamed parameters still line up with the template's
+    code = "def count_prefixed(items, start):\n    return sum(w.startswith(start) for w in items)\n"
+    assert judge(sandbox, code, tests, "count_prefixed") == [True]
+
+def test_reordered_input_without_template(sandbox):
+    tests = compile_tests(CASES)
+    code = "def count_prefixed(words, prefix):\n    return sum(w.startswith(prefix) for w in words)\n"
+    assert judge(sandbox, code, tests, "count_prefixed") == [True]
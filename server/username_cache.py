@@ -0,0 +1,81 @@
+import threading, time
+from collections import OrderedDict
+
+class UsernameCache:
+    """
+    Bounded LRU cache of user_id -> username with a TTL
+
+    Lookups for several users hit the database at most once: every id not
+    in the cache (or expired) is fetched in one batch and cached. Unknown
+    ids are not cached, so a user who signs up later is found.
+
+    Parameters: fetch - callable(list of user_ids) returning a dict of
+                user_id -> username, max_entries - size bound, ttl - seconds
+                an entry is trusted
+    """
+
+    def __init__(self, fetch, max_entries=50000, ttl=3600):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (username, expires_at)
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def put(self, user_id, username):
+        """
+        Cache a username seen elsewhere, e.g. at signup or login
+        """
+        with self._lock:
+            self._store(str(user_id), username, time.monotonic())
+
+    def get_many(self, user_ids):
+        """
+        Returns: dict of user_id -> username for the ids that exist
+        """
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for user_id in dict.fromkeys(str(user_id) for user_id in user_ids if user_id):
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(user_id)
+                    found[user_id] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(user_id)
+                    self.misses += 1
+
+        if missing:
+            fetched = self.fetch(missing)
+            with self._lock:
+                self.fetches += 1
+                for user_id, username in fetched.items():
+                    self._store(str(user_id), username, now)
+            found.update(fetched)
+        return found
+
+    def stats(self):
+        """
+        Returns: dict of cache metrics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "fetches": self.fetches
+            }
+
+    def _store(self, user_id, username, now):
+        self._entries[user_id] = (username, now + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
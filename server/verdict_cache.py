@@ -0,0 +1,157 @@
+import hashlib, io, json, os, threading, tokenize
+from collections import OrderedDict
+from logs import get_logger
+
+log = get_logger()
+
+def normalize_source(code):
+    """
+    Canonical form of a solution for cache keys
+
+    Drops comments and trailing whitespace and normalizes line endings, but
+    keeps every line in place so tracebacks in cached verdicts still point
+    at the right line numbers.
+
+    Parameters: code - solution source
+    Returns: normalized source string
+    """
+    code = code.replace("\r\n", "\n").replace("\r", "\n")
+    lines = code.split("\n")
+    # Rows ending inside a multi-line string keep their trailing whitespace
+    keep = set()
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.COMMENT:
+                row, col = token.start
+                lines[row - 1] = lines[row - 1][:col]
+            elif token.type == tokenize.STRING and token.end[0] > token.start[0]:
+                keep.update(range(token.start[0], token.end[0]))
+    except (tokenize.TokenError, SyntaxError):
+        # Unparseable code is cached as written
+        return code
+    return "\n".join(line if row in keep else line.rstrip()
+                     for row, line in enumerate(lines, 1)).rstrip("\n")
+
+class VerdictCache:
+    """
+    LRU cache of verdicts keyed by (problem_id, test version, source hash)
+
+    Parameters: max_entries - size bound, path - optional JSON file the cache
+                is loaded from and saved to across restarts
+    """
+
+    def __init__(self, max_entries=10000, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()  # key -> verdict
+        self._by_problem = {}  # problem_id -> set of keys
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(problem_id, version, code, calls):
+        """
+        Build the cache key for a submission
+
+        The generated test calls are hashed with the source, because they
+        are derived from the raw code and could differ for sources that
+        normalize the same.
+
+        Parameters: problem_id, version - test case version, code, calls -
+                    test call sources or {"entry", "args"} dicts
+        Returns: key tuple
+        """
+        digest = hashlib.sha256(normalize_source(code).encode())
+        for call in calls:
+            if not isinstance(call, str):
+                call = json.dumps(call, sort_keys=True)
+            digest.update(b"\0" + call.encode())
+        return (str(problem_id), version, digest.hexdigest())
+
+    def get(self, key):
+        """
+        Returns: cached verdict or None
+        """
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key, verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            self._by_problem.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+
+    def invalidate_problem(self, problem_id):
+        """
+        Drop every verdict for a problem, e.g. after its test cases changed
+        """
+        with self._lock:
+            for key in self._by_problem.pop(str(problem_id), set()):
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Returns: dict of cache metrics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def load(self):
+        """
+        Load persisted verdicts, if a path is configured and the file exists
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("verdict_cache_load_failed", error=str(e))
+            return
+        for key, verdict in entries:
+            self.put(tuple(key), verdict)
+
+    def save(self):
+        """
+        Persist verdicts, oldest first, so LRU order survives a restart
+        """
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[list(key), verdict] for key, verdict in self._entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.error("verdict_cache_save_failed", error=str(e))
+
+    def _forget(self, key):
+        keys = self._by_problem.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_problem[key[0]]